@@ -1,6 +1,10 @@
 # Public packages
-import os, sys, time
+import os, sys, time, json, traceback, ast, inspect, textwrap, pickle, hashlib
 import multiprocessing as mp
+from dataclasses import fields
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 # Model packages
 from root_cynaps.root_cynaps import Model
 # Utility packages
@@ -9,8 +13,12 @@ from analyze.analyze import analyze_data
 from initialize.initialize import MakeScenarios as ms
 
 
-def single_run(scenario, outputs_dirpath="outputs", simulation_length=2500, echo=True, log_settings={}):
-    root_cynaps = Model(time_step=3600, **scenario)
+def single_run(scenario, outputs_dirpath="outputs", simulation_length=2500, echo=True, log_settings={}, model=None):
+    if model is None:
+        root_cynaps = Model(time_step=3600, **scenario)
+    else:
+        # The model has already been initialized, e.g. forked from a template:
+        root_cynaps = model
 
     logger = Logger(model_instance=root_cynaps, outputs_dirpath=outputs_dirpath, 
                     time_step_in_hours=1, logging_period_in_hours=24,
@@ -31,25 +39,391 @@ def single_run(scenario, outputs_dirpath="outputs", simulation_length=2500, echo
         #analyze_data(scenarios=[os.path.basename(outputs_dirpath)], outputs_dirpath=outputs_dirpath, target_properties=None, **log_settings)
 
 
-def simulate_scenarios(scenarios, simulation_length=2500, echo=True, log_settings={}):
-    processes = []
-    max_processes = mp.cpu_count()
+def read_status(outputs_dirpath):
+    """
+    This function reads the status file of a scenario, or returns None if the scenario has never been launched.
+    """
+    status_path = os.path.join(outputs_dirpath, "status.json")
+    if not os.path.exists(status_path):
+        return None
+    try:
+        with open(status_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # A status file truncated by a crash is considered as missing:
+        return None
+
+
+def write_status(outputs_dirpath, **status):
+    """
+    This function writes the status file of a scenario, replacing it atomically so that it is never left truncated.
+    """
+    os.makedirs(outputs_dirpath, exist_ok=True)
+    status_path = os.path.join(outputs_dirpath, "status.json")
+    with open(status_path + ".tmp", "w") as f:
+        json.dump(status, f, indent=2)
+    os.replace(status_path + ".tmp", status_path)
+
+
+def run_scenario(scenario_name, scenario, outputs_dirpath, simulation_length, echo, log_settings, model=None):
+    """
+    This function runs one scenario in a worker process and records its status before and after the simulation.
+    :return: the final status of the scenario
+    """
+    start = time.time()
+    write_status(outputs_dirpath, scenario=str(scenario_name), status="running", pid=os.getpid(), start=start)
+    try:
+        single_run(scenario=scenario, outputs_dirpath=outputs_dirpath, simulation_length=simulation_length,
+                   echo=echo, log_settings=log_settings, model=model)
+        status = dict(status="completed")
+    except Exception:
+        status = dict(status="failed", error=traceback.format_exc())
+    status.update(scenario=str(scenario_name), pid=os.getpid(), start=start, end=time.time(),
+                  duration=time.time() - start)
+    write_status(outputs_dirpath, **status)
+    return status
+
+
+# ENSEMBLES FORKED FROM MODEL TEMPLATES:
+# --------------------------------------
+# Initialized models shared with worker processes through fork, by template key:
+templates = {}
+
+
+def initialization_parameters(module_classes):
+    """
+    This function returns the names of the attributes read by the initialization of a set of modules, i.e. by their
+    methods __init__ and post_coupling_init and by all the methods they call on self, found by parsing their source code.
+    Changing such a parameter after the initialization would not give the same model.
+    """
+    names = set()
+    for module_class in module_classes:
+        methods = {}
+        for cls in module_class.__mro__:
+            for name, function in vars(cls).items():
+                if inspect.isfunction(function) and name not in methods:
+                    try:
+                        methods[name] = ast.parse(textwrap.dedent(inspect.getsource(function)))
+                    except (OSError, TypeError, SyntaxError):
+                        continue
+        to_visit = ["__init__", "post_coupling_init"]
+        visited = set()
+        while to_visit:
+            method = to_visit.pop()
+            if method in visited or method not in methods:
+                continue
+            visited.add(method)
+            for node in ast.walk(methods[method]):
+                if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "self":
+                    if node.attr in methods:
+                        to_visit.append(node.attr)
+                    else:
+                        names.add(node.attr)
+    return names
+
+
+def overridable_parameters(model):
+    """
+    This function returns the names of the parameters of a composite model that are not read by its initialization
+    according to the source code of the modules (see verified_overridable_parameters for their actual check).
+    """
+    parameters = {f.name for module in model.models for f in fields(module)
+                  if f.metadata.get("variable_type") in ("parameter", "simulation_parameter")}
+    return parameters - initialization_parameters(type(module) for module in model.models)
+
+
+def initialized_state(model):
+    """
+    This function returns a picklable snapshot of the attributes of every module of a composite model and of the
+    properties of its MTG, which can be compared between two initialized models.
+    """
+    state = {}
+    for index, module in enumerate(model.models):
+        for name, value in vars(module).items():
+            try:
+                state[(index, name)] = pickle.dumps(value)
+            except Exception:
+                # Objects that cannot be pickled (e.g. the scheduler of the module) are not compared:
+                continue
+    state["mtg"] = pickle.dumps({name: dict(values) for name, values in model.g.properties().items()})
+    return state
+
+
+def verified_overridable_parameters(default_model, candidates, scenarios):
+    """
+    This function checks that the parameters found by overridable_parameters can actually be changed after the
+    initialization. For each such parameter changed by the scenarios, a single model is initialized with a probe value
+    (the first value of the scenarios differing from the default one), and is compared with the default model to which
+    the probe value is applied afterwards. Parameters read indirectly during the initialization (e.g. through getattr or
+    by functions defined outside the modules) are detected this way, and are then applied by a full initialization of
+    the template. The check thus costs one initialization per parameter, whatever the number of scenarios.
+    :param default_model: a model initialized with default values
+    :param candidates: the names of the parameters that are not read by the initialization according to the source code
+    :param scenarios: the list of scenarios to run
+    :return: the set of parameters that can be changed after the initialization
+    """
+    defaults = {}
+    for module in default_model.models:
+        for f in fields(module):
+            if f.name in candidates:
+                defaults.setdefault(f.name, getattr(module, f.name))
+
+    probes = {}
+    for scenario in scenarios:
+        for name, value in scenario.items():
+            if name in defaults and name not in probes and pickle.dumps(value) != pickle.dumps(defaults[name]):
+                probes[name] = value
+
+    # Parameters that are never changed by the scenarios are left to their default value:
+    verified = {name for name in defaults if name not in probes}
+    for name, value in probes.items():
+        modules = [module for module in default_model.models if name in {f.name for f in fields(module)}]
+        default_values = [getattr(module, name) for module in modules]
+        try:
+            apply_parameters(default_model, {name: value})
+            if initialized_state(Model(time_step=3600, **{name: value})) == initialized_state(default_model):
+                verified.add(name)
+            else:
+                print(f"[INFO] {name} is used by the initialization, it will not be changed after it")
+        finally:
+            for module, default_value in zip(modules, default_values):
+                setattr(module, name, default_value)
+    return verified
+
+
+def apply_parameters(model, parameters):
+    """
+    This function changes the value of parameters in every module of an initialized composite model that declares them.
+    """
+    for module in model.models:
+        declared = {f.name for f in fields(module)}
+        for name, value in parameters.items():
+            if name in declared:
+                setattr(module, name, value)
+
+
+def template_key(template_part):
+    """
+    This function returns a key identifying the part of a scenario used to build a template.
+    """
+    return hashlib.sha1(pickle.dumps(sorted(template_part.items(), key=lambda item: item[0]))).hexdigest()
+
+
+def run_scenario_from_template(scenario_name, key, overrides, outputs_dirpath, simulation_length, echo, log_settings):
+    """
+    This function forks the worker process, so that the child runs a scenario on a copy-on-write copy of an initialized
+    template, after having applied the parameters specific to the scenario.
+    :return: the final status of the scenario
+    """
+    sys.stdout.flush()
+    fork_time = time.time()
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            model = templates[key]
+            apply_parameters(model, overrides)
+            run_scenario(scenario_name, overrides, outputs_dirpath, simulation_length, echo, log_settings, model=model)
+            exit_code = 0
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # We leave without running the cleanup of the worker process we have been forked from:
+            os._exit(exit_code)
+
+    _, wait_status = os.waitpid(pid, 0)
+    status = read_status(outputs_dirpath)
+    # A status file that has not been written by the forked process comes from an earlier run:
+    if status is None or status.get("status") == "running" or status.get("start", 0.) < fork_time:
+        # The forked process died before being able to record the end of the scenario:
+        status = dict(scenario=str(scenario_name), status="failed",
+                      error=f"The forked process ended abruptly (wait status {wait_status}).")
+        write_status(outputs_dirpath, **status)
+    return status
+
+
+def prepare_templates(to_run):
+    """
+    This function builds one initialized model per distinct initial configuration among the scenarios to run, i.e. per
+    distinct set of values of the scenario entries that are not parameters that can be changed after initialization.
+    :param to_run: the list of (scenario_name, scenario, scenario_dirpath)
+    :return: the list of (scenario_name, template_key, overrides, scenario_dirpath)
+    """
+    templates.clear()
+    default_model = Model(time_step=3600)
+    overridable = verified_overridable_parameters(default_model, overridable_parameters(default_model),
+                                                  [scenario for _, scenario, _ in to_run])
+
+    prepared = []
+    for scenario_name, scenario, scenario_dirpath in to_run:
+        template_part = {name: value for name, value in scenario.items() if name not in overridable}
+        overrides = {name: value for name, value in scenario.items() if name in overridable}
+        key = template_key(template_part)
+        if key not in templates:
+            print(f"[INFO] Building a model template for {len(template_part)} initialization entries...")
+            templates[key] = default_model if not template_part else Model(time_step=3600, **template_part)
+        prepared.append((scenario_name, key, overrides, scenario_dirpath))
+    return prepared
+
+
+def format_duration(seconds):
+    """
+    This function formats a duration in seconds as a short human-readable string.
+    """
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return f"{days}d{hours:02d}h"
+    if hours:
+        return f"{hours}h{minutes:02d}min"
+    return f"{minutes}min{seconds:02d}s"
+
+
+def simulate_scenarios(scenarios, simulation_length=2500, echo=True, log_settings={}, outputs_dirpath="outputs",
+                       max_workers=None, resume=True, progress_period=60, fork_templates=False):
+    """
+    This function runs a set of scenarios on a fixed pool of worker processes.
+    Each scenario writes a status file in its output folder (running, completed or failed, with the error if any), and a
+    manifest of all scenarios is updated in outputs_dirpath as scenarios end. When resume is True, scenarios that have
+    already been completed by a previous launch are skipped. Throughput and estimated remaining time are printed every
+    time a scenario ends, and at least every progress_period seconds.
+    :param scenarios: dictionary of {scenario_name: scenario}
+    :param simulation_length: number of time steps of each simulation
+    :param echo: if True, each simulation prints its progress
+    :param log_settings: the settings of the Logger
+    :param outputs_dirpath: the folder in which the folder of each scenario is created
+    :param max_workers: the number of worker processes (by default, the number of CPUs)
+    :param resume: if True, completed scenarios are not launched again
+    :param progress_period: the maximal time (s) between two progress reports
+    :param fork_templates: if True, the models are initialized once per distinct initial configuration in this process,
+    and each scenario only applies its own parameters on a forked copy of its template (POSIX systems only)
+    :return: the dictionary of {scenario_name: status}
+    """
+    if max_workers is None:
+        max_workers = mp.cpu_count()
+
+    manifest = {}
+    to_run = []
     for scenario_name, scenario in scenarios.items():
-        
-        while len(processes) == max_processes:
-            for proc in processes:
-                if not proc.is_alive():
-                    processes.remove(proc)
-            time.sleep(1)
-
-        print(f"[INFO] Launching scenario {scenario_name}...")
-        p = mp.Process(target=single_run, kwargs=dict(scenario=scenario, 
-                                                      outputs_dirpath=os.path.join("outputs", str(scenario_name)),
-                                                      simulation_length=simulation_length,
-                                                      echo=echo,
-                                                      log_settings=log_settings))
-        p.start()
-        processes.append(p)
+        scenario_dirpath = os.path.join(outputs_dirpath, str(scenario_name))
+        status = read_status(scenario_dirpath)
+        if resume and status is not None and status.get("status") == "completed":
+            manifest[str(scenario_name)] = status
+        else:
+            manifest[str(scenario_name)] = dict(scenario=str(scenario_name), status="pending")
+            to_run.append((scenario_name, scenario, scenario_dirpath))
+
+    n_total = len(to_run)
+    print(f"[INFO] {n_total} scenarios to simulate on {max_workers} workers "
+          f"({len(manifest) - n_total} already completed)")
+    if n_total == 0:
+        return manifest
+
+    def write_manifest():
+        os.makedirs(outputs_dirpath, exist_ok=True)
+        manifest_path = os.path.join(outputs_dirpath, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def report(n_done, n_failed):
+        elapsed = time.time() - start
+        message = f"[INFO] {n_done}/{n_total} scenarios done ({n_failed} failed) in {format_duration(elapsed)}"
+        if n_done > 0:
+            throughput = n_done / elapsed
+            message += f", {throughput * 3600:.1f} runs/h, ETA {format_duration((n_total - n_done) / throughput)}"
+        print(message, flush=True)
+
+    mp_context = None
+    run_function = run_scenario
+    if fork_templates:
+        if "fork" not in mp.get_all_start_methods():
+            print("[WARNING] Model templates require the 'fork' start method, each scenario will be initialized.")
+        else:
+            # Templates must exist before the worker processes are forked:
+            to_run = prepare_templates(to_run)
+            mp_context = mp.get_context("fork")
+            run_function = run_scenario_from_template
+
+    start = time.time()
+    n_done, n_failed = 0, 0
+    pending = deque(to_run)
+    # Scenarios that were running when a worker crashed are launched again one at a time:
+    suspects = deque()
+    retried = set()
+    running = {}
+    # Submission time of each scenario, to know from its status file whether a worker had started it:
+    submitted_at = {}
+    # Number of times each scenario has been submitted again because a crash stopped it before it started:
+    requeued = Counter()
+    max_requeues = 3
+    # The queue of submitted scenarios is bounded, so that the pool is fed progressively:
+    max_queued = 2 * max_workers
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+    try:
+        while pending or suspects or running:
+            if suspects and not running:
+                queue, max_running = suspects, 1
+            elif suspects or any(running[future][0] in retried for future in running):
+                queue, max_running = suspects, 0
+            else:
+                queue, max_running = pending, max_queued
+            while queue and len(running) < max_running:
+                scenario_name, *scenario_arguments = queue[0]
+                # The time is recorded before the submission, as a worker may start the scenario right away:
+                submitted_at[scenario_name] = time.time()
+                try:
+                    future = executor.submit(run_function, scenario_name, *scenario_arguments,
+                                             simulation_length, echo, log_settings)
+                except BrokenProcessPool:
+                    # A worker has crashed, which breaks the whole pool, so we start a new one:
+                    executor.shutdown(wait=False)
+                    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+                    continue
+                running[future] = queue.popleft()
+                manifest[str(scenario_name)]["status"] = "submitted"
+
+            finished, _ = wait(running, timeout=progress_period, return_when=FIRST_COMPLETED)
+            for future in finished:
+                scenario_name, *scenario_arguments = running.pop(future)
+                try:
+                    status = future.result()
+                except BrokenProcessPool:
+                    # A worker process died (e.g. killed because of memory), which stops all the scenarios submitted to
+                    # the pool. Their status file tells whether a worker had started them since their submission:
+                    scenario_dirpath = scenario_arguments[-1]
+                    status = read_status(scenario_dirpath)
+                    started = status is not None and status.get("start", 0.) >= submitted_at[scenario_name]
+                    if not started and requeued[scenario_name] < max_requeues:
+                        # The scenario was still queued, it is submitted again as usual:
+                        requeued[scenario_name] += 1
+                        pending.appendleft((scenario_name, *scenario_arguments))
+                        continue
+                    # A scenario that keeps being stopped before having recorded its start is considered as a suspect:
+                    if not started or status.get("status") == "running":
+                        # As we cannot know which of the running scenarios caused the crash, each of them is launched
+                        # once more, alone:
+                        if scenario_name not in retried:
+                            retried.add(scenario_name)
+                            suspects.append((scenario_name, *scenario_arguments))
+                            continue
+                        status = dict(scenario=str(scenario_name), status="failed", error=traceback.format_exc())
+                        write_status(scenario_dirpath, **status)
+                manifest[str(scenario_name)] = status
+                n_done += 1
+                if status["status"] != "completed":
+                    n_failed += 1
+                    print(f"[WARNING] Scenario {scenario_name} failed:\n{status.get('error', '')}")
+            if finished:
+                write_manifest()
+            report(n_done, n_failed)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    write_manifest()
+    return manifest
 
 
 if __name__ == '__main__':
@@ -0,0 +1,484 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.array_store
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.array_store` defines an optional struct-of-arrays backend for the properties of the root MTG.
+
+    Each property is stored in a contiguous NumPy column indexed by a dense vertex slot, while a dict-compatible view
+    keyed by vid is kept in g.properties() so that legacy code relying on g.node(vid) or self.prop[vid] still works.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+from collections.abc import MutableMapping
+from numbers import Integral, Real
+
+import numpy as np
+
+
+class ArrayPropertyStore:
+    """
+    DESCRIPTION
+    -----------
+    Columnar storage shared by all properties of a MTG. Every vertex receives a dense slot when it is first written,
+    and every property is a NumPy column of the same capacity, associated with a boolean mask recording on which slots
+    the property is actually defined. Capacity grows by amortized doubling when segmentation adds vertices.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = max(int(capacity), 1)
+        self.size = 0
+        self.slot_of = {}
+        # Dense equivalent of slot_of indexed by vid (-1 for vertices without slot), used to look up arrays of vids:
+        self.slot_index = np.full(self.capacity, -1, dtype=np.int64)
+        self.vid_of_slot = np.zeros(self.capacity, dtype=np.int64)
+        self.columns = {}
+        self.masks = {}
+
+    # SLOTS MANAGEMENT:
+    # -----------------
+    def _grow(self, min_capacity):
+        """
+        This function reallocates every column with at least min_capacity slots, doubling the capacity each time.
+        """
+        new_capacity = self.capacity
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+        if new_capacity == self.capacity:
+            return
+        self.vid_of_slot = self._resized(self.vid_of_slot, new_capacity)
+        for name in self.columns:
+            self.columns[name] = self._resized(self.columns[name], new_capacity)
+            self.masks[name] = self._resized(self.masks[name], new_capacity)
+        self.capacity = new_capacity
+
+    @staticmethod
+    def _resized(array, new_capacity):
+        new_array = np.zeros(new_capacity, dtype=array.dtype)
+        if array.dtype == object:
+            new_array[:] = None
+        new_array[:len(array)] = array
+        return new_array
+
+    def add_vertex(self, vid):
+        """
+        This function returns the slot of a vertex, allocating a new one if the vertex has never been stored.
+        :param vid: the index of the vertex in the MTG
+        :return: the dense slot of the vertex
+        """
+        slot = self.slot_of.get(vid)
+        if slot is None:
+            slot = self.size
+            if slot >= self.capacity:
+                self._grow(slot + 1)
+            self.slot_of[vid] = slot
+            self.vid_of_slot[slot] = vid
+            if vid >= len(self.slot_index):
+                self.slot_index = np.r_[self.slot_index, np.full(max(vid + 1, 2 * len(self.slot_index))
+                                                                 - len(self.slot_index), -1, dtype=np.int64)]
+            self.slot_index[vid] = slot
+            self.size += 1
+        return slot
+
+    def lookup(self, vids):
+        """
+        This function returns the dense slots of a sequence of vertices as an integer array, -1 marking the vertices
+        that have never been stored. No slot is allocated.
+        """
+        vids = _vid_array(vids)
+        slots = np.full(vids.shape, -1, dtype=np.int64)
+        known = (vids >= 0) & (vids < len(self.slot_index))
+        slots[known] = self.slot_index[vids[known]]
+        return slots
+
+    def slots(self, vids):
+        """
+        This function returns the dense slots of a sequence of vertices as an integer array.
+        """
+        slots = self.lookup(vids)
+        if (slots < 0).any():
+            raise KeyError(np.asarray(vids)[slots < 0][0].item())
+        return slots
+
+    def allocate(self, vids):
+        """
+        This function returns the dense slots of a sequence of vertices, allocating slots to the vertices that have
+        never been stored (e.g. before writing a property on them).
+        """
+        slots = self.lookup(vids)
+        missing = np.flatnonzero(slots < 0)
+        if len(missing) > 0:
+            vids = _vid_array(vids)
+            for i in missing.tolist():
+                slots[i] = self.add_vertex(int(vids[i]))
+        return slots
+
+    @property
+    def vids(self):
+        """
+        Vertex indices of all allocated slots, in slot order.
+        """
+        return self.vid_of_slot[:self.size]
+
+    # COLUMNS MANAGEMENT:
+    # -------------------
+    def add_column(self, name, dtype=np.float64):
+        """
+        This function creates an empty column if it doesn't exist yet, and returns its dict-compatible view.
+        """
+        if name not in self.columns:
+            column = np.zeros(self.capacity, dtype=dtype)
+            if column.dtype == object:
+                column[:] = None
+            self.columns[name] = column
+            self.masks[name] = np.zeros(self.capacity, dtype=bool)
+        return PropertyView(self, name)
+
+    def column(self, name):
+        """
+        This function returns the array of a property over all allocated slots (undefined slots hold 0 or None).
+        The array is a view, so that vectorized processes can read and write it in place.
+        """
+        return self.columns[name][:self.size]
+
+    def defined(self, name):
+        """
+        This function returns the boolean mask of slots on which the property is defined.
+        """
+        return self.masks[name][:self.size]
+
+    def defined_at(self, name, vids):
+        """
+        This function returns the boolean array telling whether a property is defined on each of a sequence of vertices.
+        """
+        slots = self.lookup(vids)
+        found = slots >= 0
+        mask = np.zeros(len(slots), dtype=bool)
+        if name in self.masks:
+            mask[found] = self.masks[name][slots[found]]
+        return mask
+
+    def gather(self, name, vids, default=0.):
+        """
+        This function returns the values of a property on a sequence of vertices as an array, without allocating any slot.
+        The array has the dtype of the column, unless the default value given to the vertices on which the property is
+        not defined cannot be stored in it (e.g. NaN in a column of integers).
+        :param name: the name of the property
+        :param vids: the sequence of vertices
+        :param default: the value used for the vertices on which the property is not defined
+        :return: the array of values
+        """
+        if name not in self.columns:
+            return _filled(len(vids), default)
+        slots = self.lookup(vids)
+        defined = self.defined_at(name, vids)
+        values = self.columns[name][np.where(slots >= 0, slots, 0)]
+        if defined.all():
+            return values
+        if not _fits(default, values.dtype):
+            values = values.astype(object if values.dtype == object or not isinstance(default, Real)
+                                   else np.result_type(values.dtype, np.asarray(default).dtype))
+        values[~defined] = default
+        return values
+
+    def scatter(self, name, vids, values):
+        """
+        This function writes an array of values into a property on a sequence of vertices, allocating slots to the
+        vertices that have never been stored. As when writing a single value, the column is promoted if the values cannot
+        be stored in it (e.g. float results in a column created from integer defaults).
+        :param name: the name of the property
+        :param vids: the sequence of vertices
+        :param values: the array of values, in the order of vids
+        """
+        values = np.asarray(values)
+        numeric = values.dtype.kind in "biuf"
+        self.add_column(name, dtype=values.dtype if numeric else object)
+        slots = self.allocate(vids)
+        if len(values) == 0:
+            return
+        self._promote(name, values[0].item() if numeric else values[0])
+        column = self.columns[name]
+        if numeric:
+            column[slots] = values
+        else:
+            for slot, value in zip(slots.tolist(), values.tolist()):
+                column[slot] = value
+        self.masks[name][slots] = True
+
+    def _promote(self, name, value):
+        """
+        This function changes the dtype of a column if a value that cannot be stored in it is written.
+        """
+        column = self.columns[name]
+        kind = column.dtype.kind
+        if kind == "O" or isinstance(value, (bool, np.bool_)):
+            return
+        if isinstance(value, Integral):
+            if kind != "b":
+                return
+            target = np.int64
+        elif isinstance(value, Real):
+            if kind == "f":
+                return
+            target = np.float64
+        else:
+            target = object
+        new_column = column.astype(target)
+        if target is object:
+            new_column[~self.masks[name]] = None
+        self.columns[name] = new_column
+
+    # CONVERSION FROM AND TO PLAIN MTG PROPERTIES:
+    # --------------------------------------------
+    def from_dict(self, name, values):
+        """
+        This function stores a {vid: value} dictionary as a column and returns the corresponding view.
+        """
+        dtype = _infer_dtype(values.values())
+        view = self.add_column(name, dtype=dtype)
+        if self.columns[name].dtype != dtype:
+            # The column already existed, we make sure it can hold the new values:
+            self.columns[name] = self.columns[name].astype(dtype)
+        # As when a dictionary is replaced, the values previously stored in the column are forgotten:
+        self.masks[name][:] = False
+        self.columns[name][:] = None if dtype == object else 0
+        for vid in values:
+            self.add_vertex(vid)
+        if values:
+            slots = self.slots(values.keys())
+            column = self.columns[name]
+            if dtype == object:
+                for slot, value in zip(slots, values.values()):
+                    column[slot] = value
+            else:
+                column[slots] = np.fromiter(values.values(), dtype=dtype, count=len(values))
+            self.masks[name][slots] = True
+        return view
+
+    @classmethod
+    def attach(cls, g, capacity=None):
+        """
+        This function converts all properties of a MTG into columns of a new store and replaces g.properties() by a
+        mapping that converts any property created later on. If the MTG already has a store, it is returned as is.
+        :param g: the root MTG
+        :param capacity: the initial number of slots (by default, twice the current number of vertices)
+        :return: the store
+        """
+        properties = g.properties()
+        if isinstance(properties, ColumnarProperties):
+            return properties.store
+        if capacity is None:
+            capacity = 2 * max(len(g), 1)
+        store = cls(capacity=capacity)
+        columnar_properties = ColumnarProperties(store)
+        for name, values in properties.items():
+            columnar_properties[name] = values
+        # The MTG keeps its properties in this attribute, which is returned by g.properties():
+        g._properties = columnar_properties
+        return store
+
+    @staticmethod
+    def detach(g):
+        """
+        This function restores plain dictionaries as properties of a MTG, e.g. before saving it with legacy tools.
+        """
+        properties = g.properties()
+        if isinstance(properties, ColumnarProperties):
+            g._properties = {name: dict(values) for name, values in properties.items()}
+        return g
+
+
+class PropertyView(MutableMapping):
+    """
+    DESCRIPTION
+    -----------
+    Dict-compatible {vid: value} view of a column of an ArrayPropertyStore.
+    """
+
+    __slots__ = ("store", "name")
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self, vid):
+        store = self.store
+        slot = store.slot_of.get(vid)
+        if slot is None or not store.masks[self.name][slot]:
+            raise KeyError(vid)
+        value = store.columns[self.name][slot]
+        # We return Python scalars so that legacy code behaves as with plain dictionaries:
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __setitem__(self, vid, value):
+        store = self.store
+        slot = store.add_vertex(vid)
+        store._promote(self.name, value)
+        store.columns[self.name][slot] = value
+        store.masks[self.name][slot] = True
+
+    def __delitem__(self, vid):
+        store = self.store
+        slot = store.slot_of.get(vid)
+        if slot is None or not store.masks[self.name][slot]:
+            raise KeyError(vid)
+        store.masks[self.name][slot] = False
+
+    def __contains__(self, vid):
+        slot = self.store.slot_of.get(vid)
+        return slot is not None and bool(self.store.masks[self.name][slot])
+
+    def __iter__(self):
+        store = self.store
+        return iter(store.vids[store.defined(self.name)].tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.store.defined(self.name)))
+
+    def clear(self):
+        # We avoid the generic MutableMapping.clear, which removes items one by one:
+        self.store.masks[self.name][:] = False
+
+    def update(self, other=(), **kwargs):
+        # We avoid the generic MutableMapping.update to keep the cost of large initializations low:
+        items = other.items() if hasattr(other, "items") else other
+        for vid, value in items:
+            self[vid] = value
+        for vid, value in kwargs.items():
+            self[vid] = value
+
+    def __repr__(self):
+        return "PropertyView(%r, %r)" % (self.name, dict(self))
+
+    def __reduce__(self):
+        # Views are pickled as plain dictionaries to keep MTG files readable without this module:
+        return dict, (dict(self),)
+
+
+class ColumnarProperties(dict):
+    """
+    DESCRIPTION
+    -----------
+    Replacement of the MTG {name: {vid: value}} property dictionary, in which every assigned dictionary is converted
+    into a column of the store, so that properties created by modules after the conversion are also columnar.
+    """
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def __setitem__(self, name, values):
+        if not isinstance(values, PropertyView) or values.store is not self.store:
+            values = self.store.from_dict(name, dict(values))
+        super().__setitem__(name, values)
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = {} if default is None else default
+        return self[name]
+
+    def update(self, other=(), **kwargs):
+        items = other.items() if hasattr(other, "items") else other
+        for name, values in items:
+            self[name] = values
+        for name, values in kwargs.items():
+            self[name] = values
+
+    def __reduce__(self):
+        return dict, ({name: dict(values) for name, values in self.items()},)
+
+
+def gather(prop, vids, default=0.):
+    """
+    This function returns the values of a {vid: value} property on a sequence of vertices as an array. Columns of a
+    store (see PropertyView) are read directly, without allocating any slot.
+    :param prop: the property, either a dictionary or a columnar view
+    :param vids: the sequence of vertices
+    :param default: the value used for the vertices on which the property is not defined
+    :return: the array of values
+    """
+    if isinstance(prop, PropertyView):
+        return prop.store.gather(prop.name, vids, default)
+    values = np.empty(len(vids), dtype=object)
+    values[:] = [prop.get(vid, default) for vid in vids]
+    dtype = _infer_dtype(values)
+    return values if dtype == object else values.astype(dtype)
+
+
+def scatter(prop, vids, values):
+    """
+    This function writes an array of values into a {vid: value} property on a sequence of vertices. Columns of a store
+    (see PropertyView) are written directly.
+    :param prop: the property, either a dictionary or a columnar view
+    :param vids: the sequence of vertices
+    :param values: the array of values, in the order of vids
+    """
+    if isinstance(prop, PropertyView):
+        prop.store.scatter(prop.name, vids, values)
+    else:
+        prop.update(zip(vids, np.asarray(values).tolist()))
+
+
+def defined(prop, vids):
+    """
+    This function returns the boolean array telling whether a {vid: value} property is defined on each of a sequence of
+    vertices.
+    """
+    if isinstance(prop, PropertyView):
+        return prop.store.defined_at(prop.name, vids)
+    return np.fromiter((vid in prop for vid in vids), dtype=bool, count=len(vids))
+
+
+def _vid_array(vids):
+    """
+    This function converts a sequence of vertices (e.g. a list or the keys of a dictionary) into an integer array.
+    """
+    if not isinstance(vids, (np.ndarray, list, tuple)):
+        vids = list(vids)
+    return np.asarray(vids, dtype=np.int64)
+
+
+def _filled(size, value):
+    """
+    This function returns an array of a given size filled with a value.
+    """
+    values = np.empty(size, dtype=_infer_dtype([value]))
+    values[:] = value
+    return values
+
+
+def _fits(value, dtype):
+    """
+    This function tells whether a value can be stored without loss in an array of a given dtype.
+    """
+    if dtype == object:
+        return True
+    try:
+        with np.errstate(invalid="ignore"):
+            return bool(np.array(value).astype(dtype) == value)
+    except (TypeError, ValueError):
+        return False
+
+
+def _infer_dtype(values):
+    """
+    This function returns the narrowest NumPy dtype able to store all the values of a property.
+    """
+    kinds = set()
+    for value in values:
+        if isinstance(value, (bool, np.bool_)):
+            kinds.add("b")
+        elif isinstance(value, Integral):
+            kinds.add("i")
+        elif isinstance(value, Real):
+            kinds.add("f")
+        else:
+            return object
+    if not kinds or "f" in kinds:
+        return np.float64
+    if kinds == {"b"}:
+        return np.bool_
+    return np.int64
@@ -0,0 +1,230 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.checkpoint
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.checkpoint` saves and restores the state of a coupled model in a columnar binary file.
+
+    A checkpoint is a NumPy .npz archive containing the topology of the root MTG (vertices listed from the base to the
+    tips, with their parent), one array per MTG property with the mask of vertices on which it is defined,
+    the arrays of the soil voxels and the state of the random generators. Numbers and strings are stored as typed
+    arrays; only properties holding other Python objects are pickled.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import pickle
+
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.array_store import PropertyView, defined, _infer_dtype
+from rhizodep.root_coordinates import RootCoordinates
+
+CHECKPOINT_VERSION = 1
+
+
+def _pickled(value):
+    return np.frombuffer(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+
+def _unpickled(array):
+    return pickle.loads(array.tobytes())
+
+
+def _encode_property(prop, vids):
+    """
+    This function converts a {vid: value} property into a mask of defined vertices and a typed array of values.
+    :return: (mask, values, kind), kind being "array", "str" or "pickle"
+    """
+    mask = defined(prop, vids)
+    if isinstance(prop, PropertyView):
+        values = prop.store.gather(prop.name, vids)[mask]
+        if values.dtype != object:
+            return mask, values, "array"
+        values = values.tolist()
+    else:
+        values = [prop[vid] for vid, is_defined in zip(vids, mask.tolist()) if is_defined]
+
+    return (mask,) + _encode_values(values)
+
+
+def _encode_values(values):
+    """
+    This function converts a list of property values into a typed array, pickling them only if they are neither numbers
+    nor strings.
+    :return: (values, kind), kind being "array", "str" or "pickle"
+    """
+    dtype = _infer_dtype(values)
+    if dtype != object:
+        return np.array(values, dtype=dtype), "array"
+    if all(isinstance(value, str) for value in values):
+        return np.array(values, dtype=str), "str"
+    return _pickled(values), "pickle"
+
+
+def _decode_values(values, kind):
+    """
+    This function converts values encoded by _encode_values back into a list (or a numeric array).
+    """
+    if kind == "pickle":
+        return _unpickled(values)
+    if kind == "str":
+        return values.tolist()
+    return values
+
+
+def _restore_property(prop, vids, values, slots=None):
+    """
+    This function replaces the content of a property in place, so that modules linked to it keep working.
+    :param prop: the {vid: value} property
+    :param vids: the array of vertices on which the property is defined
+    :param values: the values of the property on these vertices
+    :param slots: the slots of these vertices if the property is a column of a store
+    """
+    prop.clear()
+    if len(vids) == 0:
+        return
+    numeric = isinstance(values, np.ndarray) and values.dtype.kind in "biuf"
+    if not numeric:
+        values = values.tolist() if isinstance(values, np.ndarray) else values
+    if isinstance(prop, PropertyView) and slots is not None:
+        store = prop.store
+        store._promote(prop.name, values[0].item() if numeric else values[0])
+        column = store.columns[prop.name]
+        if numeric:
+            column[slots] = values
+        else:
+            for slot, value in zip(slots.tolist(), values):
+                column[slot] = value
+        store.masks[prop.name][slots] = True
+    else:
+        prop.update(zip(vids.tolist(), values.tolist() if numeric else values))
+
+
+def base_to_tips(g):
+    """
+    This function lists the vertices of a root MTG from the base to the tips, children being kept in the order of the
+    MTG, so that a MTG rebuilt by adding them in this order is traversed in the same order as the original one.
+    :param g: the root MTG
+    :return: the array of vertices and the array of their parents (-1 for the base)
+    """
+    base = next(g.component_roots_at_scale_iter(g.root, scale=1))
+    vids = []
+    parents = []
+    stack = [(base, -1)]
+    while stack:
+        vid, parent = stack.pop()
+        vids.append(vid)
+        parents.append(parent)
+        stack.extend((child, vid) for child in reversed(g.children(vid)))
+    return np.array(vids, dtype=np.int64), np.array(parents, dtype=np.int64)
+
+
+def save_checkpoint(model, path, compress=False):
+    """
+    This function writes the state of a coupled model into a checkpoint file.
+    :param model: the rhizodep Model
+    :param path: the path of the .npz file
+    :param compress: if True, arrays are compressed (smaller but slower to write and read)
+    """
+    g = model.g
+    scale_1_vids, parents = base_to_tips(g)
+    arrays = {"version": np.array(CHECKPOINT_VERSION),
+              "mtg/vids": scale_1_vids,
+              "mtg/parents": parents}
+
+    # Properties are also saved on the root vertex of the MTG:
+    vids = np.r_[g.root, scale_1_vids].astype(np.int64)
+    vid_list = vids.tolist()
+    props = g.properties()
+    arrays["props/vids"] = vids
+    kinds = {}
+    for name, prop in props.items():
+        mask, values, kinds[name] = _encode_property(prop, vid_list)
+        arrays[f"props/{name}/mask"] = mask
+        arrays[f"props/{name}/values"] = values
+    arrays["props/kinds"] = _pickled(kinds)
+
+    # Soil voxels:
+    for name, values in getattr(model.soil, "voxels", {}).items():
+        arrays[f"voxels/{name}"] = np.asarray(values)
+
+    # Random generators:
+    arrays["rng/numpy"] = _pickled(np.random.get_state())
+    arrays["rng/random_streams_seed"] = np.array(model.root_growth.random_streams.seed)
+
+    if compress:
+        np.savez_compressed(path, **arrays)
+    else:
+        np.savez(path, **arrays)
+
+
+def load_checkpoint(model, path):
+    """
+    This function restores the state of a coupled model from a checkpoint file. The MTG and its properties are modified
+    in place, so that links between modules and the MTG remain valid.
+    :param model: the rhizodep Model, initialized with the same scenario as the one that was saved
+    :param path: the path of the .npz file
+    """
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["version"]) != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {int(data['version'])}")
+
+        # We rebuild the topology in a new MTG, whose structure is then transferred to the MTG of the model:
+        g = model.g
+        new_g = MTG()
+        for vid, parent in zip(data["mtg/vids"].tolist(), data["mtg/parents"].tolist()):
+            if parent < 0:
+                new_g.add_component(new_g.root, component_id=vid)
+            else:
+                new_g.add_child(parent, child=vid)
+        for name, value in vars(new_g).items():
+            if name != "_properties":
+                setattr(g, name, value)
+
+        vids = data["props/vids"]
+        kinds = _unpickled(data["props/kinds"])
+        props = g.properties()
+        store = getattr(props, "store", None)
+        # Slots are allocated to all vertices, as properties are written on them:
+        slots = None if store is None else store.allocate(vids)
+        for name, kind in kinds.items():
+            mask = data[f"props/{name}/mask"]
+            values = _decode_values(data[f"props/{name}/values"], kind)
+            props.setdefault(name, {})
+            _restore_property(props[name], vids[mask], values, None if slots is None else slots[mask])
+        # Properties created after the checkpoint was written are emptied:
+        for name in set(props) - set(kinds):
+            props[name].clear()
+
+        voxels = getattr(model.soil, "voxels", {})
+        for name in voxels:
+            key = f"voxels/{name}"
+            if key in data:
+                voxels[name][...] = data[key]
+
+        np.random.set_state(_unpickled(data["rng/numpy"]))
+        model.root_growth.random_streams.seed = int(data["rng/random_streams_seed"])
+
+    _reset_caches(model)
+
+
+def _reset_caches(model):
+    """
+    This function discards every structure that modules derived from the previous MTG.
+    """
+    g = model.g
+    growth = model.root_growth
+    growth._topology = None
+    growth.apices.rebuild(g)
+    growth.elements.rebuild(g)
+    growth.new_vertices_log.clear()
+    for module in model.models:
+        module.vertices = g.vertices(scale=g.max_scale())
+    soil = model.soil
+    if hasattr(soil, "root_coordinates"):
+        soil.voxel_index_outdated = True
+        soil.root_coordinates = RootCoordinates(g, gravitropism_coefficient=soil.gravitropism_coefficient)
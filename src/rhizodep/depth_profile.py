@@ -0,0 +1,101 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.depth_profile
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.depth_profile` computes the distribution of root variables between soil layers.
+
+    Every root element is considered as a straight segment between (x1, y1, z1) and (x2, y2, z2). It is clipped against
+    all layer boundaries at once, the length of a segment intercepted between two depths being proportional to the
+    depth range it covers there. The profile is computed with NumPy arrays only, so that it can be called at each
+    time step of a simulation.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import numpy as np
+
+from rhizodep.array_store import gather
+
+# Variables integrated over each layer, and the properties they are computed from:
+PROFILE_VARIABLES = ("length", "struct_mass", "root_necromass", "surface", "net_hexose_exudation", "hexose_degradation")
+
+
+def _property(g, name, vids, default=0.):
+    """
+    This function returns the values of a numeric property of the MTG on a sequence of vertices as a float array.
+    """
+    return gather(g.properties().get(name, {}), vids, default).astype(np.float64)
+
+
+def intercepted_lengths(x1, y1, z1, x2, y2, z2, boundaries):
+    """
+    This function computes the length of each segment intercepted between successive horizontal planes, like the
+    function sub_length_z applied to every segment and every layer, in a single vectorized pass.
+    :param x1, y1, z1, x2, y2, z2: arrays of the coordinates of both ends of each segment, z being positive downwards
+    :param boundaries: the increasing array of the L + 1 depths delimiting L layers
+    :return: a (number of segments, L) array of intercepted lengths
+    """
+    min_z = np.minimum(z1, z2)[:, None]
+    max_z = np.maximum(z1, z2)[:, None]
+    z_start = boundaries[None, :-1]
+    z_end = boundaries[None, 1:]
+    total_length = np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 + (z2 - z1) ** 2)[:, None]
+    # As in sub_length_z, a segment is considered in a layer if min_z < z_end and max_z >= z_start:
+    included = (min_z < z_end) & (max_z >= z_start)
+    depth_range = max_z - min_z
+    overlap = np.minimum(z_end, max_z) - np.maximum(z_start, min_z)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Horizontal segments are entirely included in the layer containing them:
+        fraction = np.where(depth_range > 0, overlap / depth_range, 1.)
+    return np.where(included, fraction * total_length, 0.)
+
+
+def depth_profile(g, z_min=0., z_max=1., z_interval=0.1, vids=None, record_lengths=False):
+    """
+    This function integrates the length, structural mass, necromass, external surface, net hexose exudation and hexose
+    degradation of root elements in successive soil layers.
+    :param g: the root MTG, whose elements have the coordinates x1, y1, z1, x2, y2, z2 (z being negative downwards)
+    :param z_min: the depth to which we start computing
+    :param z_max: the maximal depth to which we stop computing
+    :param z_interval: the thickness of each layer to consider between z_min and z_max
+    :param vids: the vertices to consider (by default, all the elements of the MTG)
+    :param record_lengths: if True, the length of each element included in each layer is returned as well
+    :return: a dictionary containing the array of the upper depths of layers ("z_start"), one array per integrated
+    variable, and the (elements, layers) array of intercepted lengths ("element_lengths") if required
+    """
+    if vids is None:
+        vids = g.vertices(scale=1)
+    vids = np.fromiter(vids, dtype=np.int64)
+
+    z_starts = np.arange(z_min, z_max, z_interval)
+    boundaries = np.r_[z_starts, z_starts[-1] + z_interval] if len(z_starts) else np.array([z_min])
+    coordinates = {name: _property(g, name, vids) for name in ("x1", "y1", "z1", "x2", "y2", "z2")}
+    # Depths are positive downwards:
+    lengths = intercepted_lengths(coordinates["x1"], coordinates["y1"], -coordinates["z1"],
+                                  coordinates["x2"], coordinates["y2"], -coordinates["z2"], boundaries)
+
+    length = _property(g, "length", vids)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Elements without a positive length are not counted:
+        fractions = np.where((length > 0)[:, None], lengths / length[:, None], 0.)
+    struct_mass = _property(g, "struct_mass", vids)
+    types = gather(g.properties().get("type", {}), vids, None)
+    dead = (types == "Dead") | (types == "Just_dead")
+    per_element = {
+        "length": length,
+        "struct_mass": struct_mass,
+        "root_necromass": np.where(dead, struct_mass, 0.),
+        "surface": _property(g, "external_surface", vids),
+        "net_hexose_exudation": _property(g, "hexose_exudation", vids)
+                                - _property(g, "hexose_uptake", vids),
+        "hexose_degradation": _property(g, "hexose_degradation", vids)}
+
+    profile = {"z_start": z_starts}
+    for name in PROFILE_VARIABLES:
+        profile[name] = per_element[name] @ fractions
+    if record_lengths:
+        profile["element_lengths"] = np.where((length > 0)[:, None], lengths, 0.)
+    return profile
@@ -0,0 +1,344 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.mtg_series
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.mtg_series` stores the successive states of a root MTG as keyframes and deltas.
+
+    A keyframe holds the whole MTG, like a checkpoint (see rhizodep.checkpoint). The frames recorded between two
+    keyframes only hold the vertices added since the previous frame and, for each property, the vertices on which its
+    value has changed. Geometrical and topological properties (e.g. length, radius or type) are constant on most
+    elements from one hour to the next and are therefore hardly stored. Carbon concentrations and fluxes, however,
+    change on every living element at each step, as do the ages of elements: unless they are only stored in keyframes
+    (see keyframe_only_properties), deltas hold them in full and the storage gain remains small.
+
+    Reading a recorded state costs one keyframe plus up to keyframe_period - 1 deltas, i.e. O(keyframe_period) whatever
+    the length of the series, and not O(1): the reader keeps the last reconstructed state, so that covering the series
+    in increasing order only applies one delta per step, while random access depends on the distance to the keyframe.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import os
+import copy
+import json
+from dataclasses import fields
+
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.checkpoint import _pickled, _unpickled, _encode_values, _decode_values, base_to_tips
+from rhizodep.array_store import PropertyView, gather, defined
+
+INDEX_FILE = "index.json"
+# Types of property values that can be kept by reference from one frame to the next:
+IMMUTABLE_TYPES = (str, bytes, int, float, complex, type(None), np.generic)
+
+
+def keyframe_only_properties(model):
+    """
+    This function returns the names of the properties of a composite model that change on every element at each step,
+    i.e. the concentrations and fluxes declared as state variables by the carbon and soil modules, and the ages of
+    elements (e.g. thermal_time_since_emergence). They can be given as keyframe_only to MTGSeriesWriter.
+    """
+    names = {f.name for module in model.models for f in fields(module)
+             if f.metadata.get("variable_type") == "state_variable"
+             and f.metadata.get("by") in ("model_carbon", "model_soil")}
+    names.update(name for name in model.g.properties() if "_time_since_" in name)
+    return sorted(names)
+
+
+def _column(prop, vid_list):
+    """
+    This function returns the mask of vertices on which a property is defined and the array of its values on a sequence
+    of vertices (undefined values are 0 or None).
+    """
+    if isinstance(prop, PropertyView):
+        column = prop.store.columns[prop.name]
+        return defined(prop, vid_list), gather(prop, vid_list, None if column.dtype == object else 0)
+    return defined(prop, vid_list), _object_array(prop.get(vid) for vid in vid_list)
+
+
+def _object_array(values):
+    """
+    This function returns an array of objects, values being stored as they are even if they are sequences.
+    """
+    values = list(values)
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _snapshot(values):
+    """
+    This function returns a copy of an array of property values that is not affected by later in-place modifications of
+    mutable values (e.g. lists), so that they are detected as changes at the next frame.
+    """
+    if values.dtype != object:
+        return values.copy()
+    return _object_array(value if isinstance(value, IMMUTABLE_TYPES) else copy.deepcopy(value)
+                         for value in values.tolist())
+
+
+def _differs(values, previous_values):
+    """
+    This function compares two arrays of property values element-wise, NaN being considered equal to NaN.
+    """
+    if values.dtype != object and previous_values.dtype != object:
+        differs = values != previous_values
+        if values.dtype.kind == "f":
+            differs &= ~(np.isnan(values) & np.isnan(previous_values))
+        return differs
+    differs = np.empty(len(values), dtype=bool)
+    for i, (value, previous_value) in enumerate(zip(values.tolist(), previous_values.tolist())):
+        try:
+            differs[i] = value is not previous_value and bool(value != previous_value) \
+                         and not (value != value and previous_value != previous_value)
+        except (TypeError, ValueError):
+            # Values that cannot be compared (e.g. arrays) are always recorded:
+            differs[i] = True
+    return differs
+
+
+def _extended(array, size, fill):
+    """
+    This function returns an array completed with a fill value up to a given size.
+    """
+    if len(array) == size:
+        return array
+    extension = np.empty(size - len(array), dtype=array.dtype)
+    extension[:] = fill
+    return np.concatenate((array, extension))
+
+
+class MTGSeriesWriter:
+    """
+    DESCRIPTION
+    -----------
+    Writer of a series of MTG states as keyframes and deltas, in a directory containing one .npz file per recorded step
+    and an index file.
+
+    It can be added to Model.output_writers to record the MTG at the end of each step, and the series is read with
+    MTGSeries.
+    """
+
+    def __init__(self, outputs_dirpath, keyframe_period=24, compress=True, keyframe_only=()):
+        """
+        :param outputs_dirpath: the directory in which frames are written
+        :param keyframe_period: the number of recorded steps between two keyframes
+        :param compress: if True, frames are compressed
+        :param keyframe_only: the names of the properties only stored in keyframes, which keep the values of the last
+        keyframe in the frames reconstructed between two keyframes (see keyframe_only_properties)
+        """
+        self.outputs_dirpath = outputs_dirpath
+        self.keyframe_period = int(keyframe_period)
+        self.compress = compress
+        self.keyframe_only = set(keyframe_only)
+        os.makedirs(outputs_dirpath, exist_ok=True)
+        self.index = {"frames": []}
+        self._step = 0
+        self._frames_since_keyframe = 0
+        # Vertices known at the previous frame, in the order in which their properties are stored (the MTG root first):
+        self._vids = []
+        self._position_of = {}
+        # Mask and values of each property at the previous frame:
+        self._previous = {}
+
+    def record(self, g, step=None):
+        """
+        This function writes the current state of a MTG as a keyframe or as a delta from the previous recorded state.
+        :param g: the root MTG
+        :param step: the number of the step (by default, the number of steps already recorded)
+        """
+        if step is None:
+            step = self._step
+        self._step = step + 1
+
+        position_of = self._position_of
+        current_vids = list(g.vertices_iter(scale=1))
+        new_vids = [vid for vid in current_vids if vid not in position_of]
+        # A keyframe is also written if some vertices have been removed:
+        keyframe = (not self._vids or self._frames_since_keyframe + 1 >= self.keyframe_period
+                    or len(current_vids) - len(new_vids) != len(self._vids) - 1)
+
+        arrays = {"step": np.array(step), "keyframe": np.array(keyframe)}
+        if keyframe:
+            scale_1_vids, parents = base_to_tips(g)
+            self._vids = [g.root] + scale_1_vids.tolist()
+            self._position_of = {vid: position for position, vid in enumerate(self._vids)}
+            self._previous = {}
+            self._frames_since_keyframe = 0
+        else:
+            # As vertex indices are attributed in increasing order, parents are always added before their children:
+            new_vids.sort()
+            scale_1_vids = np.array(new_vids, dtype=np.int64)
+            parents = np.array([g.parent(vid) for vid in new_vids], dtype=np.int64)
+            for vid in new_vids:
+                self._position_of[vid] = len(self._vids)
+                self._vids.append(vid)
+            self._frames_since_keyframe += 1
+        arrays["mtg/root"] = np.array(g.root)
+        arrays["mtg/vids"] = scale_1_vids
+        arrays["mtg/parents"] = parents
+
+        vid_list = self._vids
+        props = g.properties()
+        kinds = {}
+        previous = {}
+        for name, prop in props.items():
+            if not keyframe and name in self.keyframe_only:
+                kinds[name] = None
+                continue
+            mask, values = _column(prop, vid_list)
+            previous[name] = (mask, _snapshot(values))
+            if name in self._previous:
+                previous_mask, previous_values = self._previous[name]
+                previous_mask = _extended(previous_mask, len(mask), False)
+                fill = None if previous_values.dtype == object else 0
+                previous_values = _extended(previous_values, len(values), fill)
+                changed = mask & (~previous_mask | _differs(values, previous_values))
+                undefined = np.flatnonzero(previous_mask & ~mask)
+                if len(undefined) > 0:
+                    arrays[f"props/{name}/undefined"] = undefined
+            else:
+                changed = mask
+            kinds[name] = None
+            if changed.any():
+                # Unchanged properties are only listed in kinds, to avoid the overhead of empty arrays in the file:
+                arrays[f"props/{name}/positions"] = np.flatnonzero(changed)
+                arrays[f"props/{name}/values"], kinds[name] = _encode_values(values[changed].tolist())
+        arrays["props/kinds"] = _pickled(kinds)
+        self._previous = previous
+
+        filename = "frame_%06d.npz" % len(self.index["frames"])
+        temporary_path = os.path.join(self.outputs_dirpath, filename + ".tmp.npz")
+        if self.compress:
+            np.savez_compressed(temporary_path, **arrays)
+        else:
+            np.savez(temporary_path, **arrays)
+        os.replace(temporary_path, os.path.join(self.outputs_dirpath, filename))
+        self.index["frames"].append({"step": int(step), "file": filename, "keyframe": bool(keyframe)})
+        self._write_index()
+
+    def close(self):
+        """
+        This function exists for compatibility with other output writers, frames being written when recorded.
+        """
+        self._write_index()
+
+    def _write_index(self):
+        index_path = os.path.join(self.outputs_dirpath, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(index_path + ".tmp", index_path)
+
+
+class MTGSeries:
+    """
+    DESCRIPTION
+    -----------
+    Reader of a series written by MTGSeriesWriter, which returns the MTG of any recorded step.
+
+    The last reconstructed state is kept, so that covering the series in increasing order only applies one delta per
+    step.
+    """
+
+    def __init__(self, outputs_dirpath):
+        """
+        :param outputs_dirpath: the directory in which frames have been written
+        """
+        self.outputs_dirpath = outputs_dirpath
+        self._cache = None
+        self.reload()
+
+    def reload(self):
+        """
+        This function reads the index again to see the frames written since the last reading.
+        """
+        with open(os.path.join(self.outputs_dirpath, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.frames = self.index["frames"]
+        self.rank_of_step = {frame["step"]: rank for rank, frame in enumerate(self.frames)}
+
+    @property
+    def steps(self):
+        """
+        The list of recorded steps.
+        """
+        return [frame["step"] for frame in self.frames]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        for step in self.steps:
+            yield self[step]
+
+    def __getitem__(self, step):
+        """
+        This function reconstructs the MTG of a recorded step.
+        """
+        rank = self.rank_of_step[step]
+        keyframe_rank = rank
+        while not self.frames[keyframe_rank]["keyframe"]:
+            keyframe_rank -= 1
+
+        if self._cache is not None and keyframe_rank <= self._cache[0] <= rank:
+            first_rank, state = self._cache
+            first_rank += 1
+        else:
+            first_rank, state = keyframe_rank, None
+        for frame_rank in range(first_rank, rank + 1):
+            state = self._apply(frame_rank, state)
+        self._cache = (rank, state)
+        return self._build(state)
+
+    def _apply(self, rank, state):
+        """
+        This function applies a frame to the state of the previous frame (or creates a new state from a keyframe).
+        """
+        with np.load(os.path.join(self.outputs_dirpath, self.frames[rank]["file"]), allow_pickle=False) as data:
+            if data["keyframe"]:
+                state = {"root": None, "scale_1_vids": [], "parents": [], "vids": [], "props": {}}
+            state["scale_1_vids"].extend(data["mtg/vids"].tolist())
+            state["parents"].extend(data["mtg/parents"].tolist())
+            if data["keyframe"]:
+                state["vids"] = [int(data["mtg/root"])] + state["scale_1_vids"]
+            else:
+                state["vids"].extend(data["mtg/vids"].tolist())
+            vids = state["vids"]
+
+            kinds = _unpickled(data["props/kinds"])
+            props = {}
+            for name, kind in kinds.items():
+                values = state["props"].get(name, {})
+                undefined_key = f"props/{name}/undefined"
+                if undefined_key in data:
+                    for position in data[undefined_key].tolist():
+                        values.pop(vids[position], None)
+                if kind is not None:
+                    new_values = _decode_values(data[f"props/{name}/values"], kind)
+                    if isinstance(new_values, np.ndarray):
+                        new_values = new_values.tolist()
+                    values.update(zip((vids[position] for position in data[f"props/{name}/positions"].tolist()),
+                                      new_values))
+                props[name] = values
+            state["props"] = props
+        return state
+
+    @staticmethod
+    def _build(state):
+        """
+        This function creates a new MTG from a reconstructed state.
+        """
+        g = MTG()
+        for vid, parent in zip(state["scale_1_vids"], state["parents"]):
+            if parent < 0:
+                g.add_component(g.root, component_id=vid)
+            else:
+                g.add_child(parent, child=vid)
+        g._properties = {name: dict(values) for name, values in state["props"].items()}
+        return g
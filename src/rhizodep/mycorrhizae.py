@@ -4,6 +4,7 @@ from openalea.mtg import *
 import openalea.plantgl.all as pgl
 import rhizodep.parameters as param
 import rhizodep.tools as tools
+from rhizodep.random_streams import RandomStreams
 import pickle
 import time
 
@@ -44,7 +45,7 @@ def reinitializing_fungus_growth(fungus):
 
     return
 
-def root_infection_by_fungus(root_MTG, fungus, step, time_step_in_seconds):
+def root_infection_by_fungus(root_MTG, fungus, step, time_step_in_seconds, random_choice=param.random_choice):
     """
     This function computes the possible new infection of all root elements of a given root MTG by the fungus
     and updates the infection severity and the new exchange severity between the fungus and the root elements.
@@ -52,6 +53,7 @@ def root_infection_by_fungus(root_MTG, fungus, step, time_step_in_seconds):
     :param fungus:
     :param step:
     :param time_step_in_seconds:
+    :param random_choice: the random seed of the simulation
     :return:
     """
 
@@ -65,12 +67,15 @@ def root_infection_by_fungus(root_MTG, fungus, step, time_step_in_seconds):
 
     initial_fungus_exchange_surface = fungus.root_exchange_surface
 
+    # We draw at once the random numbers of all root elements for this time step:
+    vids = list(g.vertices_iter(scale=1))
+    random_results = dict(zip(vids, RandomStreams(seed=random_choice).uniform(vids, "fungus_infection",
+                                                                                step=step).tolist()))
+
     # We go through the root MTG to look at each possibility of infection:
-    for vid in g.vertices_iter(scale=1):
+    for vid in vids:
         n = g.node(vid)
 
-        np.random.seed(vid*step)
-
         # We increment the total surface and length of the root system:
         total_root_length += n.length
         try:
@@ -158,7 +163,7 @@ def root_infection_by_fungus(root_MTG, fungus, step, time_step_in_seconds):
                         son.fungal_infection_severity = 0.
 
                 # Eventually, we make a random test to see whether infection should occur at this time step or not:
-                random_result = np.random.random_sample()
+                random_result = random_results[vid]
                 # If the random test leads to positive result as compared with the probability number:
                 if random_result < infection_probability:
                     # Then the targeted root element becomes infected!
@@ -311,7 +316,7 @@ def fungus_mass_balance(fungus, time_step_in_seconds):
 
     return
 
-def mycorrhizal_interaction(root_MTG, fungus, step, time_step_in_seconds):
+def mycorrhizal_interaction(root_MTG, fungus, step, time_step_in_seconds, random_choice=param.random_choice):
     """
     This function calls successively all other mycorrhizal functions to have the fungus infecting different root
     elements, take some hexose and extends.
@@ -319,6 +324,7 @@ def mycorrhizal_interaction(root_MTG, fungus, step, time_step_in_seconds):
     :param fungus:
     :param step:
     :param time_step_in_seconds:
+    :param random_choice: the random seed of the simulation
     :return:
     """
 
@@ -328,7 +334,7 @@ def mycorrhizal_interaction(root_MTG, fungus, step, time_step_in_seconds):
     # We compute the new infection of the fungus over the whole root MTG - this modifies the surface
     # of exchange between the roots and the fungus, and the severity of infection of each element:
     root_infection_by_fungus(root_MTG, fungus=fungus, step=step,
-                                         time_step_in_seconds=time_step_in_seconds)
+                                         time_step_in_seconds=time_step_in_seconds, random_choice=random_choice)
     # NOTE: this function increases the surface, but not the mass of the fungus. It does not register the cost of growth.
 
     # We then calculate the new rate of carbon exchange between each root element and the fungus f:
@@ -0,0 +1,155 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.random_streams
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.random_streams` provides counter-based random numbers for stochastic root processes.
+
+    Instead of reseeding the global generator of NumPy before each draw, every random number is computed with the
+    Philox4x32-10 function from a key (the random seed of the simulation and the purpose of the draw) and a counter
+    (the index of the element, the time step and the rank of the draw). Draws therefore do not depend on the order in
+    which elements are visited nor on the process in which they are made, and can be computed for many elements at once.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import zlib
+from math import sqrt, log1p, cos, pi
+
+import numpy as np
+
+# Constants of the Philox4x32 function (Salmon et al., 2011):
+PHILOX_M0 = np.uint64(0xD2511F53)
+PHILOX_M1 = np.uint64(0xCD9E8D57)
+PHILOX_W0 = np.uint64(0x9E3779B9)
+PHILOX_W1 = np.uint64(0xBB67AE85)
+MASK_32 = np.uint64(0xFFFFFFFF)
+SHIFT_32 = np.uint64(32)
+
+
+def philox4x32(counter, key, rounds=10):
+    """
+    This function applies the Philox4x32 bijection to arrays of counters and keys.
+    :param counter: a sequence of four arrays of 32-bit words
+    :param key: a sequence of two arrays of 32-bit words
+    :param rounds: the number of rounds (10 is the standard value)
+    :return: a list of four arrays of random 32-bit words (stored as uint64)
+    """
+    c0, c1, c2, c3 = (np.asarray(word, dtype=np.uint64) & MASK_32 for word in counter)
+    k0, k1 = (np.asarray(word, dtype=np.uint64) & MASK_32 for word in key)
+    for _ in range(rounds):
+        product_0 = PHILOX_M0 * c0
+        product_1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = ((product_1 >> SHIFT_32) ^ c1 ^ k0,
+                          product_1 & MASK_32,
+                          (product_0 >> SHIFT_32) ^ c3 ^ k1,
+                          product_0 & MASK_32)
+        k0 = (k0 + PHILOX_W0) & MASK_32
+        k1 = (k1 + PHILOX_W1) & MASK_32
+    return [c0, c1, c2, c3]
+
+
+def _philox4x32_scalar(c0, c1, c2, c3, k0, k1, rounds=10):
+    """
+    This function is the equivalent of philox4x32 for a single counter, written with Python integers, which is much
+    faster than NumPy operations when only a few numbers are drawn.
+    """
+    for _ in range(rounds):
+        product_0 = 0xD2511F53 * c0
+        product_1 = 0xCD9E8D57 * c2
+        c0, c1, c2, c3 = ((product_1 >> 32) ^ c1 ^ k0,
+                          product_1 & 0xFFFFFFFF,
+                          (product_0 >> 32) ^ c3 ^ k1,
+                          product_0 & 0xFFFFFFFF)
+        k0 = (k0 + 0x9E3779B9) & 0xFFFFFFFF
+        k1 = (k1 + 0xBB67AE85) & 0xFFFFFFFF
+    return c0, c1, c2, c3
+
+
+class RandomStreams:
+    """
+    DESCRIPTION
+    -----------
+    Counter-based random numbers keyed by (seed, purpose, vid, step, draw).
+
+    The purpose is a short name describing what the draw is used for (e.g. "segmentation"), so that two processes
+    drawing numbers for the same element never share them. The step should be given for draws repeated at each time step
+    on the same element, and the rank of the draw distinguishes several numbers drawn for the same purpose. All
+    arguments other than the seed and the purpose can be arrays, which are broadcast against each other.
+    """
+
+    def __init__(self, seed=0):
+        """
+        :param seed: the random seed of the simulation
+        """
+        self.seed = int(seed)
+
+    @staticmethod
+    def purpose_key(purpose):
+        """
+        This function converts the name of a purpose into a stable 32-bit integer.
+        """
+        return zlib.crc32(purpose.encode("utf-8"))
+
+    def _uniform_pair(self, vids, purpose, step, draw):
+        """
+        This function returns two independent arrays of uniform floats in [0, 1) with 53 bits of precision.
+        """
+        key = (self.seed & 0xFFFFFFFF, self.purpose_key(purpose))
+        if np.ndim(vids) == 0 and np.ndim(step) == 0 and np.ndim(draw) == 0:
+            # For a single draw, we only use Python integers and floats:
+            vid, step, draw = int(vids), int(step), int(draw)
+            w0, w1, w2, w3 = _philox4x32_scalar(vid & 0xFFFFFFFF, (vid >> 32) & 0xFFFFFFFF, step & 0xFFFFFFFF,
+                                                draw & 0xFFFFFFFF, *key)
+            return ((w0 >> 5) * 67108864. + (w1 >> 6)) / 9007199254740992., \
+                   ((w2 >> 5) * 67108864. + (w3 >> 6)) / 9007199254740992.
+
+        vids, step, draw = np.broadcast_arrays(np.asarray(vids, dtype=np.int64), np.asarray(step, dtype=np.int64),
+                                               np.asarray(draw, dtype=np.int64))
+        if vids.size <= 16:
+            # For a few draws, e.g. for a single element, we avoid the overhead of NumPy operations:
+            words = [_philox4x32_scalar(vid & 0xFFFFFFFF, (vid >> 32) & 0xFFFFFFFF, s & 0xFFFFFFFF, d & 0xFFFFFFFF, *key)
+                     for vid, s, d in zip(vids.ravel().tolist(), step.ravel().tolist(), draw.ravel().tolist())]
+            w0, w1, w2, w3 = (np.array([word[i] for word in words], dtype=np.uint64).reshape(vids.shape)
+                              for i in range(4))
+        else:
+            vids = vids.astype(np.uint64)
+            counter = (vids & MASK_32, vids >> SHIFT_32, step.astype(np.uint64), draw.astype(np.uint64))
+            w0, w1, w2, w3 = philox4x32(counter, (np.uint64(key[0]), np.uint64(key[1])))
+        first = ((w0 >> np.uint64(5)).astype(np.float64) * 67108864. + (w1 >> np.uint64(6)).astype(np.float64)) \
+                / 9007199254740992.
+        second = ((w2 >> np.uint64(5)).astype(np.float64) * 67108864. + (w3 >> np.uint64(6)).astype(np.float64)) \
+                 / 9007199254740992.
+        return first, second
+
+    def uniform(self, vids, purpose, low=0., high=1., step=0, draw=0):
+        """
+        This function draws numbers from a uniform distribution over [low, high).
+        :param vids: the index (or array of indices) of the elements concerned by the draw
+        :param purpose: the name of the purpose of the draw
+        :param low: the lower boundary
+        :param high: the upper boundary
+        :param step: the time step of the draw
+        :param draw: the rank of the draw for this element, purpose and step
+        :return: a float, or an array of floats
+        """
+        u, _ = self._uniform_pair(vids, purpose, step, draw)
+        return low + (high - low) * u
+
+    def normal(self, vids, purpose, loc=0., scale=1., step=0, draw=0):
+        """
+        This function draws numbers from a normal distribution (Box-Muller transform).
+        :param vids: the index (or array of indices) of the elements concerned by the draw
+        :param purpose: the name of the purpose of the draw
+        :param loc: the mean of the distribution
+        :param scale: the standard deviation of the distribution
+        :param step: the time step of the draw
+        :param draw: the rank of the draw for this element, purpose and step
+        :return: a float, or an array of floats
+        """
+        u, v = self._uniform_pair(vids, purpose, step, draw)
+        if isinstance(u, float):
+            return loc + scale * sqrt(-2. * log1p(-u)) * cos(2. * pi * v)
+        return loc + scale * np.sqrt(-2. * np.log1p(-u)) * np.cos(2. * np.pi * v)
@@ -0,0 +1,264 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.raster
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.raster` draws images of root systems without PlantGL nor any display.
+
+    Root elements are drawn as thick segments between the coordinates computed by the turtle (see
+    rhizodep.root_coordinates), seen through an orthographic camera positioned like in tools.plot_mtg. Each segment is
+    sampled every pixel along its projection and each sample is stamped as a disk of its projected radius, the nearest
+    sample being kept in each pixel (z-buffer). Dead elements and root hairs are then blended over the image as
+    semi-transparent layers, with the colors and transparencies used by tools.plot_mtg. Images are written as PNG files
+    with zlib only.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from rhizodep.array_store import gather
+from rhizodep.root_coordinates import RootCoordinates
+
+# Segment data of the 'jet' colormap of matplotlib, used when matplotlib is not available:
+JET_DATA = {"red": ((0., 0.), (0.35, 0.), (0.66, 1.), (0.89, 1.), (1., 0.5)),
+            "green": ((0., 0.), (0.125, 0.), (0.375, 1.), (0.64, 1.), (0.91, 0.), (1., 0.)),
+            "blue": ((0., 0.5), (0.11, 1.), (0.34, 1.), (0.65, 0.), (1., 0.))}
+
+
+def colormap_table(cmap='jet', n_colors=256):
+    """
+    This function returns the (n_colors, 3) table of RGB values between 0 and 1 of a colormap.
+    """
+    try:
+        import matplotlib
+        return np.asarray(matplotlib.colormaps[cmap].resampled(n_colors)(np.arange(n_colors)))[:, :3]
+    except (ImportError, AttributeError):
+        if cmap != 'jet':
+            raise
+    positions = np.linspace(0., 1., n_colors)
+    return np.stack([np.interp(positions, *zip(*JET_DATA[channel])) for channel in ("red", "green", "blue")], axis=1)
+
+
+def colors_from_values(values, cmap='jet', vmin=1e-12, vmax=3e-7, lognorm=True):
+    """
+    This function converts an array of values into RGB colors (integers between 0 and 255) like tools.my_colormap.
+    """
+    if vmin >= vmax:
+        raise Exception("Sorry, the vmin and vmax values of the color scale of the graph are wrong!")
+    if lognorm and (vmin <= 0 or vmax <= 0):
+        raise Exception("Sorry, it is not possible to represent negative values in a log scale - check vmin and vmax!")
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if lognorm:
+            normed = (np.log10(values) - np.log10(vmin)) / (np.log10(vmax) - np.log10(vmin))
+        else:
+            normed = (values - vmin) / (vmax - vmin)
+    table = colormap_table(cmap)
+    n_colors = len(table)
+    # Values below vmin or above vmax take the extreme colors, and undefined ones are black:
+    indices = np.clip(np.nan_to_num(normed * n_colors, nan=0., posinf=n_colors, neginf=-1.), -1, n_colors)
+    indices = np.clip(indices.astype(np.int64), 0, n_colors - 1)
+    colors = (table[indices] * 255).astype(np.int64)
+    colors[np.isnan(normed)] = 0
+    return colors
+
+
+def camera_basis(x_center=0., y_center=0., z_center=0., x_cam=1., y_cam=0., z_cam=0.):
+    """
+    This function returns the unit vectors pointing to the right, to the top and away from the camera.
+    """
+    forward = np.array([x_center - x_cam, y_center - y_cam, z_center - z_cam], dtype=np.float64)
+    forward /= np.linalg.norm(forward)
+    vertical = np.array([0., 0., 1.])
+    if abs(np.dot(forward, vertical)) > 0.999:
+        # When looking vertically, the top of the image is the y axis:
+        vertical = np.array([0., 1., 0.])
+    right = np.cross(forward, vertical)
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+    return right, up, forward
+
+
+def _disk_offsets(radius):
+    """
+    This function returns the integer offsets of the pixels of a disk of a given radius (in pixels).
+    """
+    r = int(radius)
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= radius ** 2 + 0.5
+    return dy[inside], dx[inside]
+
+
+def rasterize_segments(start, end, radius, width, height):
+    """
+    This function covers thick segments given in pixel coordinates with pixel samples.
+    :param start: (n, 3) array of the (column, row, depth) coordinates of the start of segments
+    :param end: (n, 3) array of the coordinates of the end of segments
+    :param radius: (n,) array of the radius of segments in pixels
+    :param width: the width of the image
+    :param height: the height of the image
+    :return: the flat pixel index, the depth and the segment of each sample
+    """
+    n_segments = len(start)
+    projected_length = np.hypot(end[:, 0] - start[:, 0], end[:, 1] - start[:, 1])
+    # Each segment is sampled about every pixel:
+    n_samples = np.ceil(projected_length).astype(np.int64) + 1
+    segment = np.repeat(np.arange(n_segments), n_samples)
+    first_sample = np.cumsum(n_samples) - n_samples
+    t = (np.arange(len(segment)) - first_sample[segment]) / np.maximum(n_samples[segment] - 1, 1)
+    points = start[segment] + (end[segment] - start[segment]) * t[:, None]
+
+    # Each sample is stamped as a disk, samples being grouped by rounded radius:
+    rounded_radius = np.round(radius[segment] * 2.) / 2.
+    columns, rows, depths, segments = [], [], [], []
+    for value in np.unique(rounded_radius):
+        selected = np.flatnonzero(rounded_radius == value)
+        dy, dx = _disk_offsets(value)
+        columns.append((np.rint(points[selected, 0])[:, None] + dx[None, :]).ravel())
+        rows.append((np.rint(points[selected, 1])[:, None] + dy[None, :]).ravel())
+        depths.append(np.repeat(points[selected, 2], len(dx)))
+        segments.append(np.repeat(segment[selected], len(dx)))
+    columns = np.concatenate(columns).astype(np.int64)
+    rows = np.concatenate(rows).astype(np.int64)
+    depths = np.concatenate(depths)
+    segments = np.concatenate(segments)
+    visible = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+    return rows[visible] * width + columns[visible], depths[visible], segments[visible]
+
+
+def nearest_samples(pixels, depths):
+    """
+    This function keeps, for each pixel covered by samples, the sample nearest to the camera (z-buffer).
+    :return: the indices of the kept samples
+    """
+    order = np.lexsort((depths, pixels))
+    sorted_pixels = pixels[order]
+    first = np.r_[True, sorted_pixels[1:] != sorted_pixels[:-1]]
+    return order[first]
+
+
+def render_mtg(g, prop_cmap='hexose_exudation', cmap='jet', lognorm=True, vmin=1e-12, vmax=3e-7,
+               root_hairs_display=True, width=1200, height=1200,
+               x_center=0., y_center=0., z_center=0., x_cam=1., y_cam=0., z_cam=0.,
+               pixels_per_meter=None, background=(255, 255, 255), compute_coordinates=False):
+    """
+    This function draws a MTG colored according to a property into an image, as tools.plot_mtg does with PlantGL.
+    :param g: the investigated MTG, whose elements have the coordinates x1, y1, z1, x2, y2, z2
+    :param prop_cmap: the name of the property of the MTG that will be displayed in color
+    :param cmap: the type of color map
+    :param lognorm: a Boolean describing whether the scale is logarithmic or not
+    :param vmin: the min value to be displayed
+    :param vmax: the max value to be displayed
+    :param root_hairs_display: if True, root hairs are displayed as a semi-transparent halo around elements
+    :param width: the width of the image (in pixels)
+    :param height: the height of the image (in pixels)
+    :param x_center, y_center, z_center: the coordinates of the point displayed at the center of the image
+    :param x_cam, y_cam, z_cam: the coordinates of the camera looking at the center of the image
+    :param pixels_per_meter: the scale of the image (by default, the root system fills the image)
+    :param background: the RGB color of the background
+    :param compute_coordinates: if True, the coordinates of elements are first computed with the headless turtle
+    :return: the (height, width, 3) array of the image
+    """
+    if compute_coordinates:
+        RootCoordinates(g).update()
+    vids = np.fromiter(g.vertices(scale=1), dtype=np.int64)
+    props = g.properties()
+
+    def numeric(name, default=0.):
+        return gather(props.get(name, {}), vids, default).astype(np.float64)
+
+    start = np.stack([numeric(name) for name in ("x1", "y1", "z1")], axis=1)
+    end = np.stack([numeric(name) for name in ("x2", "y2", "z2")], axis=1)
+    radius = numeric("radius")
+    dead = gather(props.get("type", {}), vids, None) == "Dead"
+
+    # We project the elements in the frame of the camera:
+    right, up, forward = camera_basis(x_center, y_center, z_center, x_cam, y_cam, z_cam)
+    center = np.array([x_center, y_center, z_center])
+    projection = np.stack([right, -up, forward], axis=1)
+    start = (start - center) @ projection
+    end = (end - center) @ projection
+    if pixels_per_meter is None:
+        extent = np.abs(np.concatenate((start[:, :2], end[:, :2]))).max(axis=0) if len(vids) else np.ones(2)
+        pixels_per_meter = 0.95 * min(width / (2. * max(extent[0], 1e-9)), height / (2. * max(extent[1], 1e-9)))
+    scale = np.array([pixels_per_meter, pixels_per_meter, 1.])
+    offset = np.array([width / 2., height / 2., 0.])
+    start = start * scale + offset
+    end = end * scale + offset
+
+    image = np.empty((height * width, 3), dtype=np.float64)
+    image[:] = background
+    depth_buffer = np.full(height * width, np.inf)
+    colors = colors_from_values(numeric(prop_cmap, default=np.nan), cmap=cmap, vmin=vmin, vmax=vmax,
+                                lognorm=lognorm)
+
+    # Living elements are opaque:
+    living = np.flatnonzero(~dead)
+    if len(living):
+        pixels, depths, segments = rasterize_segments(start[living], end[living], radius[living] * pixels_per_meter,
+                                                      width, height)
+        kept = nearest_samples(pixels, depths)
+        image[pixels[kept]] = colors[living[segments[kept]]]
+        depth_buffer[pixels[kept]] = depths[kept]
+
+    # Dead elements are black and semi-transparent, and root hairs form a semi-transparent halo:
+    layers = []
+    dead_vids = np.flatnonzero(dead)
+    if len(dead_vids):
+        layers.append((dead_vids, radius[dead_vids], np.zeros((len(dead_vids), 3)), np.full(len(dead_vids), 0.2)))
+    if root_hairs_display:
+        root_hair_length = numeric("root_hair_length")
+        with_hairs = np.flatnonzero(root_hair_length > 0.)
+        if len(with_hairs):
+            living_hairs = numeric("living_root_hairs_number")[with_hairs]
+            total_hairs = numeric("total_root_hairs_number")[with_hairs]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                living_fraction = np.nan_to_num(living_hairs / total_hairs)
+            # The color goes from black (dead hairs) to the color of the element (living hairs):
+            hair_colors = np.floor(colors[with_hairs] * living_fraction[:, None])
+            transparency = 0.9 + (0.8 - 0.9) * living_fraction
+            layers.append((with_hairs, radius[with_hairs] + root_hair_length[with_hairs], hair_colors,
+                           1. - transparency))
+    for elements, layer_radius, layer_colors, opacity in layers:
+        pixels, depths, segments = rasterize_segments(start[elements], end[elements], layer_radius * pixels_per_meter,
+                                                      width, height)
+        kept = nearest_samples(pixels, depths)
+        pixels, depths, segments = pixels[kept], depths[kept], segments[kept]
+        # The layer is only blended where it is in front of opaque elements:
+        # Samples keep the depth of the axis of their segment, so that the halo of an element is never hidden by the
+        # element itself:
+        in_front = depths <= depth_buffer[pixels]
+        pixels, segments = pixels[in_front], segments[in_front]
+        alpha = opacity[segments][:, None]
+        image[pixels] = image[pixels] * (1. - alpha) + layer_colors[segments] * alpha
+
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8).reshape(height, width, 3)
+
+
+def write_png(filename, image):
+    """
+    This function records an RGB image as a PNG file.
+    :param filename: the path of the file
+    :param image: the (height, width, 3) array of uint8 values
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape[:2]
+    # Each row starts with the filter type 0 (no filter):
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(chunk_type, data):
+        return (struct.pack(">I", len(data)) + chunk_type + data
+                + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
@@ -1,4 +1,6 @@
 import rhizodep
+from rhizodep.checkpoint import save_checkpoint, load_checkpoint
+from rhizodep.step_timing import StepTimer, timed
 from rhizodep.root_growth import RootGrowthModel
 from rhizodep.root_carbon import RootCarbonModel
 from rhizodep.root_anatomy import RootAnatomy
@@ -21,18 +23,19 @@ class Model(CompositeModel):
     4. Use Model.run() in a for loop to perform the computations of a time step on the passed MTG File
     """
 
-    def __init__(self, time_step: int, **scenario):
+    def __init__(self, time_step: int, g=None, **scenario):
         """
         DESCRIPTION
         ----------
         __init__ method of the model. Initializes the thematic modules and link them.
 
-        :param g: the openalea.MTG() instance that will be worked on. It must be representative of a root architecture.
         :param time_step: the resolution time_step of the model in seconds.
+        :param g: the openalea.MTG() instance that will be worked on. It must be representative of a root architecture
+        (e.g. generated by rhizodep.synthetic_mtg). If None, a new root system is initiated by the growth module.
         """
         
         # INIT INDIVIDUAL MODULES
-        self.root_growth = self.load(RootGrowthModel, time_step, **scenario)
+        self.root_growth = self.load(RootGrowthModel, g, time_step, **scenario)
         self.g = self.root_growth.g
         self.root_anatomy = self.load(RootAnatomy, self.g, time_step, **scenario)
         self.root_carbon = self.load(RootCarbonModel, self.g, time_step, **scenario)
@@ -40,20 +43,93 @@ class Model(CompositeModel):
 
         self.models = (self.soil, self.root_growth, self.root_anatomy, self.root_carbon)
 
+        # Elements created by the growth module are notified to the other modules through a shared log:
+        for model in (self.root_anatomy, self.root_carbon, self.soil):
+            model.new_vertices_log = self.root_growth.new_vertices_log
+        # Per-element loops of the anatomy and carbon modules skip the dead elements frozen by the growth module:
+        for model in (self.root_anatomy, self.root_carbon):
+            model.elements = self.root_growth.elements
+
         # LINKING MODULES
         self.link_around_mtg(translator_path=rhizodep.__path__[0])
 
         # Some initialization must be performed AFTER linking modules
         [m.post_coupling_init() for m in self.models]
 
+        # Output sinks (e.g. rhizodep.step_outputs.StepOutputWriter) recording the MTG at the end of each step:
+        self.output_writers = []
+        # Timing of the phases and processes of each step (see rhizodep.step_timing), disabled by default:
+        self.timer = None
+
     def run(self):
-        self.soil()
-        self.root_growth()
+        timer = self.timer
+        n_elements = 0 if timer is None else len(self.g) - 1
+        with timed(timer, "run", n_elements, kind="step"):
+            with timed(timer, "soil", n_elements):
+                self.soil()
+            with timed(timer, "growth", n_elements):
+                self.root_growth()
+
+            if timer is not None:
+                n_elements = len(self.g) - 1
+            with timed(timer, "anatomy_post_growth_updating", n_elements):
+                self.root_anatomy.post_growth_updating()
+            with timed(timer, "carbon_post_growth_updating", n_elements):
+                self.root_carbon.post_growth_updating()
+            with timed(timer, "soil_post_growth_updating", n_elements):
+                self.soil.post_growth_updating()
+
+            with timed(timer, "anatomy", n_elements):
+                self.root_anatomy()
+            with timed(timer, "carbon", n_elements):
+                self.root_carbon()
+            #self.root_carbon.check_balance()
+
+            with timed(timer, "outputs", n_elements):
+                for writer in self.output_writers:
+                    writer.record(self.g)
+        if timer is not None:
+            timer.end_step()
+
+    def enable_timing(self, capacity=100000, processes=True):
+        """
+        Description :
+            Starts recording the duration of each phase of run(), and possibly of each process of the modules.
+
+        :param capacity: the maximal number of records kept by the timer.
+        :param processes: if True, the calls of every method of the modules are timed as well.
+        :return: the StepTimer, whose records can be summarized or exported as a Chrome trace.
+        """
+        self.disable_timing()
+        self.timer = StepTimer(capacity=capacity)
+        if processes:
+            self.timer.watch(self.models)
+        return self.timer
 
-        self.root_anatomy.post_growth_updating()
-        self.root_carbon.post_growth_updating()
-        self.soil.post_growth_updating()
+    def disable_timing(self):
+        """
+        Description :
+            Stops recording durations, the records remaining available in the previous timer.
+        """
+        if self.timer is not None:
+            self.timer.unwatch()
+            self.timer = None
 
-        self.root_anatomy()
-        self.root_carbon()
-        #self.root_carbon.check_balance()
\ No newline at end of file
+    def save_checkpoint(self, path, compress=False):
+        """
+        Description :
+            Saves the MTG, the properties of all modules, the soil voxels and the random generators in a binary file.
+
+        :param path: the path of the .npz file.
+        :param compress: if True, arrays are compressed.
+        """
+        save_checkpoint(self, path, compress=compress)
+
+    def load_checkpoint(self, path):
+        """
+        Description :
+            Restores a state saved with save_checkpoint, the model being initialized with the same scenario.
+
+        :param path: the path of the .npz file.
+        """
+        load_checkpoint(self, path)
@@ -5,12 +5,15 @@ from dataclasses import dataclass
 from metafspm.component import Model, declare
 from metafspm.component_factory import *
 
+from rhizodep.array_store import gather, scatter
+from rhizodep.root_topology import NewVerticesMixin, HotElementsMixin
+
 
 family = "anatomical"
 
 
 @dataclass
-class RootAnatomy(Model):
+class RootAnatomy(Model, NewVerticesMixin, HotElementsMixin):
     """
     Root anatomy model originating from both Rhizodep shoot.py and Root_CyNAPS model_topology.py
 
@@ -21,6 +24,8 @@ class RootAnatomy(Model):
     """
 
     family = "anatomical"
+    # Property whose keys reveal new elements when the log of the growth module is not shared:
+    new_vertices_reference = "root_exchange_surface"
 
     # --- INPUTS STATE VARIABLES FROM OTHER COMPONENTS : default values are provided if not superimposed by model coupling ---
 
@@ -164,6 +169,11 @@ class RootAnatomy(Model):
                             min_value="", max_value="", value_comment="", references="According to the work of Gahoonia et al. (1997), the root hair diameter is relatively constant for different genotypes of wheat and barley, i.e. 12 microns.", DOI="",
                             variable_type="parameter", by="model_anatomy", state_variable_type="", edit_by="user")
 
+    # --- INITIALIZES SIMULATION PARAMETERS ---
+    vectorized_anatomy: bool = declare(default=False, unit="adim", unit_comment="", description="a Boolean expliciting whether surfaces and volumes should be computed as array expressions over the whole root system rather than element by element", 
+                            min_value="", max_value="", value_comment="", references="", DOI="",
+                            variable_type="simulation_parameter", by="model_anatomy", state_variable_type="", edit_by="user")
+
     def __init__(self, g, time_step_in_seconds: int, **scenario: dict):
         """
         DESCRIPTION
@@ -192,17 +202,16 @@ class RootAnatomy(Model):
             Extend property dictionary upon new element partitioning
         """
         self.vertices = self.g.vertices(scale=self.g.max_scale())
-        for vid in self.vertices:
-            if vid not in list(self.root_exchange_surface.keys()):
-                parent = self.g.parent(vid)
-                mass_fraction = self.struct_mass[vid] / (self.struct_mass[vid] + self.struct_mass[parent])
-                # All surfaces are extensive, so we need structural mass wise partitioning to initialize
-                for prop in self.extensive_variables:
-                    getattr(self, prop).update({vid: getattr(self, prop)[parent] * mass_fraction,
-                                                    parent: getattr(self, prop)[parent] * (1-mass_fraction)})
-                for prop in self.intensive_variables:
-                    getattr(self, prop).update({vid: getattr(self, prop)[parent]})
-                    
+        for vid, parent in self.new_vertices():
+            mass_fraction = self.struct_mass[vid] / (self.struct_mass[vid] + self.struct_mass[parent])
+            # All surfaces are extensive, so we need structural mass wise partitioning to initialize
+            for prop in self.extensive_variables:
+                values = getattr(self, prop)
+                values[vid] = values[parent] * mass_fraction
+                values[parent] = values[parent] * (1 - mass_fraction)
+            for prop in self.intensive_variables:
+                values = getattr(self, prop)
+                values[vid] = values[parent]
 
 
     # Computation of transport limitations by xylem, endodermis and exodermis differentiations, sequentially.
@@ -216,7 +225,8 @@ class RootAnatomy(Model):
         :param vid: the vertex ID to compute conductance for (adim).
         :return: the updated element n with the new conductance factors
         """
-        for vid in self.vertices:
+        # Elements frozen as dead by the growth module keep the barriers they had when they died:
+        for vid in self.hot_vertices():
             n = self.g.node(vid)
 
             age = n.thermal_time_since_primordium_formation
@@ -465,3 +475,55 @@ class RootAnatomy(Model):
         :return: the volume (m3)
         """
         return pi * (radius ** 2) * self.xylem_cross_area_surfacic_fraction * length
+
+
+    # VECTORIZED EXECUTION OF PROCESSES:
+    # ----------------------------------
+    # When vectorized_anatomy is True, the @actual @state functions above are not dispatched element by element by
+    # the choregrapher. As they are closed-form expressions of the radius, length, conductance factors and root hairs of
+    # each element, they are evaluated once per time step over all root elements, the transport barriers being computed
+    # beforehand as in the scalar path.
+
+    def __call__(self, *args):
+        if not self.vectorized_anatomy:
+            return super().__call__(*args)
+        self.pull_available_inputs()
+        self.transport_barriers()
+        self.vectorized_surfaces_and_volumes()
+
+    def surfaces_and_volumes(self, radius, length, exodermis_conductance_factor, endodermis_conductance_factor,
+                             xylem_differentiation_factor, root_hair_length, total_root_hairs_number):
+        """
+        This function computes the exchange surfaces and volumes of root elements from arrays of their properties,
+        giving the same values as the functions _root_exchange_surface, _cortex_exchange_surface,
+        _apoplasmic_exchange_surface, _xylem_exchange_surface, _phloem_exchange_surface, _symplasmic_volume and
+        _xylem_volume.
+        :return: the mapping of the name of each surface or volume to its array over root elements
+        """
+        # The utility function is written with arithmetic operators only, so that it also applies to arrays:
+        root_hairs_surface = self.root_hairs_external_surface(root_hair_length, total_root_hairs_number)
+        cylinder_surface = 2 * pi * radius * length
+        cross_area = pi * (radius ** 2)
+        return {
+            "root_exchange_surface": cylinder_surface * np.maximum(
+                self.cortical_surfacic_fraction * exodermis_conductance_factor
+                + self.stellar_surfacic_fraction * endodermis_conductance_factor, 1.) + root_hairs_surface,
+            "cortex_exchange_surface": cylinder_surface * self.cortical_surfacic_fraction * exodermis_conductance_factor
+                                       + root_hairs_surface,
+            "apoplasmic_exchange_surface": cylinder_surface * endodermis_conductance_factor,
+            "xylem_exchange_surface": cylinder_surface * self.stellar_surfacic_fraction * xylem_differentiation_factor,
+            "phloem_exchange_surface": cylinder_surface * self.phloem_surfacic_fraction,
+            "symplasmic_volume": cross_area * self.apoplasm_cross_area_surfacic_fraction * length,
+            "xylem_volume": cross_area * self.xylem_cross_area_surfacic_fraction * length}
+
+    def vectorized_surfaces_and_volumes(self):
+        """
+        This function computes the exchange surfaces and volumes of all root elements at once (see surfaces_and_volumes)
+        and writes them in the MTG.
+        """
+        vids = list(self.g.vertices_iter(scale=1))
+        names = ["radius", "length", "exodermis_conductance_factor", "endodermis_conductance_factor",
+                 "xylem_differentiation_factor", "root_hair_length", "total_root_hairs_number"]
+        results = self.surfaces_and_volumes(*(gather(getattr(self, name), vids).astype(float) for name in names))
+        for name, values in results.items():
+            scatter(getattr(self, name), vids, values)
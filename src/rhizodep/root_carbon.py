@@ -54,9 +54,7 @@
 #  or very high from one step to another) and to avoid them (by blocking the consumption of the particular pool for example).
 
 import numpy as np
-import pandas as pd
 from math import isnan
-from scipy.integrate import solve_ivp
 from dataclasses import dataclass, field, fields
 import inspect as ins
 from functools import partial
@@ -65,12 +63,15 @@ from math import pi
 from metafspm.component import Model, declare
 from metafspm.component_factory import *
 
+from rhizodep.array_store import gather, scatter
+from rhizodep.root_topology import NewVerticesMixin, HotElementsMixin
+
 
 family = "metabolic"
 
 
 @dataclass
-class RootCarbonModel(Model):
+class RootCarbonModel(Model, NewVerticesMixin, HotElementsMixin):
     """
     Root carbon balance model originating from Rhizodep shoot.py
     TODO adapt differential equation system
@@ -81,6 +82,8 @@ class RootCarbonModel(Model):
     """
 
     family = family
+    # Property whose keys reveal new elements when the log of the growth module is not shared:
+    new_vertices_reference = "C_sucrose_root"
 
     # --- INPUTS STATE VARIABLES FROM OTHER COMPONENTS : default values are provided if not superimposed by model coupling ---
     # FROM SOIL MODEL
@@ -441,6 +444,14 @@ class RootCarbonModel(Model):
                                                 min_value="", max_value="", value_comment="DO A REAL ESTIMATION!", references="", DOI="",
                                                 variable_type="parameter", by="model_carbon", state_variable_type="", edit_by="user")
 
+    # --- INITIALIZES SIMULATION PARAMETERS ---
+    vectorized_processes: bool = declare(default=False, unit="adim", unit_comment="", description="a Boolean expliciting whether rates and states should be computed as array expressions over the whole root system rather than element by element", 
+                                         min_value="", max_value="", value_comment="", references="", DOI="",
+                                          variable_type="simulation_parameter", by="model_carbon", state_variable_type="", edit_by="user")
+    stacked_solver: bool = declare(default=False, unit="adim", unit_comment="", description="a Boolean expliciting whether root hexose pools should be integrated over the time step by a solver on the whole root system (only used if vectorized_processes is True)", 
+                                   min_value="", max_value="", value_comment="", references="", DOI="",
+                                    variable_type="simulation_parameter", by="model_carbon", state_variable_type="", edit_by="user")
+
     def __init__(self, g, time_step: int,  **scenario: dict):
         """
         DESCRIPTION
@@ -470,42 +481,39 @@ class RootCarbonModel(Model):
             Extend property dictionary upon new element partitioning and updates concentrations upon structural_mass change
         """
         self.vertices = self.g.vertices(scale=self.g.max_scale())
-        already_updated = []
+        new_vertices = self.new_vertices()
+        intensive_variables = [prop for prop in self.state_variables
+                               if self.__dataclass_fields__[prop].metadata["state_variable_type"] == "intensive"]
+        extensive_variables = [prop for prop in self.state_variables if prop not in intensive_variables]
+
+        # If the element already exists (NOTE: existing elements are all updated before new elements, as their index
+        # is lower, and the parent of a new element is updated once more with the new element below):
+        new_vids = set(vid for vid, parent in new_vertices)
         for vid in self.vertices:
-            # We ignore already updated elements, e.g. parents of apices
-            if vid in already_updated:
+            if vid in new_vids:
                 continue
-
-            # If we focus on a new element
-            if vid not in list(self.C_sucrose_root.keys()):
-                parent = self.g.parent(vid)
-                for prop in self.state_variables:
-                    # if intensive, equals to parent AFTER it has been updated
-                    if self.__dataclass_fields__[prop].metadata["state_variable_type"] == "intensive":
-                        getattr(self, prop).update({parent: getattr(self, prop)[parent] * (
-                                self.initial_struct_mass[parent] / self.struct_mass[parent])})
-                        getattr(self, prop).update({vid: getattr(self, prop)[parent]})
-                    # if extensive, we need structural mass wise partitioning
-                    else:
-                        # we partition the initial flow in the parent accounting for mass fraction
-                        # We use struct_mass, the resulting structural mass after growth
-                        mass_fraction = self.struct_mass[vid] / (self.struct_mass[vid] + self.struct_mass[parent])
-                        getattr(self, prop).update({vid: getattr(self, prop)[parent] * mass_fraction,
-                                                    parent: getattr(self, prop)[parent] * (1-mass_fraction)})
-                already_updated += [vid, parent]
-
-            # If the element already exists and isn't immediate neighbor of an apex
-            else:
-                # If after growth the element actually grown
-                if self.struct_mass[vid] > 0:
-                    for prop in self.state_variables:
-                        # if intensive, concentrations have to be updated based on new structural mass
-                        if self.__dataclass_fields__[prop].metadata["state_variable_type"] == "intensive":
-                            getattr(self, prop).update({vid: getattr(self, prop)[vid] * (
-                                self.initial_struct_mass[vid] / self.struct_mass[vid])})
-                        # if extensive, it doesn't need to be updated and if parent is segmented,
-
-                already_updated += [vid]
+            # If after growth the element actually grown
+            if self.struct_mass[vid] > 0:
+                for prop in intensive_variables:
+                    # if intensive, concentrations have to be updated based on new structural mass
+                    getattr(self, prop)[vid] *= self.initial_struct_mass[vid] / self.struct_mass[vid]
+                # if extensive, it doesn't need to be updated and if parent is segmented,
+
+        # For each new element, in the order of their creation:
+        for vid, parent in new_vertices:
+            for prop in intensive_variables:
+                # if intensive, equals to parent AFTER it has been updated
+                values = getattr(self, prop)
+                values[parent] = values[parent] * (self.initial_struct_mass[parent] / self.struct_mass[parent])
+                values[vid] = values[parent]
+            # if extensive, we need structural mass wise partitioning
+            # We use struct_mass, the resulting structural mass after growth
+            mass_fraction = self.struct_mass[vid] / (self.struct_mass[vid] + self.struct_mass[parent])
+            for prop in extensive_variables:
+                # we partition the initial flow in the parent accounting for mass fraction
+                values = getattr(self, prop)
+                values[vid] = values[parent] * mass_fraction
+                values[parent] = values[parent] * (1 - mass_fraction)
 
     def total_root_sucrose_and_living_struct_mass(self):
         """
@@ -519,8 +527,8 @@ class RootCarbonModel(Model):
         self.total_sucrose_root[1] = 0.
         self.total_living_struct_mass[1] = 0.
 
-        # We cover all the vertices in the MTG, whether they are dead or not:
-        for vid in self.g.vertices_iter(scale=1):
+        # We cover all the vertices in the MTG that are not frozen, whether they are dead or not:
+        for vid in self.hot_vertices():
             if self.length[vid] <= 0.:
                 continue
             else:
@@ -535,6 +543,15 @@ class RootCarbonModel(Model):
                     # We calculate the total living struct_mass by summing all the local struct_masses:
                     self.total_living_struct_mass[1] += self.struct_mass[vid] + self.living_root_hairs_struct_mass[vid]
 
+        # Frozen dead elements only contribute the sucrose they may have received since the previous spreading, as the
+        # @rate and @state functions of this module are still computed on them:
+        frozen = self.frozen_vertices()
+        if len(frozen) > 0:
+            frozen_sucrose = gather(self.C_sucrose_root, frozen) * (gather(self.struct_mass, frozen)
+                                                                    + gather(self.living_root_hairs_struct_mass, frozen)) \
+                             - gather(self.deficit_sucrose_root, frozen)
+            self.total_sucrose_root[1] += float(frozen_sucrose[gather(self.length, frozen) > 0.].sum())
+
     # Calculating the net input of sucrose by the aerial parts into the root system:
     # ------------------------------------------------------------------------------
     #@totalstate
@@ -582,7 +599,7 @@ class RootCarbonModel(Model):
             new_C_sucrose_root = 0.
         
         # We go through the MTG to modify the sugars concentrations:
-        for vid in self.g.vertices_iter(scale=1):
+        for vid in self.hot_vertices():
             # If the element has not emerged yet, it doesn't contain any sucrose yet;
             # if has died, it should not contain any sucrose anymore:
             if self.length[vid] <= 0. or self.type[vid] == "Dead" or self.type[vid] == "Just_dead":
@@ -595,6 +612,12 @@ class RootCarbonModel(Model):
             # WE RESET ALL LOCAL DEFICITS TO 0:
             self.deficit_sucrose_root[vid] = 0.
 
+        # The sucrose of frozen dead elements, which has been counted in total_sucrose_root, is removed at once:
+        frozen = self.frozen_vertices()
+        if len(frozen) > 0:
+            scatter(self.C_sucrose_root, frozen, np.zeros(len(frozen)))
+            scatter(self.deficit_sucrose_root, frozen, np.zeros(len(frozen)))
+
     # Unloading of sucrose from the phloem and conversion of sucrose into hexose:
 
     # --------------------------------------------------------------------------
@@ -980,6 +1003,281 @@ class RootCarbonModel(Model):
             return balance
     
 
+    # VECTORIZED EXECUTION OF PROCESSES:
+    # ----------------------------------
+    # When vectorized_processes is True, the @rate and @state functions above are not dispatched element by element by
+    # the choregrapher. Instead, their array counterparts below are evaluated once per time step over all root elements.
+    # Each array function reproduces the branches of the corresponding scalar function with masks, so that both paths
+    # return the same values.
+
+    def __call__(self, *args):
+        if not self.vectorized_processes:
+            return super().__call__(*args)
+        self.pull_available_inputs()
+        self.shoot_sucrose_supply_and_spreading()
+        if self.stacked_solver:
+            self.Stacked_Differential_Equation_System(self).run()
+        else:
+            self.vectorized_rates_and_states()
+
+    def temperature_modification_array(self, soil_temperature, process_at_T_ref=1., T_ref=0., A=-0.05, B=3., C=1.):
+        """
+        This function is the array equivalent of temperature_modification, applied to an array of soil temperatures.
+        :param soil_temperature: the array of soil temperatures
+        :param T_ref: the reference temperature
+        :param A: parameter A (may be equivalent to the coefficient of linear increase)
+        :param B: parameter B (may be equivalent to the Q10 value)
+        :param C: parameter C (either 0 or 1)
+        :return: the array of modified processes
+        """
+        soil_temperature = np.asarray(soil_temperature, dtype=float)
+        if C != 0 and C != 1:
+            print("The modification of the process only works for C=0 or C=1!")
+            print("The modified process has been set to 0.")
+            return np.zeros_like(soil_temperature)
+
+        base = A * (soil_temperature - T_ref) + B
+        with np.errstate(invalid="ignore"):
+            modified_process = process_at_T_ref * base ** (1 - C) * base ** (C * (soil_temperature - T_ref) / 10.)
+        if C == 1:
+            modified_process[base < 0.] = 0.
+        modified_process[modified_process < 0.] = 0.
+
+        return modified_process
+
+    def vectorized_rates_and_states(self):
+        """
+        This function computes all the carbon fluxes (@rate) of the root elements as array expressions, then updates
+        the concentrations (@state) and the corresponding deficits in the same way as the scalar functions.
+        """
+        vids, v = self._gather_all()
+
+        rates = self._vectorized_rates(v)
+        states = self._vectorized_states(v, rates)
+
+        for name, values in rates.items():
+            scatter(getattr(self, name), vids, values)
+        for name, values in states.items():
+            scatter(getattr(self, name), vids, values)
+
+    def _gather_all(self):
+        """
+        This function gathers all the properties used by the array functions of the model over all root elements.
+        :return: the list of vids and the mapping of properties to arrays
+        """
+        vids = list(self.g.vertices_iter(scale=1))
+
+        names = ["length", "type", "struct_mass", "living_root_hairs_struct_mass", "radius", "distance_from_tip",
+                 "root_exchange_surface", "phloem_exchange_surface", "apoplasmic_exchange_surface", "symplasmic_volume",
+                 "C_sucrose_root", "C_hexose_root", "C_hexose_reserve", "C_hexose_soil", "Cs_mucilage_soil",
+                 "Cs_cells_soil", "soil_temperature", "hexose_consumption_by_growth", "hexose_consumption_by_fungus",
+                 "deficit_sucrose_root", "deficit_hexose_reserve", "deficit_hexose_root"]
+        v = {name: gather(getattr(self, name), vids) for name in names}
+        for name in names:
+            if name != "type":
+                v[name] = v[name].astype(float)
+        return vids, v
+
+    def _vectorized_rates(self, v):
+        """
+        This function is the array equivalent of all @rate functions of the model.
+        :param v: a mapping of property names to arrays over all root elements
+        :return: a mapping of flux names to arrays
+        """
+        length = v["length"]
+        type = v["type"]
+        dead = (type == "Just_dead") | (type == "Dead")
+        T = v["soil_temperature"]
+        C_sucrose_root = v["C_sucrose_root"]
+        C_hexose_root = v["C_hexose_root"]
+        C_hexose_reserve = v["C_hexose_reserve"]
+        C_hexose_soil = v["C_hexose_soil"]
+        total_mass = v["struct_mass"] + v["living_root_hairs_struct_mass"]
+        root_exchange_surface = v["root_exchange_surface"]
+        phloem_exchange_surface = v["phloem_exchange_surface"]
+        apoplasmic_exchange_surface = v["apoplasmic_exchange_surface"]
+        distance_from_tip = v["distance_from_tip"]
+        radius = v["radius"]
+        rates = {}
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Unloading of sucrose from the phloem (NOTE: as in the scalar functions, the element type is not tested):
+            no_unloading = (length <= 0.) | (phloem_exchange_surface <= 0.) | (C_sucrose_root <= C_hexose_root / 2.)
+            if self.global_sucrose_deficit[1] > 0.:
+                no_unloading[:] = True
+            growth_factor = 1 + v["hexose_consumption_by_growth"] / self.reference_rate_of_hexose_consumption_by_growth
+            unloading_T_effect = self.temperature_modification_array(soil_temperature=T,
+                                                                     T_ref=self.phloem_unloading_T_ref,
+                                                                     A=self.phloem_unloading_A,
+                                                                     B=self.phloem_unloading_B,
+                                                                     C=self.phloem_unloading_C)
+            phloem_permeability = self.phloem_permeability * growth_factor * unloading_T_effect
+            rates["hexose_diffusion_from_phloem"] = np.where(no_unloading, 0., np.maximum(
+                2. * phloem_permeability * (C_sucrose_root - C_hexose_root / 2.) * phloem_exchange_surface, 0))
+            max_unloading_rate = self.max_unloading_rate * growth_factor * unloading_T_effect
+            rates["hexose_active_production_from_phloem"] = np.where(no_unloading, 0., np.maximum(
+                2. * max_unloading_rate * C_sucrose_root * phloem_exchange_surface / (self.Km_unloading + C_sucrose_root),
+                0))
+
+            # Loading of sucrose in the phloem:
+            max_loading_rate = self.max_loading_rate * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.max_loading_rate_T_ref,
+                                                                        A=self.max_loading_rate_A,
+                                                                        B=self.max_loading_rate_B,
+                                                                        C=self.max_loading_rate_C)
+            rates["sucrose_loading_in_phloem"] = np.where(C_hexose_root <= 0., 0., np.maximum(
+                0.5 * max_loading_rate * phloem_exchange_surface * C_hexose_root / (self.Km_loading + C_hexose_root), 0.))
+
+            # Reserve mobilization and immobilization:
+            no_mobilization = (length <= 0.) | (C_hexose_root < 0.) | (C_hexose_reserve < 0.) \
+                              | (type == "Root_nodule") | (C_hexose_reserve <= self.C_hexose_reserve_min)
+            corrected_max_mobilization_rate = self.max_mobilization_rate * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.max_mobilization_rate_T_ref,
+                                                                        A=self.max_mobilization_rate_A,
+                                                                        B=self.max_mobilization_rate_B,
+                                                                        C=self.max_mobilization_rate_C)
+            rates["hexose_mobilization_from_reserve"] = np.where(no_mobilization, 0.,
+                corrected_max_mobilization_rate * C_hexose_reserve / (self.Km_mobilization + C_hexose_reserve) * total_mass)
+
+            no_immobilization = (C_hexose_root <= self.C_hexose_root_min_for_reserve) \
+                                | (C_hexose_reserve >= self.C_hexose_reserve_max) | dead
+            corrected_max_immobilization_rate = self.max_immobilization_rate * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.max_immobilization_rate_T_ref,
+                                                                        A=self.max_immobilization_rate_A,
+                                                                        B=self.max_immobilization_rate_B,
+                                                                        C=self.max_immobilization_rate_C)
+            rates["hexose_immobilization_as_reserve"] = np.where(no_immobilization, 0.,
+                corrected_max_immobilization_rate * C_hexose_root / (self.Km_immobilization + C_hexose_root) * total_mass)
+
+            # Maintenance respiration:
+            corrected_resp_maintenance_max = self.resp_maintenance_max * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.resp_maintenance_max_T_ref,
+                                                                        A=self.resp_maintenance_max_A,
+                                                                        B=self.resp_maintenance_max_B,
+                                                                        C=self.resp_maintenance_max_C)
+            rates["maintenance_respiration"] = np.where((type == "Dead") | (C_hexose_root <= 0.), 0.,
+                corrected_resp_maintenance_max * C_hexose_root / (self.Km_maintenance + C_hexose_root) * total_mass)
+
+            # Exudation of hexose from the root and from the phloem:
+            no_exudation = (length <= 0) | (root_exchange_surface <= 0.) | (C_hexose_root <= 0.)
+            corrected_permeability_coeff = self.Pmax_apex * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.permeability_coeff_T_ref,
+                                                                        A=self.permeability_coeff_A,
+                                                                        B=self.permeability_coeff_B,
+                                                                        C=self.permeability_coeff_C)
+            rates["hexose_exudation"] = np.where(no_exudation, 0., np.maximum(corrected_permeability_coeff * (
+                (C_hexose_root * v["struct_mass"] / v["symplasmic_volume"]) - C_hexose_soil) * root_exchange_surface, 0))
+            rates["phloem_hexose_exudation"] = np.where(no_exudation, 0., corrected_permeability_coeff * (
+                (2 * C_sucrose_root * v["struct_mass"] / v["symplasmic_volume"]) - C_hexose_soil)
+                * apoplasmic_exchange_surface)
+
+            # Uptake of hexose from the soil:
+            corrected_uptake_rate_max = self.uptake_rate_max * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.uptake_rate_max_T_ref,
+                                                                        A=self.uptake_rate_max_A,
+                                                                        B=self.uptake_rate_max_B,
+                                                                        C=self.uptake_rate_max_C)
+            uptake_affinity = C_hexose_soil / (self.Km_uptake + C_hexose_soil)
+            rates["hexose_uptake_from_soil"] = np.where(
+                (length <= 0) | (root_exchange_surface <= 0.) | (C_hexose_soil <= 0.) | dead, 0.,
+                corrected_uptake_rate_max * root_exchange_surface * uptake_affinity)
+            rates["phloem_hexose_uptake_from_soil"] = np.where(
+                (length <= 0) | (apoplasmic_exchange_surface <= 0.) | (C_hexose_soil <= 0.) | dead, 0.,
+                corrected_uptake_rate_max * apoplasmic_exchange_surface * uptake_affinity)
+
+            # Mucilage secretion:
+            no_secretion = (length <= 0) | (root_exchange_surface <= 0.) | (C_hexose_root <= 0.) \
+                           | (type == "Dead") | (type == "Stopped") | (distance_from_tip < length)
+            corrected_secretion_rate_max = self.secretion_rate_max * self.temperature_modification_array(
+                                                                        soil_temperature=T,
+                                                                        T_ref=self.secretion_rate_max_T_ref,
+                                                                        A=self.secretion_rate_max_A,
+                                                                        B=self.secretion_rate_max_B,
+                                                                        C=self.secretion_rate_max_C
+            ) / ((1 + (distance_from_tip - length / 2.) / radius) ** self.gamma_secretion) \
+                * (self.Cs_mucilage_soil_max - v["Cs_mucilage_soil"]) / self.Cs_mucilage_soil_max
+            rates["mucilage_secretion"] = np.where(no_secretion, 0., np.maximum(
+                corrected_secretion_rate_max * root_exchange_surface * C_hexose_root / (self.Km_secretion + C_hexose_root),
+                0.))
+
+            # Release of root cells:
+            growing_zone_length = self.growing_zone_factor * radius
+            within_growing_zone = distance_from_tip < growing_zone_length
+            crossing_growing_zone = ~within_growing_zone & (distance_from_tip - length < growing_zone_length)
+            average_distance = np.where(within_growing_zone, distance_from_tip - length / 2.,
+                                        (distance_from_tip - length)
+                                        + (growing_zone_length - (distance_from_tip - length)) / 2.)
+            reduction = (growing_zone_length - average_distance) / growing_zone_length
+            corrected_cells_surfacic_release = self.surfacic_cells_release_rate * reduction \
+                * self.temperature_modification_array(soil_temperature=T,
+                                                      T_ref=self.surfacic_cells_release_rate_T_ref,
+                                                      A=self.surfacic_cells_release_rate_A,
+                                                      B=self.surfacic_cells_release_rate_B,
+                                                      C=self.surfacic_cells_release_rate_C) \
+                * (self.Cs_cells_soil_max - v["Cs_cells_soil"]) / self.Cs_cells_soil_max
+            no_release = (length <= 0) | (root_exchange_surface <= 0.) | (C_hexose_root <= 0.) | dead \
+                         | (type == "Stopped") | ~(within_growing_zone | crossing_growing_zone)
+            rates["cells_release"] = np.where(no_release, 0.,
+                                              np.maximum(root_exchange_surface * corrected_cells_surfacic_release, 0.))
+
+        return rates
+
+    def _vectorized_states(self, v, rates):
+        """
+        This function is the array equivalent of the @state functions of the model, including the update of deficits.
+        :param v: a mapping of property names to arrays over all root elements
+        :param rates: the mapping of fluxes returned by _vectorized_rates
+        :return: a mapping of concentration and deficit names to arrays
+        """
+        total_mass = v["struct_mass"] + v["living_root_hairs_struct_mass"]
+        balances = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            balances["C_sucrose_root"] = v["C_sucrose_root"] + (self.time_step / total_mass) * (
+                - rates["hexose_diffusion_from_phloem"] / 2.
+                - rates["hexose_active_production_from_phloem"] / 2.
+                - rates["phloem_hexose_exudation"] / 2.
+                + rates["sucrose_loading_in_phloem"]
+                + rates["phloem_hexose_uptake_from_soil"] / 2.
+                - v["deficit_sucrose_root"])
+            balances["C_hexose_reserve"] = v["C_hexose_reserve"] + (self.time_step / total_mass) * (
+                rates["hexose_immobilization_as_reserve"]
+                - rates["hexose_mobilization_from_reserve"]
+                - v["deficit_hexose_reserve"])
+            balances["C_hexose_root"] = v["C_hexose_root"] + (self.time_step / total_mass) * (
+                - rates["hexose_exudation"]
+                + rates["hexose_uptake_from_soil"]
+                - rates["mucilage_secretion"]
+                - rates["cells_release"]
+                - rates["maintenance_respiration"] / 6.
+                - v["hexose_consumption_by_growth"]
+                - v["hexose_consumption_by_fungus"]
+                + rates["hexose_diffusion_from_phloem"]
+                + rates["hexose_active_production_from_phloem"]
+                - 2. * rates["sucrose_loading_in_phloem"]
+                + rates["hexose_mobilization_from_reserve"]
+                - rates["hexose_immobilization_as_reserve"]
+                - v["deficit_hexose_root"])
+
+        states = {}
+        for concentration, deficit_name in (("C_sucrose_root", "deficit_sucrose_root"),
+                                            ("C_hexose_reserve", "deficit_hexose_reserve"),
+                                            ("C_hexose_root", "deficit_hexose_root")):
+            balance = balances[concentration]
+            negative = balance < 0
+            deficit = np.where(negative, - balance * total_mass / self.time_step, 0.)
+            deficit = np.where(deficit > 1e-20, deficit, 0.)
+            states[deficit_name] = deficit
+            states[concentration] = np.where(negative, 0., balance)
+
+        return states
+
+
     def check_balance(self):
         """
         This function computes carbon balance and it is aligned with fluxes integration.
@@ -1279,6 +1577,9 @@ class RootCarbonModel(Model):
             accuracy of the solution.
             """
 
+            # SciPy is only imported when the solver is first used:
+            from scipy.integrate import solve_ivp
+
             # We first initialize y before running the solver:
             self._update_initial_conditions()
 
@@ -1302,6 +1603,7 @@ class RootCarbonModel(Model):
             # OPTIONAL: We can print the results of the different iterations at some of the micro time steps!
             if self.printing_solver_outputs:
                 try:
+                    import pandas as pd
                     # print(self.n.type, "-", self.n.label, "-", self.n.index())
                     solver_times = pd.DataFrame(sol.t)
                     solver_times.columns = ['Time']
@@ -1330,6 +1632,225 @@ class RootCarbonModel(Model):
 
             return
 
+    # Solving the C balance of the whole root system at once:
+    # --------------------------------------------------------
+    class Stacked_Differential_Equation_System(object):
+
+        def __init__(self, model, time_step=None, method='LSODA', min_step=60, rtol=1e-3, atol=1e-15):
+            """
+            This class is used to solve the system of differential equations corresponding to the evolution of the
+            amounts in each pool for all the root elements at once. Unlike Differential_Equation_System, the pools of all
+            elements are stacked in a single vector, the fluxes are computed by the array functions of the model, and the
+            exchanged amounts are accumulated in arrays instead of properties of the MTG nodes.
+            As each element only exchanges with the phloem and with the soil, whose concentrations are both held
+            constant over the time step (soil concentrations being updated afterwards by the soil module from the mean
+            rates of exchange), the Jacobian of the system is block-diagonal, and is given to the solver as a sparse
+            matrix.
+            :param model: the RootCarbonModel whose properties are used and updated
+            :param time_step: the time step over which new amounts/concentrations will be updated (by default, the one
+            of the model)
+            :param method: the integration method of solve_ivp ('LSODA', with a banded Jacobian, or 'BDF' and 'Radau',
+            with a sparse Jacobian)
+            :param min_step: the minimal micro time step of 'LSODA' (s)
+            :param rtol: the relative tolerance of the solver
+            :param atol: the absolute tolerance of the solver (mol)
+            """
+            self.model = model
+            self.time_step = model.time_step if time_step is None else time_step
+            self.method = method
+            self.min_step = min_step
+            self.rtol = rtol
+            self.atol = atol
+
+            # We define the list of variables for which derivatives will be integrated, which correspond here to
+            # the quantities in each pool of the root (NOTE: we voluntarily exclude the sucrose pool in the phloem):
+            self.variables_in_the_system = ['hexose_root',
+                                            'hexose_reserve']
+            # We define the list of exchanged amounts that we want to record over the time step, which correspond to the
+            # fluxes computed by the model:
+            self.variables_not_in_the_system = ['hexose_diffusion_from_phloem',
+                                                'hexose_active_production_from_phloem',
+                                                'sucrose_loading_in_phloem',
+                                                'hexose_mobilization_from_reserve',
+                                                'hexose_immobilization_as_reserve',
+                                                'maintenance_respiration',
+                                                'hexose_exudation',
+                                                'phloem_hexose_exudation',
+                                                'hexose_uptake_from_soil',
+                                                'phloem_hexose_uptake_from_soil',
+                                                'mucilage_secretion',
+                                                'cells_release']
+
+            self.y_variables = self.variables_in_the_system + self.variables_not_in_the_system
+            self.y_variables_mapping = {name: index for index, name in enumerate(self.y_variables)}
+
+        def _jacobian_blocks(self, t, y):
+            """
+            This internal function computes the non-zero blocks of the Jacobian of the system by finite differences.
+            As the derivatives of the variables of an element only depend on the pools of this element, the same pool of
+            all elements can be perturbed at once, so that only one evaluation of the derivatives is needed per pool.
+            :return: a list containing, for each pool, the array of derivatives of all variables of each element with
+            respect to this pool in this element
+            """
+            n_variables = len(self.y_variables)
+            f0 = self._C_fluxes_derivatives(t, y).reshape(self.n_elements, n_variables)
+            amounts = y.reshape(self.n_elements, n_variables)
+            blocks = []
+            for j in range(len(self.variables_in_the_system)):
+                h = np.maximum(np.sqrt(np.finfo(float).eps) * np.abs(amounts[:, j]), self.atol)
+                perturbed = amounts.copy()
+                perturbed[:, j] += h
+                df = (self._C_fluxes_derivatives(t, perturbed.ravel()).reshape(self.n_elements, n_variables) - f0) \
+                     / h[:, None]
+                blocks.append(df)
+            return blocks
+
+        def _sparse_jacobian(self, t, y):
+            """
+            This internal function returns the block-diagonal Jacobian as a sparse matrix (for 'BDF' and 'Radau').
+            """
+            from scipy import sparse
+
+            n_variables = len(self.y_variables)
+            first_rows = np.arange(self.n_elements) * n_variables
+            rows, columns, values = [], [], []
+            for j, df in enumerate(self._jacobian_blocks(t, y)):
+                rows.append((first_rows[:, None] + np.arange(n_variables)).ravel())
+                columns.append(np.repeat(first_rows + j, n_variables))
+                values.append(df.ravel())
+            size = self.n_elements * n_variables
+            return sparse.csc_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                                     shape=(size, size))
+
+        def _banded_jacobian(self, t, y):
+            """
+            This internal function returns the block-diagonal Jacobian in the banded storage used by 'LSODA', where
+            jac[upper_band + i - j, j] is the derivative of variable i with respect to variable j.
+            """
+            n_variables = len(self.y_variables)
+            lower_band, upper_band = self.bands
+            banded = np.zeros((lower_band + upper_band + 1, self.n_elements * n_variables))
+            for j, df in enumerate(self._jacobian_blocks(t, y)):
+                for r in range(n_variables):
+                    banded[upper_band + r - j, j::n_variables] = df[:, r]
+            return banded
+
+        @property
+        def bands(self):
+            """
+            The lower and upper bandwidths of the Jacobian: within the block of an element, the derivatives of all
+            variables only depend on the pools, which are the first variables of the block.
+            """
+            return len(self.y_variables) - 1, len(self.variables_in_the_system) - 1
+
+        def _concentrations(self, y):
+            """
+            This function computes the concentrations used by the fluxes from the amounts stacked in y.
+            """
+            amounts = y.reshape(self.n_elements, len(self.y_variables))
+            # AVOIDING NEGATIVE AMOUNTS: negative pools are considered as empty when computing fluxes, and the
+            # corresponding deficits are defined at the end of the time step:
+            hexose_root = np.maximum(amounts[:, self.y_variables_mapping['hexose_root']], 0.)
+            hexose_reserve = np.maximum(amounts[:, self.y_variables_mapping['hexose_reserve']], 0.)
+            v = dict(self.v)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                v["C_hexose_root"] = np.where(self.mass > 0., hexose_root / self.mass, 0.)
+                v["C_hexose_reserve"] = np.where(self.mass > 0., hexose_reserve / self.mass, 0.)
+            return v
+
+        def _C_fluxes_derivatives(self, t, y):
+            """
+            This internal function computes the derivative of the vector y (containing the amounts in the different pools
+            of all elements) at `t`.
+            :return: The derivatives of `y` at `t`.
+            """
+            v = self._concentrations(y)
+            rates = self.model._vectorized_rates(v)
+
+            derivatives = np.zeros((self.n_elements, len(self.y_variables)))
+            mapping = self.y_variables_mapping
+            derivatives[:, mapping['hexose_root']] = (- rates["hexose_exudation"]
+                                                      + rates["hexose_uptake_from_soil"]
+                                                      - rates["mucilage_secretion"]
+                                                      - rates["cells_release"]
+                                                      - rates["maintenance_respiration"] / 6.
+                                                      - v["hexose_consumption_by_growth"]
+                                                      - v["hexose_consumption_by_fungus"]
+                                                      + rates["hexose_diffusion_from_phloem"]
+                                                      + rates["hexose_active_production_from_phloem"]
+                                                      - 2. * rates["sucrose_loading_in_phloem"]
+                                                      + rates["hexose_mobilization_from_reserve"]
+                                                      - rates["hexose_immobilization_as_reserve"])
+            derivatives[:, mapping['hexose_reserve']] = (rates["hexose_immobilization_as_reserve"]
+                                                         - rates["hexose_mobilization_from_reserve"])
+            for variable_name in self.variables_not_in_the_system:
+                derivatives[:, mapping[variable_name]] = rates[variable_name]
+
+            return derivatives.ravel()
+
+        def run(self):
+            """
+            This function gathers the properties of all root elements, solves the stacked system over the time step,
+            and updates the concentrations, the mean rates of exchange over the time step and the deficits.
+            :return: the mapping of final amounts (mol) for each variable of the system, as arrays over root elements
+            """
+            model = self.model
+            vids, self.v = model._gather_all()
+            self.n_elements = len(vids)
+            self.mass = self.v["struct_mass"] + self.v["living_root_hairs_struct_mass"]
+
+            # We first initialize y, calculating the amount in each pool from its initial concentration, from which the
+            # deficit carried over from the previous time step is removed, as in the @state functions:
+            y0 = np.zeros((self.n_elements, len(self.y_variables)))
+            y0[:, self.y_variables_mapping['hexose_root']] = self.v["C_hexose_root"] * self.mass \
+                                                             - self.v["deficit_hexose_root"] * self.time_step
+            y0[:, self.y_variables_mapping['hexose_reserve']] = self.v["C_hexose_reserve"] * self.mass \
+                                                                - self.v["deficit_hexose_reserve"] * self.time_step
+
+            from scipy.integrate import solve_ivp
+
+            if self.method == 'LSODA':
+                # As in Differential_Equation_System, a minimal micro time step can be imposed to LSODA:
+                lower_band, upper_band = self.bands
+                options = dict(jac=self._banded_jacobian, lband=lower_band, uband=upper_band, min_step=self.min_step)
+            else:
+                options = dict(jac=self._sparse_jacobian)
+            sol = solve_ivp(fun=self._C_fluxes_derivatives,
+                            t_span=(0., self.time_step),
+                            y0=y0.ravel(),
+                            method=self.method,
+                            t_eval=np.array([self.time_step]),
+                            rtol=self.rtol,
+                            atol=self.atol,
+                            **options)
+            if not sol.success:
+                print("   > PROBLEM: the stacked solver failed with the following message:", sol.message)
+
+            final_amounts = sol.y[:, -1].reshape(self.n_elements, len(self.y_variables))
+            results = {name: final_amounts[:, index] for name, index in self.y_variables_mapping.items()}
+
+            # We calculate the overall mean rate of exchange over the whole time step:
+            mean_rates = {name: results[name] / self.time_step for name in self.variables_not_in_the_system}
+            for name, values in mean_rates.items():
+                scatter(getattr(model, name), vids, values)
+
+            # New concentrations are calculated from the final amounts, and negative amounts are recorded as deficits:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for pool, concentration, deficit in (('hexose_root', 'C_hexose_root', 'deficit_hexose_root'),
+                                                     ('hexose_reserve', 'C_hexose_reserve', 'deficit_hexose_reserve')):
+                    amount = results[pool]
+                    scatter(getattr(model, concentration), vids, np.where((amount > 0.) & (self.mass > 0.),
+                                                                          amount / self.mass, 0.))
+                    deficit_rate = np.where(amount < 0., - amount / self.time_step, 0.)
+                    scatter(getattr(model, deficit), vids, np.where(deficit_rate > 1e-20, deficit_rate, 0.))
+
+            # The sucrose pool, which is not integrated by the solver, is updated with the mean rates:
+            states = model._vectorized_states(self.v, mean_rates)
+            scatter(model.C_sucrose_root, vids, states["C_sucrose_root"])
+            scatter(model.deficit_sucrose_root, vids, states["deficit_sucrose_root"])
+
+            return results
+
     # Performing a complete C balance on each root element:
     # ------------------------------------------------------
     # NOTE: The function alls all processes of C exchange between pools on each root element and performs a new C balance,
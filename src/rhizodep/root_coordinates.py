@@ -0,0 +1,232 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.root_coordinates
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.root_coordinates` computes the spatial coordinates of root elements without PlantGL.
+
+    It reproduces the movement of the turtle described in tools.get_root_visitor (rotation by angle_down and angle_roll,
+    gravitropism through the elasticity of the turtle, and displacement along the element length) with NumPy arrays,
+    and writes the coordinates of both ends of each element into the properties x1, y1, z1, x2, y2 and z2 of the MTG.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import numpy as np
+
+from rhizodep.array_store import gather
+
+
+def rotate(vectors, axes, angles):
+    """
+    This function rotates an array of 3D vectors around an array of unit axes by an array of angles (Rodrigues' formula).
+    :param vectors: array of shape (n, 3)
+    :param axes: array of unit vectors of shape (n, 3)
+    :param angles: array of angles in radians of shape (n,)
+    :return: the array of rotated vectors
+    """
+    cos = np.cos(angles)[:, None]
+    sin = np.sin(angles)[:, None]
+    dot = np.sum(axes * vectors, axis=1)[:, None]
+    return vectors * cos + np.cross(axes, vectors) * sin + axes * dot * (1. - cos)
+
+
+class RootCoordinates:
+    """
+    DESCRIPTION
+    -----------
+    Headless turtle computing the coordinates of root elements.
+
+    Like the PlantGL turtle used by tools.plot_mtg, each element starts from the position and orientation of the turtle
+    at the end of its parent element, whether it belongs to the same axis or to a lateral one. The frame of each element
+    is cached, so that a call to update() only recomputes the elements whose length, angles, radius or type changed
+    since the previous call, together with the subtrees they carry.
+    """
+
+    # Initial frame of the PlantGL turtle (heading, left, up):
+    initial_heading = np.array([0., 0., 1.])
+    initial_left = np.array([0., -1., 0.])
+    initial_up = np.array([1., 0., 0.])
+    # Direction of gravitropism:
+    tropism = np.array([0., 0., -1.])
+
+    def __init__(self, g, gravitropism_coefficient=0.06, zoom_factor=1.):
+        """
+        :param g: the root MTG
+        :param gravitropism_coefficient: the coefficient defining the elasticity of the turtle, i.e. the intensity of
+        gravitropism, for an element with the same original radius as the base of the root system
+        :param zoom_factor: a factor for displaying the length and radius X times larger than in reality
+        """
+        self.g = g
+        self.gravitropism_coefficient = gravitropism_coefficient
+        self.zoom_factor = zoom_factor
+
+        self.row_of = {}
+        self.vids = np.zeros(0, dtype=np.int64)
+        self.parent_row = np.zeros(0, dtype=np.int64)
+        self.depth = np.zeros(0, dtype=np.int64)
+        self.signature = np.zeros((0, 4))
+        self.nodule = np.zeros(0, dtype=bool)
+        self.start = np.zeros((0, 3))
+        self.end = np.zeros((0, 3))
+        self.heading = np.zeros((0, 3))
+        self.left = np.zeros((0, 3))
+        self.up = np.zeros((0, 3))
+        self.reference_radius = None
+        self._levels = None
+
+    def _register_new_vertices(self):
+        """
+        This function allocates a row for each vertex that appeared in the MTG since the previous update, making sure
+        that parents are always registered before their children.
+        :return: the number of new rows
+        """
+        g = self.g
+        new_vids, new_parent_rows, new_depths = [], [], []
+        for vid in g.vertices(scale=g.max_scale()):
+            if vid in self.row_of:
+                continue
+            # We register missing ancestors first:
+            lineage = [vid]
+            parent = g.parent(vid)
+            while parent is not None and parent not in self.row_of:
+                lineage.append(parent)
+                parent = g.parent(parent)
+            for v in reversed(lineage):
+                parent = g.parent(v)
+                row = len(self.vids) + len(new_vids)
+                self.row_of[v] = row
+                if parent is None:
+                    new_parent_rows.append(-1)
+                    new_depths.append(0)
+                else:
+                    parent_row = self.row_of[parent]
+                    new_parent_rows.append(parent_row)
+                    if parent_row < len(self.vids):
+                        new_depths.append(self.depth[parent_row] + 1)
+                    else:
+                        new_depths.append(new_depths[parent_row - len(self.vids)] + 1)
+                new_vids.append(v)
+
+        n_new = len(new_vids)
+        if n_new > 0:
+            self.vids = np.concatenate((self.vids, np.array(new_vids, dtype=np.int64)))
+            self.parent_row = np.concatenate((self.parent_row, np.array(new_parent_rows, dtype=np.int64)))
+            self.depth = np.concatenate((self.depth, np.array(new_depths, dtype=np.int64)))
+            self.signature = np.concatenate((self.signature, np.full((n_new, 4), np.nan)))
+            self.nodule = np.concatenate((self.nodule, np.zeros(n_new, dtype=bool)))
+            for name in ("start", "end", "heading", "left", "up"):
+                setattr(self, name, np.concatenate((getattr(self, name), np.zeros((n_new, 3)))))
+            # Rows grouped by depth have to be recomputed:
+            self._levels = None
+        return n_new
+
+    def _rows_by_level(self):
+        """
+        This function returns the list of row arrays sharing the same depth, from the base to the deepest elements.
+        """
+        if self._levels is None:
+            order = np.argsort(self.depth, kind="stable")
+            boundaries = np.flatnonzero(np.diff(self.depth[order])) + 1
+            self._levels = np.split(order, boundaries)
+        return self._levels
+
+    def update(self):
+        """
+        This function updates the coordinates of all elements whose geometry changed since the previous call.
+        :return: the array of vids whose coordinates have been recomputed
+        """
+        self._register_new_vertices()
+        props = self.g.properties()
+
+        vid_list = self.vids.tolist()
+        signature = np.column_stack([gather(props.get(name, {}), vid_list, default).astype(float)
+                                     for name, default in (("length", 0.), ("angle_down", 0.), ("angle_roll", 0.),
+                                                           ("original_radius", 1.))])
+        nodule = gather(props.get("type", {}), vid_list, None) == "Root_nodule"
+
+        # As in get_root_visitor, the elasticity is defined relatively to the original radius of the base element:
+        base_vid = 1 if 1 in self.row_of else int(self.vids[0])
+        reference_radius = signature[self.row_of[base_vid], 3]
+        if reference_radius != self.reference_radius:
+            changed = np.ones(len(self.vids), dtype=bool)
+            self.reference_radius = reference_radius
+        else:
+            # NOTE: new rows have a NaN signature, and therefore always differ.
+            changed = np.any(signature != self.signature, axis=1) | (nodule != self.nodule)
+        self.signature = signature
+        self.nodule = nodule
+
+        if not changed.any():
+            return np.zeros(0, dtype=np.int64)
+
+        # Any change in an element is propagated to all the elements it carries:
+        levels = self._rows_by_level()
+        for rows in levels[1:]:
+            changed[rows] |= changed[self.parent_row[rows]]
+
+        for rows in levels:
+            rows = rows[changed[rows]]
+            if len(rows) > 0:
+                self._move_turtle(rows)
+
+        updated_rows = np.flatnonzero(changed)
+        updated_vids = self.vids[updated_rows].tolist()
+        for i, name in enumerate(("x1", "y1", "z1")):
+            props.setdefault(name, {}).update(zip(updated_vids, (self.start[updated_rows, i] / self.zoom_factor).tolist()))
+        for i, name in enumerate(("x2", "y2", "z2")):
+            props.setdefault(name, {}).update(zip(updated_vids, (self.end[updated_rows, i] / self.zoom_factor).tolist()))
+
+        return self.vids[updated_rows]
+
+    def _move_turtle(self, rows):
+        """
+        This function computes the frame and the coordinates of a set of elements whose parents are already up to date.
+        :param rows: the rows of the elements, which must all have the same depth
+        """
+        n = len(rows)
+        parent_rows = self.parent_row[rows]
+        is_base = parent_rows < 0
+        position = np.where(is_base[:, None], 0., self.end[parent_rows])
+        heading = np.where(is_base[:, None], self.initial_heading, self.heading[parent_rows])
+        left = np.where(is_base[:, None], self.initial_left, self.left[parent_rows])
+        up = np.where(is_base[:, None], self.initial_up, self.up[parent_rows])
+        if is_base.any():
+            # The whole root system is made upside down:
+            angle = np.where(is_base, np.pi, 0.)
+            heading, up = rotate(heading, left, angle), rotate(up, left, angle)
+
+        length = self.signature[rows, 0] * self.zoom_factor
+        angle_down = np.radians(self.signature[rows, 1])
+        angle_roll = np.radians(self.signature[rows, 2])
+        original_radius = self.signature[rows, 3]
+
+        # The direction of the turtle is changed:
+        heading, up = rotate(heading, left, angle_down), rotate(up, left, angle_down)
+        left, up = rotate(left, heading, angle_roll), rotate(up, heading, angle_roll)
+
+        # Tropism is then taken into account, as the turtle bends its heading towards the tropism direction by an angle
+        # proportional to its elasticity and to the sine of the angle between heading and tropism:
+        elasticity = self.gravitropism_coefficient * (original_radius / self.reference_radius)
+        axis = np.cross(heading, np.broadcast_to(self.tropism, (n, 3)))
+        norm = np.linalg.norm(axis, axis=1)
+        bending = (elasticity > 0.) & (norm > 1e-12)
+        if bending.any():
+            axis = axis[bending] / norm[bending][:, None]
+            alpha = elasticity[bending] * norm[bending]
+            heading[bending] = rotate(heading[bending], axis, alpha)
+            left[bending] = rotate(left[bending], axis, alpha)
+            up[bending] = rotate(up[bending], axis, alpha)
+
+        # The turtle is moved (nodules are spheres placed at the end of their parent element).
+        # NOTE: get_root_visitor moves the turtle with F() for nodules, i.e. by the default step of the PlantGL turtle
+        # whatever the length of the nodule, so that x2, y2, z2 of nodules differ from those previously computed with
+        # PlantGL. Here, nodules have no length, and both ends of a nodule are at its insertion point.
+        length = np.where(self.nodule[rows], 0., length)
+        self.start[rows] = position
+        self.end[rows] = position + heading * length[:, None]
+        self.heading[rows] = heading
+        self.left[rows] = left
+        self.up[rows] = up
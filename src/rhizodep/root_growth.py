@@ -12,17 +12,18 @@
 
 import os
 import numpy as np
-import pandas as pd
 from math import sqrt, pi, floor
 from dataclasses import dataclass
 
 from openalea.mtg import *
-from openalea.mtg.traversal import post_order
-from openalea.mtg import turtle as turt
 
 from metafspm.component import Model, declare
 from metafspm.component_factory import *
 
+from rhizodep.array_store import ArrayPropertyStore
+from rhizodep.root_topology import RootTopology, ApexRegistry, ElementPartition
+from rhizodep.random_streams import RandomStreams
+
 
 family = "growth"
 
@@ -317,6 +318,9 @@ class RootGrowthModel(Model):
     root_order_treshold: int = declare(default=2, unit="adim", unit_comment="", description="the root order above which new lateral roots cannot be formed", 
                                                     min_value="", max_value="", value_comment="", references="", DOI="",
                                                     variable_type="simulation_parameter", by="model_growth", state_variable_type="", edit_by="user")
+    array_properties: bool = declare(default=False, unit="adim", unit_comment="", description="a Boolean expliciting whether MTG properties should be stored in contiguous arrays (see rhizodep.array_store)", 
+                                                    min_value="", max_value="", value_comment="", references="", DOI="",
+                                                    variable_type="simulation_parameter", by="model_growth", state_variable_type="", edit_by="user")
 
     def __init__(self, g=None, time_step_in_seconds: int=3600, **scenario: dict):
         """
@@ -330,11 +334,34 @@ class RootGrowthModel(Model):
         """
         # Before any other operation, we apply the provided scenario by changing default parameters and initialization
         self.apply_scenario(**scenario)
-        
+
+        # Random numbers are drawn from counter-based streams keyed by the random seed, the element and the purpose.
+        # NOTE: unlike the fungal infection, growth draws are not keyed by the time step, as in the former seeding with
+        # random_choice * index: segmentation and nodule formation concern new elements, and the lateral root drawn for
+        # an apex must not depend on the number of time steps elapsed before it could be formed, so that architectures
+        # do not change with the resolution of the time step.
+        self.random_streams = RandomStreams(seed=self.random_choice)
+
+        # Log of (new_vid, parent_vid) for every element created by ADDING_A_CHILD during the current time step:
+        self.new_vertices_log = []
+        # Topology arrays shared by traversal-based processes, rebuilt only after ADDING_A_CHILD changed the MTG:
+        self._topology = None
+        # Apices of the MTG indexed by state, updated on every transition (see rhizodep.root_topology):
+        self.apices = ApexRegistry()
+        # Elements still visited by per-element loops, dead elements being frozen (see rhizodep.root_topology):
+        self.elements = ElementPartition()
+
         if g is None:
             self.g = self.initiate_mtg()
         else:
             self.g = g
+        self.apices.rebuild(self.g)
+        self.elements.rebuild(self.g)
+
+        # If required, properties are converted to columns before any module links itself to the MTG, so that every
+        # property created afterwards is also columnar:
+        if self.array_properties:
+            self.property_store = ArrayPropertyStore.attach(self.g)
 
         self.props = self.g.properties()
         self.time_step_in_seconds = time_step_in_seconds
@@ -362,6 +389,16 @@ class RootGrowthModel(Model):
                 self.props[name].update({key: getattr(self, name) for key in self.vertices})
                 setattr(self, name, self.props[name])
 
+    @property
+    def topology(self):
+        """
+        Topology arrays of the root MTG (see rhizodep.root_topology), computed once and shared by all traversal-based
+        processes until ADDING_A_CHILD modifies the MTG.
+        """
+        if self._topology is None:
+            self._topology = RootTopology(self.g)
+        return self._topology
+
     def initiate_mtg(self):
         """
         This functions generates a root MTG from nothing, containing only one segment of a specific length,
@@ -474,6 +511,9 @@ class RootGrowthModel(Model):
         # If there is more than one seminal root (i.e. roots already formed in the seed):
         if self.n_seminal_roots > 1 or not self.forcing_seminal_roots_events:
 
+            # pandas is only imported when a table of emergence events has to be read or built:
+            import pandas as pd
+
             # We read additional parameters that are stored in a CSV file, with one column containing the delay for each
             # emergence event, and the second column containing the number of seminal roots that have to emerge at each event:
             # We try to access an already-existing CSV file:
@@ -503,8 +543,10 @@ class RootGrowthModel(Model):
                 # For each seminal root that can emerge at this emergence event:
                 for j in range(0, seminal_inputs_file.number_of_seminal_roots_per_event[i]):
 
-                    # We make sure that the seminal roots will have different random insertion angles:
-                    np.random.seed(self.random_choice + i * j)
+                    # We make sure that the seminal roots will have different random insertion angles, by drawing
+                    # numbers for the segment on which they will be inserted:
+                    random_values = self.random_streams.normal(segment.index(), "seminal_root",
+                                                               draw=np.arange(3)).tolist()
 
                     # Then we form one supporting segment of length 0 + one primordium of seminal root.
                     # We add one new segment without any length on the same axis as the base:
@@ -512,7 +554,7 @@ class RootGrowthModel(Model):
                                                                type='Support_for_seminal_root',
                                                                root_order=1,
                                                                angle_down=0,
-                                                               angle_roll=abs(np.random.normal(180, 180)),
+                                                               angle_roll=abs(180 + 180 * random_values[0]),
                                                                length=0.,
                                                                radius=base_radius,
                                                                identical_properties=False,
@@ -520,8 +562,8 @@ class RootGrowthModel(Model):
 
                     # We define the radius of a seminal root according to the parameter Di:
                     if self.random:
-                        radius_seminal = abs(np.random.normal(self.D_ini / 2. * self.D_sem_to_D_ini_ratio,
-                                                              self.D_ini / 2. * self.D_sem_to_D_ini_ratio * self.CVDD))
+                        radius_seminal = abs(self.D_ini / 2. * self.D_sem_to_D_ini_ratio
+                                             * (1. + self.CVDD * random_values[1]))
                     else:
                         radius_seminal = self.D_ini / 2. * self.D_sem_to_D_ini_ratio
 
@@ -529,7 +571,7 @@ class RootGrowthModel(Model):
                     apex_seminal = self.ADDING_A_CHILD(mother_element=segment, edge_type='+', label='Apex',
                                                                     type='Seminal_root_before_emergence',
                                                                     root_order=1,
-                                                                    angle_down=abs(np.random.normal(60, 10)),
+                                                                    angle_down=abs(60 + 10 * random_values[2]),
                                                                     angle_roll=5,
                                                                     length=0.,
                                                                     radius=radius_seminal,
@@ -551,6 +593,9 @@ class RootGrowthModel(Model):
         # If there should be more than one main root (i.e. adventitious roots formed at the basis):
         if self.n_adventitious_roots > 0 or not self.forcing_adventitious_roots_events:
 
+            # pandas is only imported when a table of emergence events has to be read or built:
+            import pandas as pd
+
             # We read additional parameters from a table, with one column containing the delay for each emergence event,
             # and the second column containing the number of adventitious roots that have to emerge at each event.
             # We try to access an already-existing CSV file:
@@ -580,8 +625,10 @@ class RootGrowthModel(Model):
                 # For each adventitious root that can emerge at this emergence event:
                 for j in range(0, int(adventitious_inputs_file.number_of_adventitious_roots_per_event[i])):
 
-                    # We make sure that the adventitious roots will have different random insertion angles:
-                    np.random.seed(self.random_choice + i * j * 3)
+                    # We make sure that the adventitious roots will have different random insertion angles, by drawing
+                    # numbers for the segment on which they will be inserted:
+                    random_values = self.random_streams.normal(segment.index(), "adventitious_root",
+                                                               draw=np.arange(3)).tolist()
 
                     # Then we form one supporting segment of length 0 + one primordium of seminal root.
                     # We add one new segment without any length on the same axis as the base:
@@ -589,7 +636,7 @@ class RootGrowthModel(Model):
                                                                type='Support_for_adventitious_root',
                                                                root_order=1,
                                                                angle_down=0,
-                                                               angle_roll=abs(np.random.normal(0, 180)),
+                                                               angle_roll=abs(180 * random_values[0]),
                                                                length=0.,
                                                                radius=base_radius,
                                                                identical_properties=False,
@@ -597,9 +644,8 @@ class RootGrowthModel(Model):
 
                     # We define the radius of a adventitious root according to the parameter Di:
                     if self.random:
-                        radius_adventitious = abs(np.random.normal(self.D_ini / 2. * self.D_adv_to_D_ini_ratio,
-                                                                   self.D_ini / 2. * self.D_adv_to_D_ini_ratio *
-                                                                   self.CVDD))
+                        radius_adventitious = abs(self.D_ini / 2. * self.D_adv_to_D_ini_ratio
+                                                  * (1. + self.CVDD * random_values[1]))
                     else:
                         radius_adventitious = self.D_ini / 2. * self.D_adv_to_D_ini_ratio
 
@@ -608,7 +654,7 @@ class RootGrowthModel(Model):
                                                                          label='Apex',
                                                                          type='Adventitious_root_before_emergence',
                                                                          root_order=1,
-                                                                         angle_down=abs(np.random.normal(60, 10)),
+                                                                         angle_down=abs(60 + 10 * random_values[2]),
                                                                          angle_roll=5,
                                                                          length=0.,
                                                                          radius=radius_adventitious,
@@ -679,8 +725,13 @@ class RootGrowthModel(Model):
 
         :return:
         """
-        # We cover all the vertices in the MTG:
-        for vid in self.g.vertices_iter(scale=1):
+        # We forget the elements created at the previous time step, which have already been initialized by all modules:
+        self.new_vertices_log.clear()
+        # Elements that died at a previous time step are frozen, as their growth-related variables can no longer change:
+        self.elements.refresh(self.g)
+
+        # We cover all the vertices in the MTG, except frozen dead elements:
+        for vid in self.elements.hot():
             # n represents the vertex:
             n = self.g.node(vid)
 
@@ -714,13 +765,20 @@ class RootGrowthModel(Model):
         This function covers the whole root MTG and computes the potential growth of segments and apices.
         :return:
         """
-        # We simulate the development of all apices and segments in the MTG:
+        # We simulate the development of all segments in the MTG:
+        apices = self.apices
         for vid in self.g.vertices_iter(scale=1):
+            if vid not in apices:
+                n = self.g.node(vid)
+                if n.label == "Segment":
+                    self.potential_segment_development(segment=n)
+        # NOTE: Apices are considered after segments, which does not change the results, as an apex has always been
+        # created after the segments of its axis and their mothers, and was therefore already considered after them.
+        # We simulate the development of all apices, updating their state in the registry:
+        for vid in apices.vids():
             n = self.g.node(vid)
-            if n.label == "Apex":
-                self.potential_apex_development(apex=n)
-            elif n.label == "Segment":
-                self.potential_segment_development(segment=n)
+            self.potential_apex_development(apex=n)
+            apices.update(vid, n.type)
 
     # Function calculating the potential development of an apex:
     def potential_apex_development(self, apex):
@@ -1178,7 +1236,7 @@ class RootGrowthModel(Model):
         # ---------------------------------------------------------------
 
         # We look at the apex of the axis to which the segment belongs (i.e. we get the last element of the axis):
-        index_apex = self.g.Axis(segment.index())[-1]
+        index_apex = self.topology.axis_tip_vid(segment.index())
         apex = self.g.node(index_apex)
         # print("For segment", segment.index(), "the terminal index is", index_apex, "and has the type", apex.type)
         if apex.label != "Apex":
@@ -1335,11 +1393,8 @@ class RootGrowthModel(Model):
         # PROCEEDING TO ACTUAL GROWTH:
         # -----------------------------
 
-        # We have to cover each vertex from the apices up to the base one time:
-        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
-        root = next(root_gen)
-        # We cover all the vertices in the MTG, from the tips to the base:
-        for vid in post_order(self.g, root):
+        # We cover all the vertices in the MTG, from the tips to the base, except frozen dead elements:
+        for vid in self.elements.hot(self.topology.post_order):
 
             # n represents the current root element:
             n = self.g.node(vid)
@@ -1585,6 +1640,7 @@ class RootGrowthModel(Model):
                         or n.type == "Normal_root_before_emergence":
                     # We now consider the apex to have emerged:
                     n.type = "Normal_root_after_emergence"
+                    self.apices.update(vid, n.type)
                     # The exact time since emergence is recorded:
                     n.thermal_time_since_emergence = n.thermal_potential_time_since_emergence
                     n.actual_time_since_emergence = n.thermal_time_since_emergence / temperature_time_adjustment
@@ -1623,10 +1679,10 @@ class RootGrowthModel(Model):
         :return:
         """
         # We simulate the segmentation of all apices:
-        for vid in self.vertices:
+        for vid in self.apices.vids("emerged"):
             n = self.g.node(vid)
             # For each apex in the list of apices that have emerged with a positive length:
-            if n.label == 'Apex' and n.type == "Normal_root_after_emergence" and n.length > 0.:
+            if n.type == "Normal_root_after_emergence" and n.length > 0.:
                 self.segmentation_and_primordium_formation(apex=n)
 
         # We make sure that stored vertices are well updated with the new ones
@@ -1658,14 +1714,11 @@ class RootGrowthModel(Model):
         # ADJUSTING ROOT ANGLES FOR THE FUTURE NEW SEGMENTS:
         # Optional - We can add random geometry, or not:
         if self.random:
-            # The seed used to generate random values is defined according to a parameter random_choice and the index of the apex:
-            np.random.seed(self.random_choice * apex.index())
+            # Random values are drawn for this apex from the stream defined by the parameter random_choice:
             angle_mean = 0
             angle_var = 5
-            segment_angle_down = np.random.normal(angle_mean, angle_var)
-            segment_angle_roll = np.random.normal(angle_mean, angle_var)
-            apex_angle_down = np.random.normal(angle_mean, angle_var)
-            apex_angle_roll = np.random.normal(angle_mean, angle_var)
+            segment_angle_down, segment_angle_roll, apex_angle_down, apex_angle_roll = \
+                self.random_streams.normal(apex.index(), "segmentation", angle_mean, angle_var, draw=np.arange(4)).tolist()
         else:
             segment_angle_down = 0
             segment_angle_roll = 0
@@ -1849,6 +1902,7 @@ class RootGrowthModel(Model):
 
                 # The current element that has been elongated up to segment_length is now considered as a segment:
                 apex.label = 'Segment'
+                self.apices.remove(apex.index())
 
                 # If the segment is not the last one on the elongated axis:
                 if i < n_segments:
@@ -1868,8 +1922,8 @@ class RootGrowthModel(Model):
                     # Otherwise, the loop will stop now, and we will add the terminal apex hereafter.
                     # NODULE OPTION:
                     # We add the possibility of a nodule formation on the segment that is closest to the apex:
-                    if self.nodules and len(
-                            apex.children()) < 2 and np.random.random() < self.nodule_formation_probability:
+                    if self.nodules and len(apex.children()) < 2 and self.random_streams.uniform(
+                            apex.index(), "nodule_formation") < self.nodule_formation_probability:
                         self.nodule_formation(mother_element=apex)  # WATCH OUT: here, "apex" still corresponds to the last segment!
 
             # FORMATION OF THE TERMINAL APEX:
@@ -1977,16 +2031,16 @@ class RootGrowthModel(Model):
         # the product of this mean and the coefficient of variation CVDD (Pages et al. 2014).
         # We also set the root angles depending on random:
         if self.random:
-            # The seed used to generate random values is defined according to a parameter random_choice and the index of the apex:
-            np.random.seed(self.random_choice * apex.index())
-            potential_radius = np.random.normal((apex.radius - self.Dmin / 2.) * self.RMD + self.Dmin / 2.,
-                                                ((apex.radius - self.Dmin / 2.) * self.RMD + self.Dmin / 2.) * self.CVDD)
-            apex_angle_roll = abs(np.random.normal(120, 10))
+            # Random values are drawn for this apex from the stream defined by the parameter random_choice:
+            random_values = self.random_streams.normal(apex.index(), "primordium_formation", draw=np.arange(4)).tolist()
+            potential_radius = ((apex.radius - self.Dmin / 2.) * self.RMD + self.Dmin / 2.) \
+                               * (1. + self.CVDD * random_values[0])
+            apex_angle_roll = abs(120 + 10 * random_values[1])
             if apex.root_order == 1:
-                primordium_angle_down = abs(np.random.normal(45, 10))
+                primordium_angle_down = abs(45 + 10 * random_values[2])
             else:
-                primordium_angle_down = abs(np.random.normal(70, 10))
-            primordium_angle_roll = abs(np.random.normal(5, 5))
+                primordium_angle_down = abs(70 + 10 * random_values[2])
+            primordium_angle_roll = abs(5 + 5 * random_values[3])
         else:
             potential_radius = (apex.radius - self.Dmin / 2) * self.RMD + self.Dmin / 2.
             apex_angle_roll = 120
@@ -2058,8 +2112,8 @@ class RootGrowthModel(Model):
         """
         # TODO FOR TRISTAN In a second step, consider playing on the density / max. length of root hairs depending on the availability of N in the soil (if relevant)?
 
-        # We cover all the vertices in the MTG:
-        for vid in self.g.vertices_iter(scale=1):
+        # We cover all the vertices in the MTG, except frozen dead elements:
+        for vid in self.elements.hot():
             # n represents the vertex:
             n = self.g.node(vid)
 
@@ -2237,12 +2291,9 @@ class RootGrowthModel(Model):
         sum_struct_mass_demand = 0.
         SC = 0.
 
-        # We have to cover each vertex from the apices up to the base one time:
-        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
-        root = next(root_gen)
 
         # We cover all the vertices in the MTG:
-        for vid in post_order(self.g, root):
+        for vid in self.topology.post_order:
             # n represents the current root element:
             n = self.g.node(vid)
 
@@ -2282,15 +2333,12 @@ class RootGrowthModel(Model):
 
         # TODO FOR TRISTAN: If one day you have time to lose, you may see whether you want to add an equivalent limitation of the elongation of all apices with the amount of N available in the root - knowing that this does not exist in ArchiSimple anyway.
 
-        # We have to cover each vertex from the apices up to the base one time:
-        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
-        root = next(root_gen)
 
         # PERFORMING ARCHISIMPLE GROWTH:
         # -------------------------------
 
         # We cover all the vertices in the MTG:
-        for vid in post_order(self.g, root):
+        for vid in self.topology.post_order:
 
             # n represents the current root element:
             n = self.g.node(vid)
@@ -2392,31 +2440,25 @@ class RootGrowthModel(Model):
         :return: the MTG with an updated property 'distance_from_tip'
         """
 
-        # We define "root" as the starting point of the loop below:
-        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
-        root = next(root_gen)
+        topology = self.topology
+        distance_from_tip = self.props.setdefault("distance_from_tip", {})
+
+        # We record the initial distance_from_tip as the "former" one (to be used by other functions), only on elements
+        # for which this is not the first time it is computed:
+        former = topology.gather(distance_from_tip, default=np.nan)
+        already_computed = ~np.isnan(former)
+        if already_computed.any():
+            former_distance_from_tip = self.props.setdefault("former_distance_from_tip", {})
+            if already_computed.all():
+                topology.scatter(former_distance_from_tip, former)
+            else:
+                former_distance_from_tip.update(zip(topology.vids[already_computed].tolist(),
+                                                    former[already_computed].tolist()))
 
-        # We travel in the MTG from the root tips to the base:
-        for vid in post_order(self.g, root):
-            # We define the current root element as n:
-            n = self.g.node(vid)
-            # We define its direct successor as son:
-            son_id = self.g.Successor(vid)
-            son = self.g.node(son_id)
-
-            # We record the initial distance_from_tip as the "former" one (to be used by other functions):
-            if hasattr(n, "distance_from_tip"):
-                # Only if this is not the first time it is computed
-                n.former_distance_from_tip = n.distance_from_tip
-
-            # We try to get the value of distance_from_tip for the neighbouring root element located closer to the apex of the root:
-            try:
-                # We calculate the new distance from the tip by adding its length to the distance of the successor:
-                n.distance_from_tip = son.distance_from_tip + n.length
-            except:
-                # If there is no successor because the element is an apex or a root nodule:
-                # Then we simply define the distance to the tip as the length of the element:
-                n.distance_from_tip = n.length
+        # The distance from the tip of each element is its length plus the distance of its successor on the same axis,
+        # i.e. the sum of the lengths from the tip of its axis (an apex or a root nodule) to the element itself:
+        length = topology.gather(self.props["length"])
+        topology.scatter(distance_from_tip, topology.suffix_sum_along_axes(length))
 
     # Adding a new root element with pre-defined properties:
     def ADDING_A_CHILD(self, mother_element, edge_type='+', label='Apex', type='Normal_root_before_emergence',
@@ -2443,6 +2485,9 @@ class RootGrowthModel(Model):
         #  "ADDING_A_CHILD" your new variables that will either be set to 0 (nil properties) or be equal to that of the mother
         #  element.
 
+        # The structure of the MTG changes, so that the cached topology arrays will have to be rebuilt:
+        self._topology = None
+
         # If nil_properties = True, then we set most of the properties of the new element to 0:
         if nil_properties:
             new_child = mother_element.add_child(edge_type=edge_type,
@@ -2526,6 +2571,11 @@ class RootGrowthModel(Model):
                                                  thermal_time_since_death=0.
                                                  )
             
+            # We record the creation of the new element, so that other modules can initialize it from its mother:
+            self.new_vertices_log.append((new_child.index(), mother_element.index()))
+            self.elements.add(new_child.index(), type)
+            if label == 'Apex':
+                self.apices.update(new_child.index(), type)
             return new_child
 
         # Otherwise, if identical_properties=True, then we copy most of the properties of the mother element in the new element:
@@ -2611,6 +2661,11 @@ class RootGrowthModel(Model):
                                                  thermal_time_since_death=mother_element.thermal_time_since_death
                                                  )
             
+            # We record the creation of the new element, so that other modules can initialize it from its mother:
+            self.new_vertices_log.append((new_child.index(), mother_element.index()))
+            self.elements.add(new_child.index(), type)
+            if label == 'Apex':
+                self.apices.update(new_child.index(), type)
             return new_child
 
     def volume_from_radius_and_length(self, element, radius: float, length: float):
@@ -2653,10 +2708,9 @@ class RootGrowthModel(Model):
             growth_duration = self.GDs * (2. * radius) ** 2
         # Otherwise, we define the growth duration as a fixed value, randomly chosen between three possibilities:
         else:
-            # We first define the seed of random, depending on the index of the apex:
-            np.random.seed(self.random_choice * index)
-            # We then generate a random float number between 0 and 1, which will determine whether growth duration is low, medium or high:
-            random_result = np.random.random_sample()
+            # We generate a random float number between 0 and 1 for this apex, which will determine whether growth duration
+            # is low, medium or high:
+            random_result = self.random_streams.uniform(index, "growth_duration")
             # CASE 1: The apex corresponds to a seminal or adventitious root
             if root_order == 1:
                 growth_duration = self.GD_highest
@@ -2667,15 +2721,17 @@ class RootGrowthModel(Model):
                     # CASE 2: Most likely, the growth duration will be low for a lateral root
                     if random_result < self.GD_prob_low:
                         # We draw a random growth-duration in the lower range:
-                        growth_duration = np.random.uniform(0., self.GD_low)
+                        growth_duration = self.random_streams.uniform(index, "growth_duration", 0., self.GD_low, draw=1)
                     # CASE 3: Occasionnaly, the growth duration may be a bit higher for a lateral root
                     if random_result < self.GD_prob_medium:
                         # We draw a random growth-duration in the lower range:
-                        growth_duration = np.random.uniform(self.GD_low, self.GD_medium)
+                        growth_duration = self.random_streams.uniform(index, "growth_duration", self.GD_low,
+                                                                      self.GD_medium, draw=2)
                     # CASE 3: Occasionnaly, the growth duration may be a bit higher for a lateral root
                     else:
                         # We draw a random growth-duration in the lower range:
-                        growth_duration = np.random.uniform(self.GD_medium, self.GD_high)
+                        growth_duration = self.random_streams.uniform(index, "growth_duration", self.GD_medium,
+                                                                      self.GD_high, draw=3)
                 # If random zoning has not been selected, a constant duration is selected for each probabibility range:
                 else:
                     # CASE 2: Most likely, the growth duration will be low for a lateral root
@@ -2698,12 +2754,9 @@ class RootGrowthModel(Model):
         This function initializes the struct mass production zones related to elongation, root hair development, mother costs related to lateral elongation.
         It also initializes the root hair on existing architecture
         """
-        # We define "root" as the starting point of the loop below:
-        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
-        root = next(root_gen)
 
         # We travel in the MTG from the root tips to the base:
-        for vid in post_order(self.g, root):
+        for vid in self.topology.post_order:
             n = self.g.node(vid)
 
             # If at root tip, for every axis based on its radius we...
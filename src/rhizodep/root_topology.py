@@ -0,0 +1,403 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.root_topology
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.root_topology` stores the topology of the root MTG as NumPy arrays.
+
+    The parent of each element, the children of each element in compressed sparse rows, the post-order traversal used by
+    growth processes, the successor on the same axis and the axis each element belongs to are computed in a single pass,
+    so that they can be shared by all traversal-based processes until the structure of the MTG changes.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import numpy as np
+
+from rhizodep.array_store import PropertyView, gather
+
+
+class RootTopology:
+    """
+    DESCRIPTION
+    -----------
+    Snapshot of the topology of a root MTG at scale 1.
+
+    Elements are identified by their row, which is their rank in the post-order traversal (children before their
+    parent, lateral branches before the successor on the same axis, as in openalea.mtg.traversal.post_order). All
+    arrays are indexed by row, and indices pointing to other elements are rows as well (-1 meaning "none").
+    """
+
+    def __init__(self, g):
+        """
+        :param g: the root MTG
+        """
+        edge_type = g.property('edge_type')
+        root_gen = g.component_roots_at_scale_iter(g.root, scale=1)
+        base = next(root_gen)
+
+        # We cover the MTG once with an explicit stack, yielding the same order as post_order(g, base):
+        post_order = []
+        children_of = {}
+        stack = [(base, False)]
+        while stack:
+            vid, expanded = stack.pop()
+            if expanded:
+                post_order.append(vid)
+                continue
+            # Lateral branches are visited before the successor on the same axis:
+            children = g.children(vid)
+            ordered = [c for c in children if edge_type.get(c) != '<'] + [c for c in children if edge_type.get(c) == '<']
+            children_of[vid] = ordered
+            stack.append((vid, True))
+            stack.extend((child, False) for child in reversed(ordered))
+
+        n = len(post_order)
+        self.vids = np.array(post_order, dtype=np.int64)
+        self.row_of = dict(zip(post_order, range(n)))
+
+        self.parent = np.full(n, -1, dtype=np.int64)
+        self.successor = np.full(n, -1, dtype=np.int64)
+        n_children = np.zeros(n, dtype=np.int64)
+        children_rows = []
+        for row, vid in enumerate(post_order):
+            children = children_of[vid]
+            n_children[row] = len(children)
+            for child in children:
+                child_row = self.row_of[child]
+                children_rows.append(child_row)
+                self.parent[child_row] = row
+                if edge_type.get(child) == '<':
+                    self.successor[row] = child_row
+        self.children_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(n_children, out=self.children_ptr[1:])
+        self.children_idx = np.array(children_rows, dtype=np.int64)
+
+        # An element starts a new axis if it is the base or if it is linked to its parent by a '+' edge:
+        self.axis_start = np.array([edge_type.get(vid) != '<' for vid in post_order], dtype=bool)
+        # As parents come after their children in post-order, we assign axes from the last row to the first one, the
+        # axis of an element being the row of the first element of its axis:
+        self.axis = np.arange(n, dtype=np.int64)
+        for row in range(n - 1, -1, -1):
+            if not self.axis_start[row]:
+                self.axis[row] = self.axis[self.parent[row]]
+        # Conversely, the tip of an axis is its only element without successor:
+        self.axis_tip = np.full(n, -1, dtype=np.int64)
+        tips = np.flatnonzero(self.successor < 0)
+        self.axis_tip[self.axis[tips]] = tips
+        self.axis_tip = self.axis_tip[self.axis]
+
+        # Sorting rows by axis with a stable sort groups the elements of each axis, from its tip to its base, since an
+        # element always comes after its successor in post-order:
+        self.axis_order = np.argsort(self.axis, kind="stable")
+        sorted_axis = self.axis[self.axis_order]
+        axis_order_starts = np.flatnonzero(np.r_[True, sorted_axis[1:] != sorted_axis[:-1]])
+        # For each position in this order, we keep the position at which its axis starts:
+        self.axis_order_start = np.repeat(axis_order_starts, np.diff(np.r_[axis_order_starts, n]))
+
+        # A Python list is kept for the loops of legacy processes:
+        self.post_order = post_order
+        self._store = None
+        self._slots = None
+
+    def __len__(self):
+        return len(self.vids)
+
+    def rows(self, vids):
+        """
+        This function returns the rows of a sequence of vertices as an integer array.
+        """
+        row_of = self.row_of
+        return np.fromiter((row_of[vid] for vid in vids), dtype=np.int64)
+
+    def children(self, row):
+        """
+        This function returns the rows of the children of the element at a given row.
+        """
+        return self.children_idx[self.children_ptr[row]:self.children_ptr[row + 1]]
+
+    def is_leaf(self):
+        """
+        This function returns the boolean array of elements without any child.
+        """
+        return np.diff(self.children_ptr) == 0
+
+    def axis_tip_vid(self, vid):
+        """
+        This function returns the vid of the last element of the axis of a given vertex, like g.Axis(vid)[-1].
+        """
+        return int(self.vids[self.axis_tip[self.row_of[vid]]])
+
+    def _store_slots(self, store):
+        """
+        This function returns the slots of all rows in a columnar store, which remain valid as long as the topology.
+        """
+        if self._store is not store:
+            self._slots = store.allocate(self.vids)
+            self._store = store
+        return self._slots
+
+    def gather(self, prop, default=0.):
+        """
+        This function returns the values of a {vid: value} property over all rows as a float array.
+        :param prop: the property, either a dictionary or a columnar view (see rhizodep.array_store)
+        :param default: the value used for the elements on which the property is not defined
+        """
+        return gather(prop, self.post_order, default).astype(float)
+
+    def scatter(self, prop, values):
+        """
+        This function writes an array of values defined over all rows into a {vid: value} property.
+        """
+        if isinstance(prop, PropertyView):
+            store = prop.store
+            slots = self._store_slots(store)
+            store._promote(prop.name, 0.)
+            store.columns[prop.name][slots] = values
+            store.masks[prop.name][slots] = True
+        else:
+            prop.update(zip(self.post_order, values.tolist()))
+
+    def suffix_sum_along_axes(self, values):
+        """
+        This function sums an array of values defined over all rows along each axis, from the tip of the axis to each
+        element included.
+        """
+        cumulated = np.zeros(len(values) + 1)
+        np.cumsum(values[self.axis_order], out=cumulated[1:])
+        # We remove from each element the cumulated sum of the axes sorted before its own axis:
+        result = np.empty(len(values))
+        result[self.axis_order] = cumulated[1:] - cumulated[self.axis_order_start]
+        return result
+
+
+class ApexRegistry:
+    """
+    DESCRIPTION
+    -----------
+    Index of the apices of a root MTG, partitioned by state (primordium, emerged, stopped or dead), so that processes
+    only concerning apices do not have to scan every vertex of an old root system mostly made of segments.
+
+    Unlike RootTopology, the registry is not rebuilt but updated by the growth model on each transition: when an apex is
+    added, when its type changes, and when segmentation turns it into a segment.
+    """
+
+    # State of an apex according to its type:
+    state_of_type = {"Seminal_root_before_emergence": "primordium",
+                     "Adventitious_root_before_emergence": "primordium",
+                     "Normal_root_before_emergence": "primordium",
+                     "Normal_root_after_emergence": "emerged",
+                     "Just_stopped": "stopped",
+                     "Stopped": "stopped",
+                     "Just_dead": "dead",
+                     "Dead": "dead"}
+    states = ("primordium", "emerged", "stopped", "dead")
+
+    def __init__(self, g=None):
+        """
+        :param g: the root MTG from which existing apices are registered (optional)
+        """
+        self.state_of = {}
+        self.partitions = {state: set() for state in self.states}
+        if g is not None:
+            self.rebuild(g)
+
+    def rebuild(self, g):
+        """
+        This function registers again all the apices of a MTG, e.g. after it has been loaded or generated.
+        """
+        self.state_of.clear()
+        for partition in self.partitions.values():
+            partition.clear()
+        labels = g.property('label')
+        types = g.property('type')
+        for vid in g.vertices_iter(scale=1):
+            if labels.get(vid) == "Apex":
+                self.update(vid, types.get(vid))
+
+    def update(self, vid, type):
+        """
+        This function registers an apex, or moves it to the partition corresponding to its new type.
+        :param vid: the index of the apex
+        :param type: the current type of the apex (types not listed in state_of_type are considered as emerged)
+        """
+        state = self.state_of_type.get(type, "emerged")
+        former_state = self.state_of.get(vid)
+        if former_state != state:
+            if former_state is not None:
+                self.partitions[former_state].discard(vid)
+            self.partitions[state].add(vid)
+            self.state_of[vid] = state
+
+    def remove(self, vid):
+        """
+        This function unregisters an element that is no longer an apex.
+        """
+        state = self.state_of.pop(vid, None)
+        if state is not None:
+            self.partitions[state].discard(vid)
+
+    def __len__(self):
+        return len(self.state_of)
+
+    def __contains__(self, vid):
+        return vid in self.state_of
+
+    def vids(self, *states):
+        """
+        This function returns the sorted list of apices in the given states (all apices if no state is given). As the
+        list is a copy, the registry can be modified while iterating over it.
+        """
+        if not states:
+            return sorted(self.state_of)
+        return sorted(vid for state in states for vid in self.partitions[state])
+
+
+class ElementPartition:
+    """
+    DESCRIPTION
+    -----------
+    Index of the elements of a root MTG keyed by their type, restricted to the "hot" elements that processes still have
+    to visit. As "Dead" is a final type, dead elements are frozen once and for all when the partition is refreshed: they
+    leave the index and their vids are appended to a growable array, so that loops over hot elements stop paying for
+    the necromass of old root systems, while array expressions can still reach frozen elements when needed.
+    """
+
+    frozen_types = ("Dead",)
+
+    def __init__(self, g=None):
+        """
+        :param g: the root MTG from which existing elements are registered (optional)
+        """
+        self.type_of = {}
+        self.by_type = {}
+        self.frozen = set()
+        self._frozen_order = np.zeros(64, dtype=np.int64)
+        if g is not None:
+            self.rebuild(g)
+
+    def rebuild(self, g):
+        """
+        This function registers again all the elements of a MTG, e.g. after it has been loaded or generated.
+        """
+        self.type_of.clear()
+        self.by_type.clear()
+        self.frozen.clear()
+        types = g.property('type')
+        for vid in g.vertices_iter(scale=1):
+            self.add(vid, types.get(vid))
+        self.refresh(g)
+
+    def add(self, vid, type):
+        """
+        This function registers a new hot element, or moves it to the set corresponding to its new type.
+        """
+        former_type = self.type_of.get(vid)
+        if vid in self.type_of:
+            if former_type == type:
+                return
+            self.by_type[former_type].discard(vid)
+        self.type_of[vid] = type
+        self.by_type.setdefault(type, set()).add(vid)
+
+    def refresh(self, g):
+        """
+        This function reads again the type of hot elements only, and freezes those that have reached a final type.
+        :param g: the root MTG
+        :return: the list of elements that have just been frozen
+        """
+        types = g.property('type')
+        type_of = self.type_of
+        changed = [(vid, types.get(vid)) for vid, former_type in type_of.items() if types.get(vid) != former_type]
+        for vid, type in changed:
+            self.add(vid, type)
+
+        frozen = sorted(vid for type in self.frozen_types for vid in self.by_type.get(type, ()))
+        if frozen:
+            n_former = len(self.frozen)
+            if n_former + len(frozen) > len(self._frozen_order):
+                capacity = len(self._frozen_order)
+                while capacity < n_former + len(frozen):
+                    capacity *= 2
+                self._frozen_order = np.r_[self._frozen_order, np.zeros(capacity - len(self._frozen_order),
+                                                                        dtype=np.int64)]
+            self._frozen_order[n_former:n_former + len(frozen)] = frozen
+            self.frozen.update(frozen)
+            for vid in frozen:
+                self.by_type[type_of.pop(vid)].discard(vid)
+        return frozen
+
+    def frozen_vids(self):
+        """
+        This function returns the array of frozen elements, in the order in which they were frozen.
+        """
+        return self._frozen_order[:len(self.frozen)]
+
+    def hot(self, vids=None):
+        """
+        This function returns the list of hot elements, either in the order of registration or, if a sequence of vids is
+        given (e.g. a post-order traversal), in the order of this sequence.
+        """
+        if vids is None:
+            return list(self.type_of)
+        frozen = self.frozen
+        return [vid for vid in vids if vid not in frozen]
+
+    def vids(self, *types):
+        """
+        This function returns the sorted list of hot elements having one of the given types.
+        """
+        return sorted(vid for type in types for vid in self.by_type.get(type, ()))
+
+
+class HotElementsMixin:
+    """
+    DESCRIPTION
+    -----------
+    Access, for the modules looping over root elements, to the partition of elements maintained by RootGrowthModel
+    (RootGrowthModel.elements, shared by Model.__init__), so that elements frozen as dead are skipped. When a module
+    runs without the growth module, all elements are visited.
+    """
+
+    elements = None
+
+    def hot_vertices(self):
+        """
+        This function returns the list of elements that per-element loops have to visit.
+        """
+        if self.elements is not None:
+            return self.elements.hot()
+        return list(self.g.vertices_iter(scale=1))
+
+    def frozen_vertices(self):
+        """
+        This function returns the array of elements skipped by hot_vertices.
+        """
+        if self.elements is not None:
+            return self.elements.frozen_vids()
+        return np.zeros(0, dtype=np.int64)
+
+
+class NewVerticesMixin:
+    """
+    DESCRIPTION
+    -----------
+    Access, for the modules initializing their own properties on new elements, to the log of (new_vid, parent_vid)
+    filled by RootGrowthModel.ADDING_A_CHILD during the current time step (RootGrowthModel.new_vertices_log, shared by
+    Model.__init__). When a module runs without the growth module, new elements are detected from the keys of one of
+    its own properties, whose name is given by new_vertices_reference.
+    """
+
+    new_vertices_reference = None
+
+    def new_vertices(self):
+        """
+        This function returns the list of (new_vid, parent_vid) for the elements created since the last update.
+        """
+        log = getattr(self, "new_vertices_log", None)
+        if log is not None:
+            return list(log)
+        known = getattr(self, self.new_vertices_reference)
+        return [(vid, self.g.parent(vid)) for vid in self.vertices if vid not in known]
@@ -4,17 +4,21 @@ from dataclasses import dataclass
 
 from metafspm.component import Model, declare
 from metafspm.component_factory import *
-from log.visualize import plot_mtg
+
+from rhizodep.root_coordinates import RootCoordinates
+from rhizodep.root_topology import NewVerticesMixin
 
 
 family = "soil"
 
 
 @dataclass
-class RhizoInputsSoilModel(Model):
+class RhizoInputsSoilModel(Model, NewVerticesMixin):
     
     # We need the module AND the class to be named the same way
     family = family
+    # Property whose keys reveal new elements when the log of the growth module is not shared:
+    new_vertices_reference = "C_hexose_soil"
 
     # --- INPUTS STATE VARIABLES FROM OTHER COMPONENTS : default values are provided if not superimposed by model coupling ---
 
@@ -146,6 +150,11 @@ class RhizoInputsSoilModel(Model):
                                         value_comment="", references="We assume that Km for cells degradation is identical to the one for hexose degradation.", DOI="",
                                        min_value="", max_value="", variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
 
+    # Geometry
+    gravitropism_coefficient: float = declare(default=0.06, unit="adim", unit_comment="", description="Coefficient of gravitropism, used as the elasticity of the turtle computing root elements coordinates", 
+                                        value_comment="", references="Same value as in the former parameters file", DOI="",
+                                       min_value="", max_value="", variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+
     def __init__(self, g, time_step_in_seconds, **scenario: dict):
         """
         DESCRIPTION
@@ -164,6 +173,8 @@ class RhizoInputsSoilModel(Model):
         # Before any other operation, we apply the provided scenario by changing default parameters and initialization
         self.apply_scenario(**scenario)
         self.initiate_voxel_soil()
+        self.voxel_index_outdated = True
+        self.root_coordinates = RootCoordinates(self.g, gravitropism_coefficient=self.gravitropism_coefficient)
         self.time_step_in_seconds = time_step_in_seconds
         self.choregrapher.add_time_and_data(instance=self, sub_time_step=self.time_step_in_seconds, data=self.voxels, compartment="soil")
         self.vertices = self.g.vertices(scale=self.g.max_scale())
@@ -198,12 +209,18 @@ class RhizoInputsSoilModel(Model):
         scene_z_range = 1.
         self.voxel_number_z = int(scene_z_range / voxel_height)
 
+        # We record the origin and spacing of the regular grid, so that the voxel containing a point can be computed
+        # directly from its coordinates:
+        self.voxel_width = voxel_width
+        self.voxel_height = voxel_height
+        self.voxel_grid_origin = (- (self.voxel_number_xy*voxel_width)/2, - (self.voxel_number_xy*voxel_width)/2, 0.)
+
         y, z, x = np.indices((self.voxel_number_xy, self.voxel_number_z, self.voxel_number_xy))
-        self.voxels["x1"] = x * voxel_width - ((self.voxel_number_xy*voxel_width)/2)
+        self.voxels["x1"] = x * voxel_width + self.voxel_grid_origin[0]
         self.voxels["x2"] = self.voxels["x1"] + voxel_width
-        self.voxels["y1"] = y * voxel_width - ((self.voxel_number_xy*voxel_width)/2)
+        self.voxels["y1"] = y * voxel_width + self.voxel_grid_origin[1]
         self.voxels["y2"] = self.voxels["y1"] + voxel_width
-        self.voxels["z1"] = z * voxel_height
+        self.voxels["z1"] = z * voxel_height + self.voxel_grid_origin[2]
         self.voxels["z2"] = self.voxels["z1"] + voxel_height
 
         self.voxel_grid_to_self("voxel_volume", voxel_volume)
@@ -219,77 +236,111 @@ class RhizoInputsSoilModel(Model):
         #setattr(self, name, self.voxels[name])
 
     def compute_mtg_voxel_neighbors(self):
-        # necessary to get updated coordinates.
+        # necessary to get updated coordinates, only elements whose geometry changed are recomputed.
         if "angle_down" in self.g.properties().keys():
-            plot_mtg(self.g)
-        for vid in self.vertices:
-            if self.struct_mass[vid] > 0. and (self.props["hexose_consumption_by_growth"][vid] > 0. or not self.initialization_finished):
-                baricenter = (np.mean((self.props["x1"][vid], self.props["x2"][vid])), 
-                            np.mean((self.props["y1"][vid], self.props["y2"][vid])),
-                            -np.mean((self.props["z1"][vid], self.props["z2"][vid])))
-                testx1 = self.voxels["x1"] <= baricenter[0]
-                testx2 = baricenter[0] <= self.voxels["x2"]
-                testy1 = self.voxels["y1"] <= baricenter[1]
-                testy2 = baricenter[1] <= self.voxels["y2"]
-                testz1 = self.voxels["z1"] <= baricenter[2]
-                testz2 = baricenter[2] <= self.voxels["z2"]
-                test = testx1 * testx2 * testy1 * testy2 * testz1 * testz2
-                try:
-                    self.voxel_neighbor[vid] = [int(v) for v in np.where(test)]
-                except:
+            self.root_coordinates.update()
+        # We only relocate the elements that have grown since the last step (or all of them at initialization):
+        growth = self.props["hexose_consumption_by_growth"]
+        vids = [vid for vid in self.vertices
+                if self.struct_mass[vid] > 0. and (growth[vid] > 0. or not self.initialization_finished)]
+        if len(vids) > 0:
+            baricenters = np.array([((self.props["x1"][vid] + self.props["x2"][vid]) / 2.,
+                                     (self.props["y1"][vid] + self.props["y2"][vid]) / 2.,
+                                     -(self.props["z1"][vid] + self.props["z2"][vid]) / 2.) for vid in vids])
+            vy, vz, vx, inside = self.voxel_indices(baricenters[:, 0], baricenters[:, 1], baricenters[:, 2])
+            for vid, y, z, x, is_inside in zip(vids, vy.tolist(), vz.tolist(), vx.tolist(), inside.tolist()):
+                if is_inside:
+                    neighbor = [y, z, x]
+                else:
                     print(" WARNING, issue in computing the voxel neighbor for vid ", vid)
-                    self.voxel_neighbor[vid] = None
+                    neighbor = None
+                if neighbor != self.voxel_neighbor[vid]:
+                    self.voxel_neighbor[vid] = neighbor
+                    self.voxel_index_outdated = True
         if not self.initialization_finished:
             self.initialization_finished = True
 
+    def voxel_indices(self, x, y, z):
+        """
+        This function computes the indices of the voxels containing a set of points, by binning their coordinates
+        against the origin and spacing of the regular voxel grid, i.e. in constant time per point.
+        :param x: array of x-coordinates (m)
+        :param y: array of y-coordinates (m)
+        :param z: array of depths, positive downwards (m)
+        :return: the arrays of indices along y, z and x, and a boolean array telling whether each point is in the grid
+        """
+        vx = np.floor((np.asarray(x) - self.voxel_grid_origin[0]) / self.voxel_width).astype(int)
+        vy = np.floor((np.asarray(y) - self.voxel_grid_origin[1]) / self.voxel_width).astype(int)
+        vz = np.floor((np.asarray(z) - self.voxel_grid_origin[2]) / self.voxel_height).astype(int)
+        inside = (0 <= vx) & (vx < self.voxel_number_xy) \
+                 & (0 <= vy) & (vy < self.voxel_number_xy) \
+                 & (0 <= vz) & (vz < self.voxel_number_z)
+        return vy, vz, vx, inside
+
     def post_growth_updating(self):
         """
         Description :
             Extend property dictionary upon new element partitioning.
         """
         self.vertices = self.g.vertices(scale=self.g.max_scale())
-        for vid in self.vertices:
-            if vid not in list(self.C_hexose_soil.keys()):
-                parent = self.g.parent(vid)
-                for prop in self.state_variables:
-                    # All concentrations, temperature and pressure are intensive, so we need structural mass wise partitioning to initialize
-                    getattr(self, prop).update({vid: getattr(self, prop)[parent]})
-                # Specific as it can be a mix of None and lists
-                getattr(self, "voxel_neighbor").update({vid: None})
+        for vid, parent in self.new_vertices():
+            for prop in self.state_variables:
+                # All concentrations, temperature and pressure are intensive, so we need structural mass wise partitioning to initialize
+                values = getattr(self, prop)
+                values[vid] = values[parent]
+            # Specific as it can be a mix of None and lists
+            self.voxel_neighbor[vid] = None
+
+    def update_voxel_index(self):
+        """
+        This function rebuilds the arrays relating root elements to the flat index of the voxel they belong to.
+        It is only called when at least one voxel_neighbor has changed since the last rebuilding.
+        """
+        self.voxel_index_vids = [vid for vid in self.vertices if self.voxel_neighbor[vid] is not None]
+        if len(self.voxel_index_vids) > 0:
+            vy, vz, vx = np.array([self.voxel_neighbor[vid] for vid in self.voxel_index_vids]).T
+        else:
+            vy = vz = vx = np.zeros(0, dtype=int)
+        self.voxel_flat_index = np.ravel_multi_index((vy, vz, vx), (self.voxel_number_xy, self.voxel_number_z,
+                                                                     self.voxel_number_xy))
+        self.voxel_index_outdated = False
 
     def apply_to_voxel(self):
         """
         This function computes the flow perceived by voxels surrounding the considered root segment.
+        Flows of all root elements are summed into their voxel with a single scatter operation per variable.
         Note : not tested for now, just computed to support discussions.
 
         :param element: the considered root element.
         :param root_flows: The root flows to be perceived by soil voxels. The underlying assumptions are that only flows, i.e. extensive variables are passed as arguments.
         :return:
         """
+        if self.voxel_index_outdated:
+            self.update_voxel_index()
+
+        n_voxels = self.voxel_number_xy * self.voxel_number_z * self.voxel_number_xy
         for name in self.inputs:
-            self.voxels[name].fill(0)
-        
-        for vid in self.vertices:
-            if self.voxel_neighbor[vid] != None:
-                vy, vz, vx = self.voxel_neighbor[vid]
-                for name in self.inputs:
-                    self.voxels[name][vy][vz][vx] += getattr(self, name)[vid]
+            prop = getattr(self, name)
+            values = np.array([prop[vid] for vid in self.voxel_index_vids], dtype=float)
+            self.voxels[name][...] = np.bincount(self.voxel_flat_index, weights=values,
+                                                 minlength=n_voxels).reshape(self.voxels[name].shape)
 
     def get_from_voxel(self):
         """
         This function computes the soil states from voxels perceived by the considered root segment.
+        States of all root elements are read from their voxel with a single gather operation per variable.
         Note : not tested for now, just computed to support discussions.
 
         :param element: the considered root element.
         :param soil_states: The soil states to be perceived by soil voxels. The underlying assumptions are that only intensive extensive variables are passed as arguments.
         :return:
         """
-        for vid in self.vertices:
-            for name in self.state_variables:
-                if self.voxel_neighbor[vid] != None:
-                    vy, vz, vx = self.voxel_neighbor[vid]
-                    getattr(self, name)[vid] = self.voxels[name][vy][vz][vx]
+        if self.voxel_index_outdated:
+            self.update_voxel_index()
 
+        for name in self.state_variables:
+            values = self.voxels[name].ravel()[self.voxel_flat_index]
+            getattr(self, name).update(zip(self.voxel_index_vids, values.tolist()))
 
     def __call__(self, *args):
         self.pull_available_inputs()
@@ -0,0 +1,263 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.step_outputs
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.step_outputs` streams selected outputs of a simulation to disk at each time step.
+
+    Per-vertex properties and plant-scale totals are buffered in memory and written by chunks of several time steps, from
+    a background thread, as plain .npy files. A chunk directory holds, for the steps it covers, the concatenated vertex
+    indices, the offsets of each step in this concatenation, one array per property and one array per total. Chunks are
+    renamed into place once complete and listed in an index file replaced atomically, so that a reader can memory-map the
+    results of a simulation which is still running.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import os
+import json
+import queue
+import shutil
+import threading
+
+import numpy as np
+
+from rhizodep.array_store import gather
+
+INDEX_FILE = "index.json"
+
+
+def _numeric(values):
+    """
+    This function converts an array of property values into floats, NaN marking values that are not numbers.
+    """
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64)
+    return np.array([value if isinstance(value, (int, float, np.number)) else np.nan for value in values.tolist()],
+                    dtype=np.float64)
+
+
+class StepOutputWriter:
+    """
+    DESCRIPTION
+    -----------
+    Streaming sink appending per-vertex properties and plant-scale totals of a MTG to chunked .npy files.
+
+    Use guideline :
+    1. writer = StepOutputWriter(outputs_dirpath, properties=["length", "C_sucrose_root"], totals=["struct_mass"])
+    2. call writer.record(g) after each Model.run() (or add the writer to Model.output_writers)
+    3. call writer.close() at the end of the simulation to write the last incomplete chunk.
+
+    Recording a step only copies the selected values, the writing to disk being performed by a background thread. The
+    outputs can be read with StepOutputReader, including while the simulation is running.
+    """
+
+    def __init__(self, outputs_dirpath, properties=(), totals=(), chunk_steps=24, max_pending_chunks=4):
+        """
+        :param outputs_dirpath: the directory in which chunks are written
+        :param properties: the names of the per-vertex properties to record
+        :param totals: the names of the properties whose sum over all vertices is recorded at each step
+        :param chunk_steps: the number of steps gathered in a chunk
+        :param max_pending_chunks: the number of complete chunks that can wait for the writing thread before record()
+        waits for it, which bounds the memory used when the disk is slower than the simulation
+        """
+        self.outputs_dirpath = outputs_dirpath
+        self.properties = list(properties)
+        self.totals = list(totals)
+        self.chunk_steps = int(chunk_steps)
+        os.makedirs(outputs_dirpath, exist_ok=True)
+
+        self.index = {"properties": self.properties, "totals": self.totals, "chunks": []}
+        self._write_index()
+        self._step = 0
+        self._buffer = self._empty_buffer()
+        self._chunk_number = 0
+        self._queue = queue.Queue(maxsize=max_pending_chunks)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_chunks, name="StepOutputWriter", daemon=True)
+        self._thread.start()
+
+    def _empty_buffer(self):
+        return {"steps": [], "vids": [], "properties": {name: [] for name in self.properties},
+                "totals": {name: [] for name in self.totals}}
+
+    def record(self, g, step=None):
+        """
+        This function copies the selected outputs of the current state of a MTG into the buffer.
+        :param g: the root MTG
+        :param step: the number of the step (by default, the number of steps already recorded)
+        """
+        if self._error is not None:
+            raise RuntimeError("Writing of step outputs failed") from self._error
+        if step is None:
+            step = self._step
+        self._step = step + 1
+
+        vids = np.array(list(g.vertices_iter(scale=1)), dtype=np.int64)
+        props = g.properties()
+        values = {}
+        for name in set(self.properties) | set(self.totals):
+            prop = props.get(name)
+            values[name] = np.full(len(vids), np.nan) if prop is None else _numeric(gather(prop, vids, np.nan))
+
+        buffer = self._buffer
+        buffer["steps"].append(step)
+        buffer["vids"].append(vids)
+        for name in self.properties:
+            buffer["properties"][name].append(values[name])
+        for name in self.totals:
+            buffer["totals"][name].append(np.nansum(values[name]))
+        if len(buffer["steps"]) >= self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        """
+        This function hands the steps buffered so far over to the writing thread as a new chunk.
+        """
+        buffer = self._buffer
+        if not buffer["steps"]:
+            return
+        self._buffer = self._empty_buffer()
+        self._queue.put((self._chunk_number, buffer))
+        self._chunk_number += 1
+
+    def close(self):
+        """
+        This function writes the remaining buffered steps and waits for the writing thread to finish.
+        """
+        if self._thread.is_alive():
+            self.flush()
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Writing of step outputs failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # WRITING THREAD:
+    # ---------------
+    def _write_chunks(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                # After a failure, remaining chunks are discarded so that record() can report the error:
+                continue
+            try:
+                self._write_chunk(*item)
+            except Exception as error:
+                self._error = error
+
+    def _write_chunk(self, chunk_number, buffer):
+        """
+        This function writes a chunk in a temporary directory, renames it into place and adds it to the index.
+        """
+        name = "chunk_%06d" % chunk_number
+        chunk_dirpath = os.path.join(self.outputs_dirpath, name)
+        temporary_dirpath = chunk_dirpath + ".tmp"
+        if os.path.exists(temporary_dirpath):
+            shutil.rmtree(temporary_dirpath)
+        os.makedirs(temporary_dirpath)
+
+        steps = np.array(buffer["steps"], dtype=np.int64)
+        offsets = np.zeros(len(steps) + 1, dtype=np.int64)
+        np.cumsum([len(vids) for vids in buffer["vids"]], out=offsets[1:])
+        np.save(os.path.join(temporary_dirpath, "steps.npy"), steps)
+        np.save(os.path.join(temporary_dirpath, "offsets.npy"), offsets)
+        np.save(os.path.join(temporary_dirpath, "vids.npy"), np.concatenate(buffer["vids"]))
+        for prop_name, values in buffer["properties"].items():
+            np.save(os.path.join(temporary_dirpath, "%s.npy" % prop_name), np.concatenate(values))
+        for total_name, values in buffer["totals"].items():
+            np.save(os.path.join(temporary_dirpath, "total_%s.npy" % total_name), np.array(values, dtype=np.float64))
+        if os.path.exists(chunk_dirpath):
+            # We replace the chunk left by a previous simulation written in the same directory:
+            shutil.rmtree(chunk_dirpath)
+        os.replace(temporary_dirpath, chunk_dirpath)
+
+        self.index["chunks"].append({"name": name, "first_step": int(steps[0]), "last_step": int(steps[-1]),
+                                     "n_steps": len(steps)})
+        self._write_index()
+
+    def _write_index(self):
+        index_path = os.path.join(self.outputs_dirpath, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(index_path + ".tmp", index_path)
+
+
+class StepOutputReader:
+    """
+    DESCRIPTION
+    -----------
+    Reader of the outputs written by StepOutputWriter, whose arrays are memory-mapped.
+
+    Only the chunks listed in the index when it is (re)loaded are visible, reload() being used to follow a simulation
+    which is still running.
+    """
+
+    def __init__(self, outputs_dirpath):
+        """
+        :param outputs_dirpath: the directory in which chunks have been written
+        """
+        self.outputs_dirpath = outputs_dirpath
+        self._arrays = {}
+        self.reload()
+
+    def reload(self):
+        """
+        This function reads the index again to see the chunks written since the last reading.
+        """
+        with open(os.path.join(self.outputs_dirpath, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.properties = self.index["properties"]
+        self.totals = self.index["totals"]
+        self.chunk_of_step = {}
+        for chunk in self.index["chunks"]:
+            for rank, step in enumerate(self._array(chunk["name"], "steps").tolist()):
+                self.chunk_of_step[step] = (chunk["name"], rank)
+
+    @property
+    def steps(self):
+        """
+        The list of recorded steps.
+        """
+        return sorted(self.chunk_of_step)
+
+    def _array(self, chunk_name, array_name):
+        key = (chunk_name, array_name)
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.outputs_dirpath, chunk_name, array_name + ".npy"),
+                                        mmap_mode="r")
+        return self._arrays[key]
+
+    def vertex_property(self, name, step):
+        """
+        This function returns the vertices and the values of a per-vertex property at a given step.
+        :param name: the name of the property
+        :param step: the number of the step
+        :return: (vids, values), two memory-mapped arrays
+        """
+        chunk_name, rank = self.chunk_of_step[step]
+        offsets = self._array(chunk_name, "offsets")
+        start, end = offsets[rank], offsets[rank + 1]
+        return self._array(chunk_name, "vids")[start:end], self._array(chunk_name, name)[start:end]
+
+    def total(self, name):
+        """
+        This function returns the time series of a plant-scale total over all recorded steps.
+        :param name: the name of the total
+        :return: (steps, values), two arrays
+        """
+        chunks = self.index["chunks"]
+        if not chunks:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        steps = np.concatenate([self._array(chunk["name"], "steps") for chunk in chunks])
+        values = np.concatenate([self._array(chunk["name"], "total_" + name) for chunk in chunks])
+        return steps, values
@@ -0,0 +1,409 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.step_timing
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.step_timing` records the wall time spent in each phase of Model.run() and in each process
+    of the modules.
+
+    Phases (soil, growth, post-growth updates, anatomy, carbon...) are timed explicitly by Model.run(). Processes are
+    the methods of the modules, including those dispatched by the choregrapher (@stepinit, @potential, @actual,
+    @segmentation, @postsegmentation, @rate, @state...): their calls are detected from their code objects, with
+    sys.monitoring on Python >= 3.12 (only the watched functions generate events) or with a profile function otherwise.
+    As per-element processes are called once per vertex, their number of calls is the number of processed vertices.
+
+    Records are kept in a fixed-size ring buffer of NumPy arrays, the calls of a process during a phase being gathered
+    in a single record, so that timing a long simulation uses a bounded amount of memory. They can be exported in the
+    Chrome trace format, to be opened with chrome://tracing or https://ui.perfetto.dev.
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import ast
+import sys
+import json
+import inspect
+import textwrap
+import threading
+from time import perf_counter
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([("step", np.int64), ("name", np.int32), ("kind", np.int32), ("parent", np.int32),
+                         ("start", np.float64), ("duration", np.float64), ("calls", np.int64),
+                         ("vertices", np.int64)])
+
+
+def _process_kinds(klass):
+    """
+    This function reads the name of the first decorator of each method defined in a class (e.g. 'rate').
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(klass)))
+    except (OSError, TypeError, SyntaxError):
+        return {}
+    kinds = {}
+    for node in tree.body[0].body:
+        if isinstance(node, ast.FunctionDef) and node.decorator_list:
+            decorator = node.decorator_list[0]
+            if isinstance(decorator, ast.Call):
+                decorator = decorator.func
+            if isinstance(decorator, ast.Name):
+                kinds[node.name] = decorator.id
+            elif isinstance(decorator, ast.Attribute):
+                kinds[node.name] = decorator.attr
+    return kinds
+
+
+def _underlying_code(function, name):
+    """
+    This function returns the code object of the function defined under a given name, looking through the wrappers
+    possibly added by decorators.
+    """
+    seen = set()
+    stack = [function]
+    while stack:
+        f = stack.pop()
+        code = getattr(f, "__code__", None)
+        if code is None or id(f) in seen:
+            continue
+        seen.add(id(f))
+        if code.co_name == name:
+            return code
+        if hasattr(f, "__wrapped__"):
+            stack.append(f.__wrapped__)
+        for cell in f.__closure__ or ():
+            try:
+                stack.append(cell.cell_contents)
+            except ValueError:
+                continue
+    return None
+
+
+def module_processes(module):
+    """
+    This function lists the methods of a rhizodep module whose calls can be timed.
+    :param module: an instance of a module (e.g. RootGrowthModel)
+    :return: a list of (code object, name, kind), the name being prefixed by the family of the module
+    """
+    family = getattr(module, "family", None) or type(module).__name__
+    processes = []
+    seen = set()
+    for klass in type(module).__mro__:
+        if not klass.__module__.startswith("rhizodep"):
+            continue
+        kinds = _process_kinds(klass)
+        for name, attribute in vars(klass).items():
+            if name in seen or not callable(attribute) or isinstance(attribute, type):
+                continue
+            code = _underlying_code(attribute, name)
+            if code is not None:
+                seen.add(name)
+                processes.append((code, f"{family}.{name}", kinds.get(name, "method")))
+    return processes
+
+
+class StepTimer:
+    """
+    DESCRIPTION
+    -----------
+    Ring buffer of timing records of the phases and processes of a model.
+
+    Use guideline :
+    1. timer = model.enable_timing() (or StepTimer() passed to Model.timer)
+    2. call model.run() as usual, records being added at each step
+    3. read timer.summary(), timer.durations(name), or write timer.to_chrome_trace(path).
+
+    Each record holds the step, the name and kind of the phase or process, its start time and duration (s), the number
+    of calls it gathers and the number of root elements at the start of the phase.
+    """
+
+    def __init__(self, capacity=100000):
+        """
+        :param capacity: the maximal number of records kept, the oldest ones being overwritten
+        """
+        self.capacity = int(capacity)
+        self.records = np.zeros(self.capacity, dtype=RECORD_DTYPE)
+        self.n_records = 0
+        self.step = 0
+        self.names = []
+        self._name_index = {}
+        self.origin = perf_counter()
+        self._phase = -1
+        # Statistics of the watched processes during the current phase:
+        self._processes = {}
+        self._stats = {}
+        self._stack = []
+        self._hook = None
+
+    def _index(self, name):
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def record(self, name, kind, start, duration, calls=1, vertices=0, parent=-1):
+        """
+        This function adds a record to the ring buffer.
+        :param name: the name of the phase or process
+        :param kind: the kind of the record ('phase', 'step' or the decorator of a process, e.g. 'rate')
+        :param start: the start time (s, from perf_counter)
+        :param duration: the duration (s)
+        :param calls: the number of calls gathered in the record
+        :param vertices: the number of vertices concerned
+        :param parent: the index of the name of the enclosing phase (-1 if none)
+        """
+        self.records[self.n_records % self.capacity] = (self.step, self._index(name), self._index(kind), parent,
+                                                        start - self.origin, duration, calls, vertices)
+        self.n_records += 1
+
+    @contextmanager
+    def phase(self, name, vertices=0, kind="phase"):
+        """
+        This function times the enclosed block as a phase, and gathers the calls of watched processes made during it.
+        :param name: the name of the phase
+        :param vertices: the number of root elements at the start of the phase
+        :param kind: the kind of the record
+        """
+        enclosing_phase = self._phase
+        # Calls made in the enclosing phase so far are recorded as part of it:
+        self._flush_processes(enclosing_phase)
+        self._phase = self._index(name)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            end = perf_counter()
+            self._flush_processes(self._phase)
+            self._phase = enclosing_phase
+            self.record(name, kind, start, end - start, vertices=vertices, parent=enclosing_phase)
+
+    def end_step(self):
+        """
+        This function increments the step number given to the next records.
+        """
+        self.step += 1
+
+    # RECORDS:
+    # --------
+    def events(self):
+        """
+        This function returns the records still in the buffer, from the oldest to the newest.
+        """
+        if self.n_records <= self.capacity:
+            return self.records[:self.n_records].copy()
+        first = self.n_records % self.capacity
+        return np.concatenate((self.records[first:], self.records[:first]))
+
+    def durations(self, name):
+        """
+        This function returns the durations (s) of the records of a phase or process, from the oldest to the newest.
+        """
+        index = self._name_index.get(name)
+        events = self.events()
+        return events["duration"][events["name"] == index]
+
+    def summary(self):
+        """
+        This function sums the records of each phase or process.
+        :return: a dictionary giving, for each name, its kind, number of records and calls, total and mean duration (s),
+        and the total number of vertices, sorted by decreasing total duration
+        """
+        events = self.events()
+        summary = {}
+        for index in np.unique(events["name"]).tolist():
+            selected = events[events["name"] == index]
+            total = float(selected["duration"].sum())
+            summary[self.names[index]] = {"kind": self.names[selected["kind"][0]], "records": len(selected),
+                                          "calls": int(selected["calls"].sum()), "total": total,
+                                          "mean": total / len(selected), "vertices": int(selected["vertices"].sum())}
+        return dict(sorted(summary.items(), key=lambda item: -item[1]["total"]))
+
+    def to_chrome_trace(self, path):
+        """
+        This function writes the records in the Chrome trace event format (JSON).
+        Phases are drawn on the first line, and each process on its own line, a process record starting at its first call
+        during the phase and lasting the total duration of its calls.
+        :param path: the path of the .json file
+        """
+        trace_events = []
+        tids = {}
+        for event in self.events().tolist():
+            step, name, kind, parent, start, duration, calls, vertices = event
+            kind_name = self.names[kind]
+            if kind_name in ("phase", "step"):
+                tid = 0
+            else:
+                tid = tids.setdefault(name, len(tids) + 1)
+            args = {"step": step, "calls": calls, "vertices": vertices, "duration_ms": 1e3 * duration}
+            if parent >= 0:
+                args["phase"] = self.names[parent]
+            trace_events.append({"name": self.names[name], "cat": kind_name, "ph": "X", "pid": 0, "tid": tid,
+                                 "ts": 1e6 * start, "dur": 1e6 * duration, "args": args})
+        trace_events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": 0, "args": {"name": "phases"}})
+        for name, tid in tids.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid,
+                                 "args": {"name": self.names[name]}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+    # PROCESSES:
+    # ----------
+    def watch(self, modules):
+        """
+        This function starts timing the calls of the methods of modules.
+        :param modules: the module instances whose methods are watched
+        """
+        self.unwatch()
+        self._processes = {}
+        for module in modules:
+            for code, name, kind in module_processes(module):
+                self._processes[code] = (self._index(name), self._index(kind))
+        self._stats = {}
+        self._stack = []
+        if hasattr(sys, "monitoring"):
+            try:
+                self._hook = _MonitoringHook(self)
+                return
+            except ValueError:
+                # The profiler tool identifier is already used, e.g. by a profiler:
+                pass
+        self._hook = _ProfileHook(self)
+
+    def unwatch(self):
+        """
+        This function stops timing the calls of processes.
+        """
+        if self._hook is not None:
+            self._hook.stop()
+            self._hook = None
+
+    def _enter(self, code):
+        stats = self._stats.get(code)
+        now = perf_counter()
+        if stats is None:
+            # calls, total duration, first start, depth:
+            stats = self._stats[code] = [0, 0., now, 0]
+        stats[0] += 1
+        stats[3] += 1
+        self._stack.append((code, now))
+
+    def _exit(self, code):
+        stack = self._stack
+        now = perf_counter()
+        # Calls left unfinished by exceptions are discarded until the returning function is found:
+        while stack and stack[-1][0] is not code:
+            left_code, _ = stack.pop()
+            if left_code in self._stats:
+                self._stats[left_code][3] -= 1
+        if not stack:
+            return
+        _, start = stack.pop()
+        stats = self._stats.get(code)
+        if stats is None:
+            # The call started before the statistics of the previous phase were recorded:
+            stats = self._stats[code] = [0, 0., start, 1]
+        stats[3] -= 1
+        # Only the outermost call of a recursive function is counted in its duration:
+        if stats[3] <= 0:
+            stats[3] = 0
+            stats[1] += now - start
+
+    def _flush_processes(self, parent):
+        stats, self._stats = self._stats, {}
+        for code, (calls, total, first_start, depth) in stats.items():
+            if depth > 0:
+                # Calls still running (e.g. a phase started from a process) are recorded when they return:
+                self._stats[code] = [0, 0., first_start, depth]
+            if calls == 0 and depth > 0:
+                continue
+            name, kind = self._processes[code]
+            self.record(self.names[name], self.names[kind], first_start, total, calls=calls, vertices=calls,
+                        parent=parent)
+
+
+class _MonitoringHook:
+    """
+    Calls of watched processes detected with sys.monitoring (Python >= 3.12), events being only enabled on their code.
+    """
+
+    def __init__(self, timer):
+        monitoring = sys.monitoring
+        self.tool = monitoring.PROFILER_ID
+        monitoring.use_tool_id(self.tool, "rhizodep")
+        self.codes = list(timer._processes)
+        events = monitoring.events
+        processes = timer._processes
+
+        def on_start(code, offset):
+            if code in processes:
+                timer._enter(code)
+
+        def on_return(code, offset, value):
+            if code in processes:
+                timer._exit(code)
+
+        monitoring.register_callback(self.tool, events.PY_START, on_start)
+        monitoring.register_callback(self.tool, events.PY_RETURN, on_return)
+        monitoring.register_callback(self.tool, events.PY_UNWIND,
+                                     lambda code, offset, exception: on_return(code, offset, None))
+        for code in self.codes:
+            monitoring.set_local_events(self.tool, code, events.PY_START | events.PY_RETURN)
+        # Unwinding cannot be watched on specific functions only, but only happens when an exception is raised:
+        monitoring.set_events(self.tool, events.PY_UNWIND)
+
+    def stop(self):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.set_events(self.tool, 0)
+        for code in self.codes:
+            monitoring.set_local_events(self.tool, code, 0)
+        for event in (events.PY_START, events.PY_RETURN, events.PY_UNWIND):
+            monitoring.register_callback(self.tool, event, None)
+        monitoring.free_tool_id(self.tool)
+
+
+class _ProfileHook:
+    """
+    Calls of watched processes detected with a profile function, for Python < 3.12.
+    """
+
+    def __init__(self, timer):
+        processes = timer._processes
+        enter = timer._enter
+        exit = timer._exit
+
+        def profile(frame, event, arg):
+            if event == "call":
+                code = frame.f_code
+                if code in processes:
+                    enter(code)
+            elif event == "return":
+                code = frame.f_code
+                if code in processes:
+                    exit(code)
+
+        self.previous = sys.getprofile()
+        self.thread = threading.get_ident()
+        sys.setprofile(profile)
+
+    def stop(self):
+        if threading.get_ident() == self.thread:
+            sys.setprofile(self.previous)
+
+
+def timed(timer, name, vertices=0, kind="phase"):
+    """
+    This function returns the context in which a phase is timed, or an empty context if timing is disabled.
+    :param timer: a StepTimer, or None
+    :param name: the name of the phase
+    :param vertices: the number of root elements at the start of the phase
+    :param kind: the kind of the record
+    """
+    if timer is None:
+        return nullcontext()
+    return timer.phase(name, vertices=vertices, kind=kind)
@@ -0,0 +1,281 @@
+#  -*- coding: utf-8 -*-
+
+"""
+    rhizodep.synthetic_mtg
+    ~~~~~~~~~~~~~
+
+    The module :mod:`rhizodep.synthetic_mtg` generates large root MTGs without simulating their growth.
+
+    The generated root system follows the conventions of RootGrowthModel.initiate_mtg and ADDING_A_CHILD: each axis is a
+    succession of segments of length segment_length terminated by an apex, lateral axes being borne by segments with an
+    edge of type '+'. Lateral roots are inserted every inter-primordia distance with a given probability, their radius
+    being derived from that of their mother root as in the growth module (RMD, CVDD and Dmin), and their length being
+    proportional to the cube of their radius (elongation rate and growth duration being respectively proportional to
+    the diameter and to its square in ArchiSimple) and to the distance of their insertion from the tip of the mother
+    axis. The whole architecture is computed with NumPy arrays, random numbers being drawn from counter-based streams
+    (see rhizodep.random_streams), so that the same seed always gives the same MTG.
+
+    The generated MTG can be passed directly to Model(time_step, g=g).
+
+    :copyright: see AUTHORS.
+    :license: see LICENSE for details.
+"""
+
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.root_growth import RootGrowthModel
+from rhizodep.random_streams import RandomStreams
+
+# Parameters of the growth module used to build the MTG, which can be overwritten when calling synthetic_mtg:
+GROWTH_PARAMETERS = ("D_ini", "Dmin", "RMD", "CVDD", "IPD", "segment_length", "new_root_tissue_density", "GDs", "LDs",
+                     "main_roots_growth_extender", "root_hair_radius", "root_hairs_lifespan", "initial_C_hexose_root")
+
+# Properties set to 0 on every element, as when ADDING_A_CHILD is called with nil_properties=True:
+NIL_PROPERTIES = ("emergence_cost", "dist_to_ramif", "actual_elongation", "actual_elongation_rate",
+                  "root_hair_length", "actual_length_with_hairs", "living_root_hairs_number",
+                  "dead_root_hairs_number", "total_root_hairs_number",
+                  "actual_time_since_root_hairs_emergence_started", "thermal_time_since_root_hairs_emergence_started",
+                  "actual_time_since_root_hairs_emergence_stopped", "thermal_time_since_root_hairs_emergence_stopped",
+                  "root_hairs_struct_mass", "root_hairs_struct_mass_produced", "initial_living_root_hairs_struct_mass",
+                  "living_root_hairs_struct_mass", "resp_growth", "struct_mass_produced", "hexose_growth_demand",
+                  "hexose_consumption_by_growth_amount", "hexose_consumption_by_growth", "hexose_consumption_by_fungus",
+                  "hexose_possibly_required_for_elongation", "actual_time_since_primordium_formation",
+                  "actual_time_since_emergence", "actual_time_since_cells_formation",
+                  "actual_potential_time_since_emergence", "actual_time_since_growth_stopped", "actual_time_since_death",
+                  "thermal_time_since_primordium_formation", "thermal_time_since_emergence",
+                  "thermal_time_since_cells_formation", "thermal_potential_time_since_emergence",
+                  "thermal_time_since_growth_stopped", "thermal_time_since_death")
+
+
+def growth_parameters(**parameters):
+    """
+    This function returns the default values of the growth parameters used by the generator, possibly overwritten.
+    :param parameters: values replacing the defaults of RootGrowthModel
+    :return: a dictionary of parameters
+    """
+    unknown = set(parameters) - set(GROWTH_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown growth parameters: {', '.join(sorted(unknown))}")
+    return {name: parameters.get(name, getattr(RootGrowthModel, name)) for name in GROWTH_PARAMETERS}
+
+
+def synthetic_axes(n_primary_segments, parameters, max_order=3, branching_probability=0.8, streams=None):
+    """
+    This function computes the architecture of a root system as a list of axes, the primary root having a given number
+    of segments.
+    :param n_primary_segments: the number of segments of the primary root
+    :param parameters: the growth parameters (see growth_parameters)
+    :param max_order: the highest root order
+    :param branching_probability: the probability that a lateral root emerges at each possible insertion
+    :param streams: the RandomStreams from which random numbers are drawn
+    :return: a dictionary of arrays describing each axis ("order", "radius", "n_segments", "mother" and "position",
+    the rank of the mother axis and that of the bearing segment on it being -1 for the primary root), axes being sorted
+    by order
+    """
+    if streams is None:
+        streams = RandomStreams()
+    min_radius = parameters["Dmin"] / 2.
+    # Number of segments between two successive insertions of lateral roots on an axis:
+    spacing = max(1, int(round(parameters["IPD"] / parameters["segment_length"])))
+
+    order = [np.array([1])]
+    radius = [np.array([parameters["D_ini"] / 2.])]
+    n_segments = [np.array([max(1, int(n_primary_segments))])]
+    mother = [np.array([-1])]
+    position = [np.array([-1])]
+    first_axis = 0
+    for root_order in range(2, max_order + 1):
+        mother_n_segments = n_segments[-1]
+        mother_ranks = first_axis + np.arange(len(mother_n_segments))
+        first_axis += len(mother_n_segments)
+
+        # We consider every segment of the mother axes on which a lateral root could have been formed:
+        candidate_mothers = np.repeat(mother_ranks, mother_n_segments)
+        starts = np.repeat(np.cumsum(mother_n_segments) - mother_n_segments, mother_n_segments)
+        candidate_positions = np.arange(len(candidate_mothers)) - starts
+        possible = candidate_positions % spacing == spacing - 1
+        candidate_mothers = candidate_mothers[possible]
+        candidate_positions = candidate_positions[possible]
+        if len(candidate_mothers) == 0:
+            break
+
+        # Random numbers are keyed by the insertion, so that they do not depend on the number of other insertions:
+        key = candidate_positions
+        emerged = streams.uniform(key, "synthetic_branching", step=candidate_mothers, draw=root_order) \
+                  < branching_probability
+        mother_radius = np.concatenate(radius)[candidate_mothers]
+        lateral_radius = ((mother_radius - min_radius) * parameters["RMD"] + min_radius) \
+                         * (1. + parameters["CVDD"] * streams.normal(key, "synthetic_radius", step=candidate_mothers,
+                                                                     draw=root_order))
+        # As in the growth module, a lateral root is never thicker than its mother root nor thinner than Dmin:
+        lateral_radius = np.clip(lateral_radius, min_radius, mother_radius)
+
+        # The final length of a root is proportional to the cube of its radius, and laterals are the shorter the closer
+        # to the tip of their mother axis:
+        mother_length = np.concatenate(n_segments)[candidate_mothers]
+        lateral_n_segments = np.round(mother_length * (lateral_radius / mother_radius) ** 3
+                                      * (1. - candidate_positions / mother_length)).astype(np.int64)
+        # Laterals that would not have a single segment are not formed:
+        formed = emerged & (lateral_n_segments >= 1)
+        if not formed.any():
+            break
+        order.append(np.full(formed.sum(), root_order))
+        radius.append(lateral_radius[formed])
+        n_segments.append(lateral_n_segments[formed])
+        mother.append(candidate_mothers[formed])
+        position.append(candidate_positions[formed])
+
+    return {"order": np.concatenate(order), "radius": np.concatenate(radius),
+            "n_segments": np.concatenate(n_segments), "mother": np.concatenate(mother),
+            "position": np.concatenate(position)}
+
+
+def _sized_axes(n_elements, parameters, max_order, branching_probability, streams):
+    """
+    This function finds the longest primary root whose root system has at most n_elements elements, and distributes
+    the missing elements on the longest axes so that the total is exactly n_elements.
+    """
+    def count(n_primary_segments):
+        axes = synthetic_axes(n_primary_segments, parameters, max_order, branching_probability, streams)
+        # Each axis is made of its segments and of one apex:
+        return int(axes["n_segments"].sum() + len(axes["n_segments"])), axes
+
+    low = 1
+    best = count(low)
+    # We first double the primary length until the target is exceeded, which bounds the size of the largest root
+    # system built, and then look for the largest primary length satisfying the target by bisection:
+    high = 2
+    while high < n_elements:
+        total, axes = count(high)
+        if total > n_elements:
+            high -= 1
+            break
+        low, best = high, (total, axes)
+        high *= 2
+    high = min(high, n_elements - 1)
+    while low < high:
+        middle = (low + high + 1) // 2
+        total, axes = count(middle)
+        if total <= n_elements:
+            low, best = middle, (total, axes)
+        else:
+            high = middle - 1
+    total, axes = best
+
+    missing = n_elements - total
+    if missing > 0:
+        # The missing segments are added one by one to the longest axes, in the apical zone where there is no lateral:
+        longest = np.argsort(-axes["n_segments"], kind="stable")
+        np.add.at(axes["n_segments"], longest[np.arange(missing) % len(longest)], 1)
+    return axes
+
+
+def synthetic_mtg(n_elements, seed=0, max_order=3, branching_probability=0.8, **parameters):
+    """
+    This function generates a fully initialized root MTG with a given number of elements, which can be used as the
+    initial MTG of a simulation.
+    :param n_elements: the number of root elements (segments and apices) of the MTG, at least 2
+    :param seed: the random seed, the same seed always giving the same MTG
+    :param max_order: the highest root order
+    :param branching_probability: the probability that a lateral root emerges at each possible insertion
+    :param parameters: values of growth parameters replacing the defaults of RootGrowthModel (see GROWTH_PARAMETERS)
+    :return: the MTG
+    """
+    if n_elements < 2:
+        raise ValueError("A root system has at least two elements (the base segment and its apex)")
+    parameters = growth_parameters(**parameters)
+    streams = RandomStreams(seed=seed)
+    axes = _sized_axes(int(n_elements), parameters, max_order, branching_probability, streams)
+
+    # LAYOUT OF ELEMENTS:
+    # -------------------
+    # Elements are numbered axis after axis, each axis from its base to its apex, so that mother elements are always
+    # created before their children (the MTG root being 0, the base of the root system is 1):
+    n_per_axis = axes["n_segments"] + 1
+    axis_start = np.cumsum(n_per_axis) - n_per_axis
+    axis = np.repeat(np.arange(len(n_per_axis)), n_per_axis)
+    position = np.arange(len(axis)) - axis_start[axis]
+    vids = np.arange(1, len(axis) + 1)
+    is_apex = position == axes["n_segments"][axis]
+    is_axis_base = position == 0
+
+    parents = vids - 1
+    lateral_bases = np.flatnonzero(is_axis_base)[1:]
+    lateral_axes = axis[lateral_bases]
+    parents[lateral_bases] = 1 + axis_start[axes["mother"][lateral_axes]] + axes["position"][lateral_axes]
+    parents[0] = -1
+
+    # GEOMETRY:
+    # ---------
+    segment_length = parameters["segment_length"]
+    apex_length = streams.uniform(np.arange(len(n_per_axis)), "synthetic_apex_length",
+                                  low=0.1 * segment_length, high=segment_length)
+    length = np.where(is_apex, apex_length[axis], segment_length)
+    radius = axes["radius"][axis]
+    root_order = axes["order"][axis]
+    # The distance from the tip of an element is the sum of the lengths from the tip of its axis to the element itself:
+    distance_from_tip = apex_length[axis] + (axes["n_segments"][axis] - position) * segment_length
+    distance_from_tip[is_apex] = apex_length[axis[is_apex]]
+    volume = np.pi * radius ** 2 * length
+    struct_mass = volume * parameters["new_root_tissue_density"]
+    growth_duration = parameters["GDs"] * (2. * radius) ** 2
+    growth_duration[root_order == 1] *= parameters["main_roots_growth_extender"]
+    life_duration = parameters["LDs"] * 2. * radius * parameters["new_root_tissue_density"]
+    angle_down = np.zeros(len(axis))
+    angle_down[lateral_bases] = np.where(root_order[lateral_bases] == 2, 45., 70.)
+    angle_roll = np.zeros(len(axis))
+    angle_roll[lateral_bases] = 5.
+
+    label = np.where(is_apex, "Apex", "Segment")
+    element_type = np.full(len(axis), "Normal_root_after_emergence", dtype=object)
+    element_type[0] = "Base_of_the_root_system"
+    edge_type = np.where(is_axis_base, "+", "<")
+
+    # MTG:
+    # ----
+    g = MTG()
+    g.add_component(g.root, component_id=1)
+    for vid, parent in zip(vids[1:].tolist(), parents[1:].tolist()):
+        g.add_child(parent, child=vid)
+
+    vid_list = vids.tolist()
+    n = len(vid_list)
+
+    def column(values):
+        return dict(zip(vid_list, values.tolist() if isinstance(values, np.ndarray) else [values] * n))
+
+    props = g.properties()
+    props["label"] = column(label)
+    props["edge_type"] = column(edge_type)
+    del props["edge_type"][1]
+    for name, values in (("type", element_type),
+                         ("root_order", root_order),
+                         ("lateral_root_emergence_possibility", "Impossible"),
+                         ("angle_down", angle_down),
+                         ("angle_roll", angle_roll),
+                         ("length", length),
+                         ("potential_length", length),
+                         ("initial_length", length),
+                         ("radius", radius),
+                         ("original_radius", radius),
+                         ("theoretical_radius", radius),
+                         ("potential_radius", radius),
+                         ("initial_radius", radius),
+                         ("volume", volume),
+                         ("root_tissue_density", parameters["new_root_tissue_density"]),
+                         ("distance_from_tip", distance_from_tip),
+                         ("former_distance_from_tip", distance_from_tip),
+                         ("struct_mass", struct_mass),
+                         ("initial_struct_mass", struct_mass),
+                         ("C_hexose_root", parameters["initial_C_hexose_root"]),
+                         ("root_hair_radius", parameters["root_hair_radius"]),
+                         ("root_hairs_lifespan", parameters["root_hairs_lifespan"]),
+                         ("all_root_hairs_formed", False),
+                         ("soil_temperature", 7.8),
+                         ("growth_duration", growth_duration),
+                         ("life_duration", life_duration)):
+        props[name] = column(values)
+    for name in NIL_PROPERTIES:
+        props[name] = column(0.)
+    return g
@@ -16,13 +16,11 @@ import os
 from decimal import Decimal
 from math import pi, cos, sin, floor
 import numpy as np
-import pandas as pd
 from copy import deepcopy # Allows to make a copy of a dictionnary and change it without modifying the original, whatever it is
 
-from openalea.mtg import turtle as turt
-from openalea.mtg.plantframe import color
-import openalea.plantgl.all as pgl
-import rhizodep.unused_but_ressource.parameters as param
+# NOTE: pandas, the display libraries (PlantGL, MTG turtle and colors) and the legacy parameters are imported by the
+# functions that use them, so that importing this module (e.g. in the worker processes of a simulation ensemble) does
+# not load them.
 
 
 # FUNCTIONS FOR DATA PREPROCESSING :
@@ -37,6 +35,7 @@ def formatted_inputs(original_input_file="None", final_input_file='updated_input
     If the option 'do_not_execute_if_file_with_suitable_size_exists' is set to True, a new file will be created only if the already-
     existing 'input_file.csv' does not contain the correct number of lines.
     """
+    import pandas as pd
 
     # If there is a file where the inputs of sucrose in the root system have to be read:
     if original_input_file != "None":
@@ -234,6 +233,7 @@ def buildDic(dict_scenario, dic=None):
     Function that build a nested dictionary (dict of dict), which is used in simulations/scenario_parameters/main_one_scenario.py
     e.g. buildDic({'a:b:c': 1, 'a:b:d': 2}) returns {'a': {'b': {'c': 1, 'd': 2}}}
     """
+    import pandas as pd
     if not dic:
         dic = {}
 
@@ -262,6 +262,7 @@ def get_root_visitor():
     This function describes the movement of the 'turtle' along the MTG for creating a graph on PlantGL.
     :return: root_visitor
     """
+    import rhizodep.unused_but_ressource.parameters as param
 
     def root_visitor(g, v, turtle):
         n = g.node(v)
@@ -329,6 +330,7 @@ def my_colormap(g, property_name, cmap='jet', vmin=None, vmax=None, lognorm=True
     :param lognorm: a Boolean describing whether the scale is logarithmic or not
     :return: the MTG with the corresponding color
     """
+    from openalea.mtg.plantframe import color
 
     # We make sure that the user did not accidently switch between vmin and vmax:
     if vmin >= vmax:
@@ -370,6 +372,7 @@ def prepareScene(scene, width=1200, height=1200, scale=0.8, x_center=0., y_cente
     :param grid: a Boolean describing whether grids should be displayed on the graph
     :return: scene
     """
+    import openalea.plantgl.all as pgl
 
     # We define the coordinates of the point cam_target that will be the center of the graph:
     cam_target = pgl.Vector3(x_center * scale,
@@ -444,6 +447,8 @@ def plot_mtg(g, prop_cmap='hexose_exudation', cmap='jet', lognorm=True, vmin=1e-
     :param z_cam: the z-coordinate of the camera looking at the center of the graph
     :return: the updated scene
     """
+    import openalea.plantgl.all as pgl
+    from openalea.mtg import turtle as turt
 
     # Consider: https://learnopengl.com/In-Practice/Text-Rendering
 
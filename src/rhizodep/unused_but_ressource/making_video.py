@@ -1,6 +1,10 @@
 import imageio
 from PIL import Image, ImageDraw, ImageFont
 import os
+import json
+import hashlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 # from pygifsicle import optimize
 from openalea.mtg.plantframe import color
@@ -206,6 +210,218 @@ def colorbar(title="Radius (m)", cmap='jet', lognorm=True, n_thicks_for_linear_s
     return fig
 
 
+# Functions for transforming frames in parallel:
+#-----------------------------------------------
+def making_colorbar_image(outputs_path='outputs', colorbar_title="Radius (m)", colorbar_cmap='jet',
+                          colorbar_lognorm=True, n_thicks_for_linear_scale=6, vmin=1e-6, vmax=1e0):
+    """
+    This function creates the image of a colorbar, or reuses the one already created in the same folder with the same
+    settings, so that the (slow) matplotlib drawing is only made once for all frames and scenarios.
+    :param outputs_path: the folder in which the image 'colorbar.png' is recorded
+    :[other parameters]: [cf the parameters from the function 'colorbar']
+    :return: the path of the colorbar image, and a hash identifying its settings
+    """
+    settings = dict(title=colorbar_title, cmap=colorbar_cmap, lognorm=colorbar_lognorm,
+                    n_thicks_for_linear_scale=n_thicks_for_linear_scale, vmin=vmin, vmax=vmax)
+    settings_hash = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+    path_colorbar = os.path.join(outputs_path, 'colorbar.png')
+    path_settings = os.path.join(outputs_path, 'colorbar.json')
+    if os.path.exists(path_colorbar) and os.path.exists(path_settings):
+        with open(path_settings) as f:
+            if json.load(f).get("hash") == settings_hash:
+                return path_colorbar, settings_hash
+
+    # We create the colorbar:
+    bar = colorbar(**settings)
+    # We save it in the output directory:
+    bar.savefig(path_colorbar, facecolor="None", edgecolor="None")
+    plt.close(bar)
+    with open(path_settings, "w") as f:
+        json.dump({"hash": settings_hash, "settings": settings}, f)
+    return path_colorbar, settings_hash
+
+
+@lru_cache(maxsize=None)
+def _loaded_colorbar(path_colorbar, settings_hash):
+    # Each process opens and resizes the colorbar only once:
+    bar = Image.open(path_colorbar)
+    return bar.resize((1200, 200))
+
+
+@lru_cache(maxsize=None)
+def _loaded_font(font_size):
+    # See a list of available fonts on: https://docs.microsoft.com/en-us/typography/fonts/windows_10_font_list
+    return ImageFont.truetype("./timesbd.ttf", font_size)
+
+
+def frame_hash(filename, settings):
+    """
+    This function identifies the content of a transformed frame, from the content of the original image and the
+    settings of its transformation.
+    """
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode())
+    with open(filename, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def transforming_frame(filename, image_name, settings):
+    """
+    This function adds a colorbar and a time indication on an image, resizes it if needed, and records it.
+    :param filename: the path of the original image
+    :param image_name: the path of the transformed image
+    :param settings: a dictionary with the time in days and the options of the function 'resizing_and_film_making'
+    :return: the path of the transformed image
+    """
+    # Opening the image to modify:
+    im = Image.open(filename)
+
+    # Adding colorbar:
+    if settings["colorbar_path"] is not None:
+        bar = _loaded_colorbar(settings["colorbar_path"], settings["colorbar_hash"])
+        if settings["colorbar_position"] == 1:
+            box_colorbar = (-120, 1070)
+        elif settings["colorbar_position"] == 2:
+            box_colorbar = (-120, 870)
+        im.paste(bar, box_colorbar, bar.convert('RGBA'))
+
+    # Adding text:
+    if settings["time_printing"]:
+        time_text = "t = " + str(int(floor(settings["time_in_days"]))) + " days"
+
+        # OPTION 1 FOR ROOT SYSTEMS:
+        # ---------------------------
+        if settings["time_position"] == 1:
+            draw = ImageDraw.Draw(im)
+            (x1, y1) = (40, 40)
+            draw.rectangle((x1 - 10, y1 - 10, x1 + 200, y1 + 50), fill=(255, 255, 255, 200))
+            draw.text((x1, y1), time_text, fill=(0, 0, 0), font=_loaded_font(35))
+
+        # OPTION 2 FOR Z BARPLOTS:
+        # -----------------------
+        if settings["time_position"] == 2:
+            draw = ImageDraw.Draw(im)
+            (x1, y1) = (650, 420)
+            draw.rectangle((x1 - 10, y1 - 10, x1 + 200, y1 + 30), fill=(255, 255, 255, 0))
+            draw.text((x1, y1), time_text, fill=(0, 0, 0), font=_loaded_font(20))
+
+    # Transforming the image:
+    if settings["dimensions"] is not None:
+        im_to_print = im.resize(tuple(settings["dimensions"]), resample=0)
+    else:
+        im_to_print = im
+
+    # Saving the new image in a temporary file first, so that an interrupted run never leaves a truncated image:
+    temporary_name = image_name + ".tmp.png"
+    im_to_print.save(temporary_name, quality=20, optimize=True)
+    os.replace(temporary_name, image_name)
+    return image_name
+
+
+def _transforming_frame_task(task):
+    return transforming_frame(*task)
+
+
+def transforming_frames(tasks, max_workers=None):
+    """
+    This function transforms a list of frames, possibly coming from different scenarios, over a pool of processes.
+    Frames whose transformed image already exists with the same content hash are skipped, so that an interrupted
+    transformation can be resumed.
+    :param tasks: a list of (original image, transformed image, settings) tuples
+    :param max_workers: the number of processes (by default, the number of CPUs; if 1, frames are transformed in the
+    current process)
+    :return: the number of transformed frames
+    """
+    # The hashes of frames already transformed are recorded in each destination folder:
+    manifests = {}
+    to_transform = []
+    hashes = []
+    for filename, image_name, settings in tasks:
+        directory = os.path.dirname(image_name)
+        if directory not in manifests:
+            manifest_path = os.path.join(directory, "frames_hashes.json")
+            manifests[directory] = {}
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    manifests[directory] = json.load(f)
+        content_hash = frame_hash(filename, settings)
+        name = os.path.basename(image_name)
+        if manifests[directory].get(name) == content_hash and os.path.exists(image_name):
+            continue
+        to_transform.append((filename, image_name, settings))
+        hashes.append((directory, name, content_hash))
+
+    print(len(tasks) - len(to_transform), "image(s) already transformed,", len(to_transform), "image(s) to transform.")
+    if max_workers == 1 or len(to_transform) <= 1:
+        results = map(_transforming_frame_task, to_transform)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        chunksize = max(1, len(to_transform) // (4 * (max_workers or os.cpu_count() or 1)))
+        results = executor.map(_transforming_frame_task, to_transform, chunksize=chunksize)
+    try:
+        for count, ((directory, name, content_hash), _) in enumerate(zip(hashes, results)):
+            manifests[directory][name] = content_hash
+            if (count + 1) % 100 == 0 or count + 1 == len(to_transform):
+                print("Transforming the images - please wait:", len(to_transform) - count - 1, "image(s) left")
+                _writing_manifests(manifests)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        _writing_manifests(manifests)
+    return len(to_transform)
+
+
+def _writing_manifests(manifests):
+    for directory, hashes in manifests.items():
+        manifest_path = os.path.join(directory, "frames_hashes.json")
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(hashes, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def _frames_tasks(outputs_path, images_folder, resized_images_folder, colorbar_path, colorbar_hash,
+                  colorbar_position, resizing, dividing_size_by, time_printing, time_position, time_step_in_days,
+                  sampling_frequency):
+    """
+    This function lists the frames of a folder to transform, and prepares the destination folder.
+    """
+    images_directory = os.path.join(outputs_path, images_folder)
+    resized_images_directory = os.path.join(outputs_path, resized_images_folder)
+
+    # Getting a list of the names of the images found in the directory:
+    filenames = Path(images_directory).glob('*.png')
+    filenames = sorted(filenames)
+    # We define the final number of images that will be considered, based on the "sampling_frequency" variable:
+    number_of_images = floor(len(filenames) / float(sampling_frequency))
+    # One image every 'sampling_frequency' images is considered:
+    selected_filenames = filenames[sampling_frequency - 1::sampling_frequency][:number_of_images]
+
+    if not os.path.exists(resized_images_directory):
+        os.mkdir(resized_images_directory)
+
+    # We calculate the dimensions of the new images according to the variable size_division:
+    dimensions = (int(1600 / dividing_size_by), int(1055 / dividing_size_by)) if resizing else None
+    tasks = []
+    for number, filename in enumerate(selected_filenames):
+        filename = str(filename)
+        # We get the last characters of the path of the file, which correspond to the actual name 'rootXXXXX':
+        name = filename[-13:-4] + '.png'
+        settings = dict(time_in_days=time_step_in_days * number * sampling_frequency,
+                        colorbar_path=colorbar_path, colorbar_hash=colorbar_hash,
+                        colorbar_position=colorbar_position, time_printing=time_printing,
+                        time_position=time_position, dimensions=dimensions)
+        tasks.append((filename, os.path.join(resized_images_directory, name), settings))
+
+    # Images of a previous transformation that do not correspond to the current frames are deleted, so that they are
+    # not included in the movie:
+    expected = set(os.path.basename(task[1]) for task in tasks)
+    for file in os.listdir(resized_images_directory):
+        if file.endswith('.png') and file not in expected:
+            os.remove(os.path.join(resized_images_directory, file))
+    return tasks
+
+
 # Definition of a function that can resize a list of images and make a movie from it:
 #------------------------------------------------------------------------------------
 def resizing_and_film_making(outputs_path='outputs',
@@ -222,7 +438,7 @@ def resizing_and_film_making(outputs_path='outputs',
                              vmin=1e-6, vmax=1e0,
                              time_printing=True, time_position=1,
                              time_step_in_days=1., sampling_frequency=1, fps=24,
-                             title=""):
+                             title="", max_workers=None, colorbar_image=None):
 
     """
     This function enables to resize some images, add a time indication and a colorbar on them, and create a movie from it.
@@ -248,174 +464,81 @@ def resizing_and_film_making(outputs_path='outputs',
     :param sampling_frequency: the frequency at which images should be picked up and included in the transformation/movie (i.e. 1 image every X images)
     :param fps: frames per second for the .gif movie to create
     :param title: the name of the movie file
+    :param max_workers: the number of processes transforming images (by default, the number of CPUs)
+    :param colorbar_image: the (path, hash) of a colorbar image already made with 'making_colorbar_image', if any
     :return:
     """
 
-    images_directory=os.path.join(outputs_path, images_folder)
     resized_images_directory = os.path.join(outputs_path, resized_images_folder)
 
-    # Getting a list of the names of the images found in the directory "video":
-    filenames = Path(images_directory).glob('*.png')
-    filenames = sorted(filenames)
+    # 1. COMPRESSING THE IMAGES:
+    if image_transforming:
+        print("Transforming the images and copying them into the directory", resized_images_folder, "...")
+        if colorbar_option and colorbar_image is None:
+            colorbar_image = making_colorbar_image(outputs_path, colorbar_title=colorbar_title,
+                                                  colorbar_cmap=colorbar_cmap, colorbar_lognorm=colorbar_lognorm,
+                                                  n_thicks_for_linear_scale=n_thicks_for_linear_scale,
+                                                  vmin=vmin, vmax=vmax)
+        bar_path, bar_hash = colorbar_image if colorbar_option else (None, None)
+        tasks = _frames_tasks(outputs_path, images_folder, resized_images_folder, bar_path, bar_hash,
+                              colorbar_position, resizing, dividing_size_by, time_printing, time_position,
+                              time_step_in_days, sampling_frequency)
+        transforming_frames(tasks, max_workers=max_workers)
+        print("The new images have been transformed!")
 
-    # We define the final number of images that will be considered, based on the "sampling_frequency" variable:
-    number_of_images = floor(len(filenames) / float(sampling_frequency))
+    # 2. CREATING THE VIDEO FILE:
+    if film_making:
+        film_making_from_images(outputs_path=outputs_path, images_folder=images_folder,
+                                resized_images_folder=resized_images_folder, film_name=film_name,
+                                image_transforming=image_transforming, sampling_frequency=sampling_frequency, fps=fps)
 
-    if colorbar_option:
-        path_colorbar = os.path.join(outputs_path, 'colorbar.png')
-        # We create the colorbar:
-        bar = colorbar(title=colorbar_title,
-                       cmap=colorbar_cmap,
-                       lognorm=colorbar_lognorm,
-                       n_thicks_for_linear_scale=n_thicks_for_linear_scale,
-                       vmin=vmin, vmax=vmax)
-        # We save it in the output directory:
-        bar.savefig(path_colorbar, facecolor="None", edgecolor="None")
-        # We reload the bar with Image package:
-        bar = Image.open(path_colorbar)
-        new_size = (1200, 200)
-        bar = bar.resize(new_size)
-        if colorbar_position==1:
-            box_colorbar = (-120,1070)
-        elif colorbar_position==2:
-            box_colorbar = (-120, 870)
+    return
 
-    # 1. COMPRESSING THE IMAGES:
-    if image_transforming:
-        # If this directory doesn't exist:
-        if not os.path.exists(resized_images_directory):
-            # Then we create it:
-            os.mkdir(resized_images_directory)
-        else:
-            # Otherwise, we delete all the images that are already present inside:
-            for root, dirs, files in os.walk(resized_images_directory):
-                for file in files:
-                    os.remove(os.path.join(root, file))
-
-        # We modify each image:
-        print("Transforming the images and copying them into the directory 'root_images_resized'...")
-        # We initialize the counts:
-        number = 0
-        count = 0
-        remaining_images = number_of_images
 
-        # We calculate the dimensions of the new images according to the variable size_division:
-        dimensions = (int(1600 / dividing_size_by), int(1055 / dividing_size_by))
+def film_making_from_images(outputs_path='outputs', images_folder='root_images',
+                            resized_images_folder='root_images_resized', film_name="root_movie.gif",
+                            image_transforming=True, sampling_frequency=1, fps=24):
+    """
+    This function assembles the (transformed) images of a folder into a movie.
+    :[parameters]: [cf the parameters from the function 'resizing_and_film_making']
+    :return:
+    """
+    print("Making the video...")
 
+    images_directory = os.path.join(outputs_path, images_folder)
+    resized_images_directory = os.path.join(outputs_path, resized_images_folder)
+    with imageio.get_writer(os.path.join(outputs_path, film_name), mode='I', fps=fps) as writer:
+        if image_transforming:
+            filenames = Path(resized_images_directory).glob('*.png')
+            filenames = sorted(filenames)
+            sampling_frequency = 1
+        else:
+            filenames = Path(images_directory).glob('*.png')
+            filenames = sorted(filenames)
+            sampling_frequency = sampling_frequency
+        remaining_images = floor(len(filenames) / float(sampling_frequency)) + 1
+        print(remaining_images, "images are considered at this stage.")
+        # We add the first image:
+        filename = filenames[0]
+        image = imageio.imread(str(filename))
+        writer.append_data(image)
+        # We reduce the number of images left:
+        remaining_images = remaining_images - 1
+        # We start the count at 0:
+        count = 0
         # We cover each image in the directory:
         for filename in filenames:
-
-            # The time is calculated:
-            time_in_days = time_step_in_days * (number_of_images - remaining_images) * sampling_frequency
             # The count is increased:
             count += 1
-            # If the count corresponds to the target number, the image is added to the gif:
+            # If it corresponds to the target number, the image is added to the gif:
             if count == sampling_frequency:
-                print("Transforming the images - please wait:", str(int(remaining_images)), "image(s) left")
-
-                # Opening the image to modify:
-                im = Image.open(filename)
-
-                # Adding colorbar:
-                if colorbar_option:
-                    im.paste(bar, box_colorbar, bar.convert('RGBA'))
-
-                # Adding text:
-                if time_printing:
-
-                    # OPTION 1 FOR ROOT SYSTEMS:
-                    # ---------------------------
-                    if time_position == 1:
-                        draw = ImageDraw.Draw(im)
-                        # For time display:
-                        # ------------------
-                        # draw.text((x, y),"Sample Text",(r,g,b))
-                        font_time = ImageFont.truetype("./timesbd.ttf", 35)
-                        # See a list of available fonts on: https://docs.microsoft.com/en-us/typography/fonts/windows_10_font_list
-                        (x1, y1) = (40, 40)
-                        time_text = "t = " + str(int(floor(time_in_days))) + " days"
-                        draw.rectangle((x1 - 10, y1 - 10, x1 + 200, y1 + 50), fill=(255, 255, 255, 200))
-                        draw.text((x1, y1), time_text, fill=(0, 0, 0), font=font_time)
-                        # draw.set_bbox(dict(facecolor='red', alpha=0.5, edgecolor='red'))
-
-                    # OPTION 2 FOR Z BARPLOTS:
-                    # -----------------------
-                    if time_position == 2:
-                        draw = ImageDraw.Draw(im)
-                        # For time display:
-                        # ------------------
-                        # draw.text((x, y),"Sample Text",(r,g,b))
-                        font_time = ImageFont.truetype("./timesbd.ttf", 20)
-                        # See a list of available fonts on: https://docs.microsoft.com/en-us/typography/fonts/windows_10_font_list
-                        (x1, y1) = (650, 420)
-                        time_text = "t = " + str(int(floor(time_in_days))) + " days"
-                        draw.rectangle((x1 - 10, y1 - 10, x1 + 200, y1 + 30), fill=(255, 255, 255, 0))
-                        draw.text((x1, y1), time_text, fill=(0, 0, 0), font=font_time)
-                        # draw.set_bbox(dict(facecolor='red', alpha=0.5, edgecolor='red'))
-
-                    # # For caption of colorbar:
-                    # # ------------------------
-                    # title_text_position=(100,1020)
-                    # font_title = ImageFont.truetype("./timesbd.ttf", 23)
-                    # # text_color =(200,200,200,255) #RGBA, the last digit corresponds to alpha canal (transparency)
-                    # # draw.text(title_text_position, title, (0, 0, 0), font=font_title, fill=text_color)
-                    # draw.text(title_text_position, title, (0, 0, 0), font=font_title)
-
-                # Transforming the image:
-                if resizing:
-                    im_to_print = im.resize(dimensions, resample=0)
-                else:
-                    im_to_print = im
-
-                # We get the last characters of the path of the file, which correspond to the actual name 'rootXXXXX':
-                name = filename[-13:-4] + '.png'
-                # Saving the new image:
-                image_name = os.path.join(resized_images_directory, name)
-                im_to_print.save(image_name, quality=20, optimize=True)
-
-                # We update the local counts:
-                number = number + 1
+                print("Creating the video - please wait:", str(int(remaining_images)), "image(s) left")
+                image = imageio.imread(str(filename))
+                writer.append_data(image)
                 remaining_images = remaining_images - 1
+                # We reset the count to 0:
                 count = 0
-        print("The new images have been transformed!")
-
-    # 2. CREATING THE VIDEO FILE:
-    if film_making:
-
-        print("Making the video...")
-
-        with imageio.get_writer(os.path.join(outputs_path, film_name), mode='I', fps=fps) as writer:
-            if image_transforming:
-                filenames = Path(resized_images_directory).glob('*.png')
-                filenames = sorted(filenames)
-                sampling_frequency = 1
-            else:
-                filenames = Path(images_directory).glob('*.png')
-                filenames = sorted(filenames)
-                sampling_frequency = sampling_frequency
-            remaining_images = floor(len(filenames) / float(sampling_frequency)) + 1
-            print(remaining_images, "images are considered at this stage.")
-            # We add the first image:
-            filename = filenames[0]
-            image = imageio.imread(str(filename))
-            writer.append_data(image)
-            # We reduce the number of images left:
-            remaining_images = remaining_images - 1
-            # We start the count at 0:
-            count = 0
-            # We cover each image in the directory:
-            for filename in filenames:
-                # The count is increased:
-                count += 1
-                # If it corresponds to the target number, the image is added to the gif:
-                if count == sampling_frequency:
-                    print("Creating the video - please wait:", str(int(remaining_images)), "image(s) left")
-                    image = imageio.imread(str(filename))
-                    writer.append_data(image)
-                    remaining_images = remaining_images - 1
-                    # We reset the count to 0:
-                    count = 0
-        print("The video has been made!")
+    print("The video has been made!")
 
     return
 
@@ -435,43 +558,47 @@ def resizing_and_film_making_for_scenarios(general_outputs_folder='outputs',
                                            vmin=1e-6, vmax=1e0,
                                            time_printing=True, time_position=1,
                                            time_step_in_days=1., sampling_frequency=1, frames_per_second=24,
-                                           title=""
+                                           title="", max_workers=None
                                            ):
 
     """
     This function creates the same type of movie in symetric outputs generated from different scenarios.
+    The colorbar is made once for all scenarios, and the frames of all scenarios are transformed by the same pool of
+    processes.
     :param general_outputs_folder: the path of the general foleder, in which respective output folders from different scenarios have been recorded
     :param images_folder: the name of the images folder in each scenario
     :param resized_images_folder: the image of the transformed images folder in each scenario
     :param scenario_numbers: a list of numbers corresponding to the different scenarios to consider
+    :param max_workers: the number of processes transforming images (by default, the number of CPUs)
     :[other parameters]: [cf the parameters from the function 'resizing_and_film_making']
     :return:
     """
 
-    for i in scenario_numbers:
-
-        scenario_name = 'Scenario_%.4d' % i
-        scenario_path = os.path.join(general_outputs_folder, scenario_name)
-
-        print("")
-        print("Creating a movie for", scenario_name,"..." )
-
-        resizing_and_film_making(outputs_path=scenario_path,
-                                 images_folder=images_folder,
-                                 resized_images_folder=resized_images_folder,
-                                 film_making=film_making,
-                                 film_name=film_name,
-                                 sampling_frequency=sampling_frequency, fps=frames_per_second,
-                                 time_step_in_days=time_step_in_days,
-                                 image_transforming=image_transforming,
-                                 time_printing=time_printing, time_position=time_position,
-                                 colorbar_option=colorbar_option, colorbar_position=colorbar_position,
-                                 colorbar_title=colorbar_title,
-                                 colorbar_cmap=colorbar_cmap, colorbar_lognorm=colorbar_lognorm,
-                                 n_thicks_for_linear_scale=n_thicks_for_linear_scale,
-                                 vmin=vmin, vmax=vmax,
-                                 resizing=resizing, dividing_size_by=dividing_size_by,
-                                 title=title)
+    scenario_paths = [os.path.join(general_outputs_folder, 'Scenario_%.4d' % i) for i in scenario_numbers]
+
+    if image_transforming:
+        bar_path, bar_hash = None, None
+        if colorbar_option:
+            bar_path, bar_hash = making_colorbar_image(general_outputs_folder, colorbar_title=colorbar_title,
+                                                       colorbar_cmap=colorbar_cmap, colorbar_lognorm=colorbar_lognorm,
+                                                       n_thicks_for_linear_scale=n_thicks_for_linear_scale,
+                                                       vmin=vmin, vmax=vmax)
+        tasks = []
+        for scenario_path in scenario_paths:
+            tasks += _frames_tasks(scenario_path, images_folder, resized_images_folder, bar_path, bar_hash,
+                                   colorbar_position, resizing, dividing_size_by, time_printing, time_position,
+                                   time_step_in_days, sampling_frequency)
+        print("Transforming the images of", len(scenario_paths), "scenarios...")
+        transforming_frames(tasks, max_workers=max_workers)
+
+    if film_making:
+        for scenario_path in scenario_paths:
+            print("")
+            print("Creating a movie for", os.path.basename(scenario_path), "...")
+            film_making_from_images(outputs_path=scenario_path, images_folder=images_folder,
+                                    resized_images_folder=resized_images_folder, film_name=film_name,
+                                    image_transforming=image_transforming, sampling_frequency=sampling_frequency,
+                                    fps=frames_per_second)
 
     return
 
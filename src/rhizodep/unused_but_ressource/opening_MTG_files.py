@@ -16,6 +16,7 @@ import openalea.plantgl.all as pgl
 from openalea.plantgl.all import *
 from PIL import Image, ImageDraw, ImageFont
 from rhizodep.tools import my_colormap, get_root_visitor, prepareScene, circle_coordinates, plot_mtg
+from rhizodep.depth_profile import depth_profile, PROFILE_VARIABLES
 
 import pickle
 
@@ -185,87 +186,28 @@ def classifying_on_z(g, z_min=0, z_max=1, z_interval=0.1):
     """
     This function calculates the distribution of certain characteristics of a MTG g according to the depth z.
     For each z-layer between z_min and z_max and each root segment, specific variables are computed, depending on the
-    length within the segment that is intercepted between the upper and lower horizontal plane [use of 'sub_length' functino].
+    length within the segment that is intercepted between the upper and lower horizontal plane [same result as the
+    'sub_length_z' function, computed for all segments and layers at once by rhizodep.depth_profile].
     :param g: the MTG on which calculations are made
     :param z_min: the depth to which we start computing
     :param z_max: the maximal depth to which we stop computing
     :param z_interval: the thickness of each layer to consider between z_min and z_max
     :return: a dictionnary containing the results
     """
-    # We initialize empty dictionnaries:
-    included_length = {}
-    dictionnary_length = {}
-    dictionnary_struct_mass = {}
-    dictionnary_root_necromass = {}
-    dictionnary_surface = {}
-    dictionnary_net_hexose_exudation = {}
-    dictionnary_hexose_degradation = {}
-    final_dictionnary = {}
+    # All layers are computed at once for all vertices:
+    vids = g.vertices(scale=1)
+    profile = depth_profile(g, z_min=z_min, z_max=z_max, z_interval=z_interval, vids=vids, record_lengths=True)
 
-    # For each interval of z values to be considered:
-    for z_start in np.arange(z_min, z_max, z_interval):
+    # We record the summed values for each interval of z in a dictionnary, with the names used so far:
+    final_dictionnary = {}
+    for name in PROFILE_VARIABLES:
+        for z_start, value in zip(profile["z_start"], profile[name]):
+            final_dictionnary[name + "_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"] = float(value)
 
-        # We create the names of the new properties of the MTG to be computed, based on the current z interval:
+    # We also create new properties of the MTG that correspond to the length of each node in each z interval:
+    for layer, z_start in enumerate(profile["z_start"]):
         name_length_z = "length_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"
-        name_struct_mass_z = "struct_mass_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"
-        name_root_necromass_z = "root_necromass_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"
-        name_surface_z = "surface_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"
-        name_net_hexose_exudation_z = "net_hexose_exudation_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"
-        name_hexose_degradation_z = "hexose_degradation_" + str(z_start) + "-" + str(z_start + z_interval) + "_m"
-
-        # We (re)initialize total values:
-        total_included_length = 0
-        total_included_struct_mass = 0
-        total_included_root_necromass = 0
-        total_included_surface = 0
-        total_included_net_hexose_exudation = 0
-        total_included_hexose_degradation = 0
-
-        # We cover all the vertices in the MTG:
-        for vid in g.vertices_iter(scale=1):
-            # n represents the vertex:
-            n = g.node(vid)
-
-            # We make sure that the vertex has a positive length:
-            if n.length > 0.:
-                # We calculate the fraction of the length of this vertex that is included in the current range of z value:
-                fraction_length = sub_length_z(x1=n.x1, y1=n.y1, z1=-n.z1, x2=n.x2, y2=n.y2, z2=-n.z2,
-                                               z_first_layer=z_start,
-                                               z_second_layer=z_start + z_interval) / n.length
-                included_length[vid] = fraction_length * n.length
-            else:
-                # Otherwise, the fraction length and the length included in the range are set to 0:
-                fraction_length = 0.
-                included_length[vid] = 0.
-
-            # We summed different variables based on the fraction of the length included in the z interval:
-            total_included_length += n.length * fraction_length
-            total_included_struct_mass += n.struct_mass * fraction_length
-            if n.type == "Dead" or n.type == "Just_dead":
-                total_included_root_necromass += n.struct_mass * fraction_length
-            total_included_surface += n.external_surface * fraction_length
-            total_included_net_hexose_exudation += (n.hexose_exudation - n.hexose_uptake) * fraction_length
-            total_included_hexose_degradation += n.hexose_degradation * fraction_length
-
-        # We record the summed values for this interval of z in several dictionnaries:
-        dictionnary_length[name_length_z] = total_included_length
-        dictionnary_struct_mass[name_struct_mass_z] = total_included_struct_mass
-        dictionnary_root_necromass[name_root_necromass_z] = total_included_root_necromass
-        dictionnary_surface[name_surface_z] = total_included_surface
-        dictionnary_net_hexose_exudation[name_net_hexose_exudation_z] = total_included_net_hexose_exudation
-        dictionnary_hexose_degradation[name_hexose_degradation_z] = total_included_hexose_degradation
-
-        # We also create a new property of the MTG that corresponds to the fraction of length of each node in the z interval:
-        g.properties()[name_length_z] = included_length
-
-    # Finally, we merge all dictionnaries into a single one that will be returned by the function:
-    final_dictionnary = dict(list(dictionnary_length.items())
-                             + list(dictionnary_struct_mass.items())
-                             + list(dictionnary_root_necromass.items())
-                             + list(dictionnary_surface.items())
-                             + list(dictionnary_net_hexose_exudation.items())
-                             + list(dictionnary_hexose_degradation.items())
-                             )
+        g.properties()[name_length_z] = dict(zip(vids, profile["element_lengths"][:, layer].tolist()))
 
     return final_dictionnary
 
@@ -0,0 +1,173 @@
+"""
+Scaling benchmark of Model.run() and of each of its phases on root systems of increasing size.
+
+Usage (from the root of the repository):
+    python test/benchmark_scaling.py                      # prints the scaling table
+    python test/benchmark_scaling.py --update-baseline    # records the results as the new baseline
+    python test/benchmark_scaling.py --check              # fails if the cost per element regressed vs the baseline
+    python test/benchmark_scaling.py --plot scaling.png   # also draws the time per step vs the number of elements
+
+Root systems are generated with rhizodep.synthetic_mtg, so that any size is available immediately. With --grown, they are
+instead obtained by running the model until it reaches the target number of elements, once: each state is then saved as
+a checkpoint (see rhizodep.checkpoint) in the cache folder and reloaded by later benchmarks.
+"""
+
+import os
+import sys
+import json
+import argparse
+import platform
+from statistics import median
+
+from rhizodep.rhizodep import Model
+from rhizodep.synthetic_mtg import synthetic_mtg
+
+SIZES = (100, 1000, 10000, 100000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "inputs", "benchmark_baseline.json")
+DEFAULT_CACHE = os.path.join(os.path.dirname(__file__), "outputs", "benchmark_systems")
+
+# Phases of Model.run() timed by its StepTimer (see rhizodep.step_timing), in the order in which they are called:
+PHASES = ("soil", "growth", "anatomy_post_growth_updating", "carbon_post_growth_updating", "soil_post_growth_updating",
+          "anatomy", "carbon")
+
+
+def number_of_elements(model):
+    return len(model.g.vertices(scale=1))
+
+
+def synthetic_root_system(n_elements, seed=0, scenario=None):
+    """
+    This function returns a model initialized with a synthetic root system of n_elements elements.
+    """
+    return Model(time_step=3600, g=synthetic_mtg(n_elements, seed=seed), **(scenario or {}))
+
+
+def root_system(n_elements, cache_dirpath=DEFAULT_CACHE, scenario=None, max_steps=10000):
+    """
+    This function returns a model whose root system has at least n_elements elements, grown once and then reloaded
+    from a checkpoint.
+    """
+    model = Model(time_step=3600, **(scenario or {}))
+    checkpoint_path = os.path.join(cache_dirpath, "system_%d.npz" % n_elements)
+    if os.path.exists(checkpoint_path):
+        model.load_checkpoint(checkpoint_path)
+        return model
+
+    print("Growing a root system of", n_elements, "elements (only done once)...")
+    step = 0
+    while number_of_elements(model) < n_elements and step < max_steps:
+        model.run()
+        step += 1
+    os.makedirs(cache_dirpath, exist_ok=True)
+    model.save_checkpoint(checkpoint_path)
+    return model
+
+
+def benchmark(model, n_steps=3):
+    """
+    This function times n_steps of the model, phase by phase.
+    :return: a dictionary of the median durations (s) of each phase and of the whole step
+    """
+    timer = model.enable_timing(processes=False)
+    for _ in range(n_steps):
+        model.run()
+    model.disable_timing()
+    return {name: median(timer.durations(name).tolist()) for name in ("run",) + PHASES}
+
+
+def scaling_table(results):
+    """
+    This function formats the results as a table of durations per step and per element.
+    """
+    names = ["run"] + list(PHASES)
+    lines = ["%-32s" % "phase" + "".join("%16s" % ("%d elements" % r["n_elements"]) for r in results)]
+    for name in names:
+        lines.append("%-32s" % name + "".join("%9.3f ms/st." % (1e3 * r["durations"][name]) for r in results))
+    lines.append("%-32s" % "run per element"
+                 + "".join("%9.3f us/el." % (1e6 * r["durations"]["run"] / r["n_elements"]) for r in results))
+    return "\n".join(lines)
+
+
+def check_against_baseline(results, baseline, tolerance=1.5):
+    """
+    This function compares the time per element of each phase with a baseline.
+    :return: the list of regressions found
+    """
+    regressions = []
+    reference = {r["target"]: r for r in baseline["results"]}
+    for result in results:
+        if result["target"] not in reference:
+            continue
+        previous = reference[result["target"]]
+        for name, duration in result["durations"].items():
+            cost = duration / result["n_elements"]
+            previous_cost = previous["durations"][name] / previous["n_elements"]
+            # Very short phases are not compared, as their duration is dominated by noise:
+            if previous["durations"][name] > 1e-3 and cost > tolerance * previous_cost:
+                regressions.append("%s at %d elements: %.3g s/element instead of %.3g"
+                                   % (name, result["target"], cost, previous_cost))
+    return regressions
+
+
+def plot(results, filename):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    n_elements = [r["n_elements"] for r in results]
+    for name in ["run"] + list(PHASES):
+        ax.loglog(n_elements, [r["durations"][name] for r in results], marker="o", label=name)
+    ax.set_xlabel("Number of root elements")
+    ax.set_ylabel("Duration per step (s)")
+    ax.legend()
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--steps", type=int, default=3, help="number of timed steps for each size")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic root systems")
+    parser.add_argument("--grown", action="store_true", help="benchmark simulated root systems instead of synthetic ones")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="folder of the simulated root systems")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="accepted ratio of the cost per element")
+    parser.add_argument("--plot", default=None, help="path of an image of the scaling curves")
+    args = parser.parse_args()
+
+    # The baseline is looked for before running the benchmark, which can take a long time:
+    if args.check and not args.update_baseline and not os.path.exists(args.baseline):
+        sys.exit("No baseline found in %s: record one on the reference machine with --update-baseline first."
+                 % args.baseline)
+
+    results = []
+    for target in args.sizes:
+        if args.grown:
+            model = root_system(target, cache_dirpath=args.cache)
+        else:
+            model = synthetic_root_system(target, seed=args.seed)
+        n_elements = number_of_elements(model)
+        results.append({"target": target, "n_elements": n_elements, "durations": benchmark(model, args.steps)})
+        print("%d elements: %.3f s per step" % (n_elements, results[-1]["durations"]["run"]))
+
+    print()
+    print(scaling_table(results))
+    if args.plot:
+        plot(results, args.plot)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": platform.node(), "python": platform.python_version(), "results": results}, f,
+                      indent=1)
+        print("Baseline recorded in", args.baseline)
+
+    if args.check:
+        with open(args.baseline) as f:
+            regressions = check_against_baseline(results, json.load(f), tolerance=args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        sys.exit(1 if regressions else 0)
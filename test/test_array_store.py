@@ -0,0 +1,54 @@
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.array_store import ArrayPropertyStore, gather, scatter
+
+
+def test_array_store_matches_dict_properties():
+    g = MTG()
+    root = g.add_component(g.root, label='Segment', length=1e-3, type="Base_of_the_root_system")
+    vid = root
+    for _ in range(100):
+        vid = g.add_child(vid, edgetype='<', label='Segment', length=2e-3, type="Normal_root_after_emergence")
+
+    reference = {name: dict(values) for name, values in g.properties().items()}
+    store = ArrayPropertyStore.attach(g, capacity=4)
+
+    assert {name: dict(values) for name, values in g.properties().items()} == reference
+    assert store.capacity >= len(store.vids)
+
+    # Vertices added after the conversion are stored in the same columns:
+    new_vid = g.add_child(vid, edgetype='<', label='Apex', length=1e-4, type="Normal_root_after_emergence")
+    assert g.node(new_vid).length == 1e-4
+    assert store.column("length")[store.slot_of[new_vid]] == 1e-4
+
+
+def test_reassigned_property_forgets_previous_values():
+    g = MTG()
+    root = g.add_component(g.root, label='Segment', length=1e-3)
+    child = g.add_child(root, edgetype='<', label='Apex', length=2e-3)
+    ArrayPropertyStore.attach(g)
+
+    g.properties()["length"] = {child: 5e-3}
+    assert dict(g.properties()["length"]) == {child: 5e-3}
+    assert root not in g.property("length")
+
+
+def test_gather_does_not_allocate_slots():
+    store = ArrayPropertyStore(capacity=2)
+    store.from_dict("order", {1: 1, 2: 2})
+    store.from_dict("type", {1: "Dead"})
+
+    assert store.gather("order", [2, 1, 3]).tolist() == [2, 1, 0]
+    assert np.isnan(store.gather("order", [3], default=np.nan)).all()
+    assert store.gather("type", [1, 2], default=None).tolist() == ["Dead", None]
+    assert gather({1: 1.5}, [1, 2]).tolist() == [1.5, 0.]
+    assert 3 not in store.slot_of
+
+
+def test_scatter_promotes_columns_of_integer_defaults():
+    store = ArrayPropertyStore(capacity=2)
+    surface = store.from_dict("root_exchange_surface", {1: 0, 2: 0})
+
+    scatter(surface, [2, 1, 3], np.array([0.5, 1.5, 2.5]))
+    assert dict(surface) == {1: 1.5, 2: 0.5, 3: 2.5}
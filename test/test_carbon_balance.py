@@ -0,0 +1,34 @@
+import pytest
+
+from rhizodep.rhizodep import Model
+
+
+def total_sucrose(carbon):
+    return sum(carbon.C_sucrose_root[vid] * (carbon.struct_mass[vid] + carbon.living_root_hairs_struct_mass[vid])
+               - carbon.deficit_sucrose_root[vid]
+               for vid in carbon.g.vertices(scale=1) if carbon.length[vid] > 0.)
+
+
+def test_sucrose_is_conserved_when_dead_elements_are_frozen():
+    model = Model(time_step=3600, random=False)
+    for step in range(3):
+        model.run()
+    carbon, growth, g = model.root_carbon, model.root_growth, model.g
+
+    vid = next(vid for vid in g.vertices(scale=1)
+               if vid != 1 and carbon.length[vid] > 0. and carbon.type[vid] not in ("Dead", "Just_dead"))
+    g.property("type")[vid] = "Dead"
+    growth.elements.refresh(g)
+    assert vid in growth.elements.frozen and vid not in carbon.hot_vertices()
+
+    for step in range(2):
+        # As the carbon fluxes are still computed on dead elements, some sucrose is left in the frozen element:
+        carbon.C_sucrose_root[vid] = 1e-3
+        carbon.deficit_sucrose_root[vid] = 1e-12
+        before = total_sucrose(carbon)
+        supply = carbon.sucrose_input_rate[1] * carbon.time_step - carbon.global_sucrose_deficit[1]
+
+        carbon.shoot_sucrose_supply_and_spreading()
+
+        assert carbon.C_sucrose_root[vid] == 0. and carbon.deficit_sucrose_root[vid] == 0.
+        assert total_sucrose(carbon) - carbon.global_sucrose_deficit[1] == pytest.approx(before + supply, rel=1e-9)
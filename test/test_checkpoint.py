@@ -0,0 +1,19 @@
+from rhizodep.rhizodep import Model
+
+
+def test_checkpoint_restart(tmp_path):
+    rhizodep = Model(time_step=3600, random=False)
+    for step in range(5):
+        rhizodep.run()
+    rhizodep.save_checkpoint(tmp_path / "checkpoint.npz", compress=True)
+
+    restarted = Model(time_step=3600, random=False)
+    restarted.load_checkpoint(tmp_path / "checkpoint.npz")
+    assert sorted(restarted.g.vertices(scale=1)) == sorted(rhizodep.g.vertices(scale=1))
+    for name, values in rhizodep.g.properties().items():
+        assert dict(restarted.g.properties()[name]) == dict(values), name
+
+    for step in range(3):
+        rhizodep.run()
+        restarted.run()
+    assert dict(restarted.g.property("struct_mass")) == dict(rhizodep.g.property("struct_mass"))
@@ -0,0 +1,17 @@
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.depth_profile import depth_profile
+
+
+def test_depth_profile_splits_segments_between_layers():
+    g = MTG()
+    # A vertical segment from 0.05 m to 0.25 m deep, and a horizontal one at 0.15 m:
+    base = g.add_component(g.root, x1=0., y1=0., z1=-0.05, x2=0., y2=0., z2=-0.25, length=0.2, struct_mass=2., type='Normal')
+    g.add_child(base, edge_type='+', x1=0., y1=0., z1=-0.15, x2=0.1, y2=0., z2=-0.15, length=0.1, struct_mass=1., type='Dead')
+
+    profile = depth_profile(g, z_min=0., z_max=0.3, z_interval=0.1)
+
+    assert np.allclose(profile["length"], [0.05, 0.2, 0.05])
+    assert np.allclose(profile["struct_mass"], [0.5, 2., 0.5])
+    assert np.allclose(profile["root_necromass"], [0., 1., 0.])
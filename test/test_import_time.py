@@ -0,0 +1,59 @@
+"""
+Guard of the cold-start cost of the simulation core.
+
+Run as a script to print the slowest imports of `from rhizodep.rhizodep import Model`:
+    python test/test_import_time.py [--statement "import rhizodep.tools"] [--top 20]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+# Modules that the simulation core must not load, as they are only needed for display or by legacy scripts:
+HEAVY_MODULES = ("openalea.plantgl", "openalea.mtg.turtle", "matplotlib", "rhizodep.tools",
+                 "rhizodep.unused_but_ressource")
+CORE_IMPORT = "from rhizodep.rhizodep import Model"
+# Maximal time (s) spent in the execution of rhizodep modules themselves, dependencies excluded:
+RHIZODEP_IMPORT_BUDGET = float(os.environ.get("RHIZODEP_IMPORT_BUDGET", 1.))
+
+
+def import_times(statement=CORE_IMPORT):
+    """
+    This function executes a statement in a new interpreter with -X importtime.
+    :return: a dictionary giving, for each imported module, its own and cumulative import times (s)
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True,
+                             check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own) * 1e-6, int(cumulative) * 1e-6)
+    return times
+
+
+def test_core_import_is_headless():
+    times = import_times()
+    loaded = sorted(name for name in times if name.startswith(HEAVY_MODULES))
+    assert not loaded, "The simulation core imports " + ", ".join(loaded)
+
+
+def test_core_import_time():
+    times = import_times()
+    own_time = sum(own for name, (own, _) in times.items() if name.startswith("rhizodep"))
+    assert own_time < RHIZODEP_IMPORT_BUDGET, "rhizodep modules take %.3f s to import" % own_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--statement", default=CORE_IMPORT)
+    parser.add_argument("--top", type=int, default=20, help="number of modules listed")
+    args = parser.parse_args()
+
+    times = import_times(args.statement)
+    print("%-60s %10s %12s" % ("module", "own (ms)", "cumul. (ms)"))
+    for name, (own, cumulative) in sorted(times.items(), key=lambda item: -item[1][1])[:args.top]:
+        print("%-60s %10.1f %12.1f" % (name, 1e3 * own, 1e3 * cumulative))
+    print("Total: %.3f s" % max(cumulative for _, cumulative in times.values()))
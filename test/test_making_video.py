@@ -0,0 +1,20 @@
+import numpy as np
+
+from rhizodep.raster import write_png
+from rhizodep.unused_but_ressource.making_video import _frames_tasks, transforming_frames
+
+
+def test_transformed_frames_are_skipped_when_resuming(tmp_path):
+    (tmp_path / "root_images").mkdir()
+    for step in range(2):
+        write_png(tmp_path / "root_images" / f"root{step:05d}.png", np.full((10, 20, 3), 255 * step, dtype=np.uint8))
+
+    def tasks():
+        return _frames_tasks(str(tmp_path), "root_images", "root_images_resized", colorbar_path=None,
+                             colorbar_hash=None, colorbar_position=1, resizing=False, dividing_size_by=1.,
+                             time_printing=False, time_position=1, time_step_in_days=1., sampling_frequency=1)
+
+    assert transforming_frames(tasks(), max_workers=1) == 2
+    assert sorted(path.name for path in (tmp_path / "root_images_resized").glob("*.png")) == ["root00000.png",
+                                                                                          "root00001.png"]
+    assert transforming_frames(tasks(), max_workers=1) == 0
@@ -0,0 +1,70 @@
+from openalea.mtg import MTG
+
+from rhizodep.mtg_series import MTGSeriesWriter, MTGSeries, keyframe_only_properties
+
+
+def test_mtg_series_reconstructs_every_step(tmp_path):
+    g = MTG()
+    vid = g.add_component(g.root, label='Apex', length=1e-3, C_sucrose_root=1.)
+    writer = MTGSeriesWriter(tmp_path, keyframe_period=4)
+    recorded = []
+    for step in range(10):
+        g.property('label')[vid] = 'Segment'
+        vid = g.add_child(vid, edge_type='<', label='Apex', length=1e-3, C_sucrose_root=1.)
+        g.property('C_sucrose_root')[vid] = step
+        writer.record(g)
+        recorded.append({name: dict(values) for name, values in g.properties().items()})
+    writer.close()
+
+    series = MTGSeries(tmp_path)
+    assert series.steps == list(range(10))
+    # Random access, backwards and forwards:
+    for step in (9, 2, 5, 6, 0):
+        h = series[step]
+        assert len(h.vertices(scale=1)) == step + 2
+        for name, values in recorded[step].items():
+            assert dict(h.property(name)) == values
+
+
+def test_values_modified_in_place_are_recorded(tmp_path):
+    g = MTG()
+    vid = g.add_component(g.root, label='Apex', history=[0.])
+    writer = MTGSeriesWriter(tmp_path, keyframe_period=10)
+    writer.record(g)
+    g.property('history')[vid].append(1.)
+    writer.record(g)
+    writer.close()
+
+    assert MTGSeries(tmp_path)[1].property('history')[vid] == [0., 1.]
+
+
+def test_deltas_of_a_model_run_are_an_order_of_magnitude_smaller_than_keyframes(tmp_path):
+    from rhizodep.rhizodep import Model
+
+    model = Model(time_step=3600, random=False)
+    series = MTGSeriesWriter(tmp_path / "series", keyframe_period=24, keyframe_only=keyframe_only_properties(model))
+    keyframes = MTGSeriesWriter(tmp_path / "keyframes", keyframe_period=1)
+    for step in range(48):
+        model.run()
+        series.record(model.g)
+        keyframes.record(model.g)
+
+    def size(directory):
+        return sum(path.stat().st_size for path in directory.glob("frame_*.npz"))
+
+    assert size(tmp_path / "series") < 0.1 * size(tmp_path / "keyframes")
+
+
+def test_keyframe_only_properties_keep_keyframe_values(tmp_path):
+    g = MTG()
+    vid = g.add_component(g.root, label='Apex', length=1e-3, C_hexose_root=1.)
+    writer = MTGSeriesWriter(tmp_path, keyframe_period=3, keyframe_only=["C_hexose_root"])
+    for step in range(4):
+        g.property('length')[vid] = step
+        g.property('C_hexose_root')[vid] = step
+        writer.record(g)
+    writer.close()
+
+    series = MTGSeries(tmp_path)
+    assert [series[step].property('length')[vid] for step in range(4)] == [0, 1, 2, 3]
+    assert [series[step].property('C_hexose_root')[vid] for step in range(4)] == [0, 0, 0, 3]
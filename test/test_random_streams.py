@@ -0,0 +1,18 @@
+import numpy as np
+
+from rhizodep.random_streams import RandomStreams, philox4x32
+
+
+def test_philox_known_answer():
+    # Known answer of the Random123 reference implementation for a nil counter and key:
+    assert [int(word) for word in philox4x32([0, 0, 0, 0], [0, 0])] == [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8]
+
+
+def test_draws_do_not_depend_on_order():
+    streams = RandomStreams(seed=8)
+    vids = np.arange(100)
+    at_once = streams.normal(vids, "segmentation", 0., 5., draw=1)
+    one_by_one = [streams.normal(vid, "segmentation", 0., 5., draw=1) for vid in reversed(vids.tolist())]
+    assert np.allclose(at_once, one_by_one[::-1])
+    assert streams.uniform(3, "segmentation") != streams.uniform(3, "primordium_formation")
+    assert streams.uniform(3, "segmentation") != RandomStreams(seed=9).uniform(3, "segmentation")
@@ -0,0 +1,19 @@
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.raster import render_mtg, write_png
+
+
+def test_render_mtg_without_display(tmp_path):
+    g = MTG()
+    vid = g.add_component(g.root, x1=0., y1=0., z1=0., x2=0., y2=0., z2=-0.01, radius=5e-4, type='Normal',
+                          hexose_exudation=1e-9, root_hair_length=0.)
+    g.add_child(vid, edge_type='<', x1=0., y1=0., z1=-0.01, x2=0., y2=0.005, z2=-0.02, radius=5e-4, type='Dead',
+                hexose_exudation=1e-9, root_hair_length=1e-3, living_root_hairs_number=0., total_root_hairs_number=1.)
+
+    image = render_mtg(g, width=200, height=100)
+
+    assert image.shape == (100, 200, 3)
+    assert (image != 255).any(axis=2).sum() > 100
+    write_png(tmp_path / "root.png", image)
+    assert (tmp_path / "root.png").read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
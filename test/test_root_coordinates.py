@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from openalea.mtg import MTG
+
+from rhizodep.root_coordinates import RootCoordinates
+
+
+def branched_mtg():
+    g = MTG()
+    base = g.add_component(g.root, label='Segment', length=1e-2, angle_down=0., angle_roll=0., original_radius=1e-3,
+                           type="Base_of_the_root_system")
+    segment = g.add_child(base, edge_type='<', label='Segment', length=2e-2, angle_down=0., angle_roll=90.,
+                          original_radius=1e-3, type="Normal_root_after_emergence")
+    lateral = g.add_child(segment, edge_type='+', label='Apex', length=1e-2, angle_down=90., angle_roll=0.,
+                          original_radius=5e-4, type="Normal_root_after_emergence")
+    nodule = g.add_child(segment, edge_type='+', label='Apex', length=5e-3, angle_down=90., angle_roll=0.,
+                         original_radius=5e-4, type="Root_nodule")
+    return g, base, segment, lateral, nodule
+
+
+def coordinates(g, vid):
+    return [g.property(name)[vid] for name in ("x1", "y1", "z1", "x2", "y2", "z2")]
+
+
+def test_coordinates_of_a_branched_root_system():
+    g, base, segment, lateral, nodule = branched_mtg()
+    RootCoordinates(g, gravitropism_coefficient=0.06).update()
+
+    # The main axis goes straight down, as its heading is parallel to the direction of gravitropism:
+    assert coordinates(g, base) == pytest.approx([0., 0., 0., 0., 0., -1e-2])
+    assert coordinates(g, segment) == pytest.approx([0., 0., -1e-2, 0., 0., -3e-2])
+
+    # The lateral root starts at the end of its bearing segment, whose roll of 90° turned the left vector of the
+    # turtle to -x: going down by 90° then heads towards -y. Gravitropism bends this heading downwards by an angle equal
+    # to the elasticity, i.e. 0.06 times the ratio between the original radius of the lateral and that of the base:
+    alpha = 0.06 * 0.5
+    expected_end = np.array([0., 0., -3e-2]) + 1e-2 * np.array([0., -np.cos(alpha), -np.sin(alpha)])
+    assert coordinates(g, lateral) == pytest.approx([0., 0., -3e-2] + expected_end.tolist())
+
+    # Nodules have no length:
+    assert coordinates(g, nodule) == pytest.approx([0., 0., -3e-2, 0., 0., -3e-2])
+
+
+def test_update_only_recomputes_changed_subtrees():
+    g, base, segment, lateral, nodule = branched_mtg()
+    turtle = RootCoordinates(g)
+    turtle.update()
+
+    assert turtle.update().tolist() == []
+    g.property("length")[segment] = 3e-2
+    assert sorted(turtle.update().tolist()) == sorted([segment, lateral, nodule])
+    assert coordinates(g, lateral)[:3] == pytest.approx([0., 0., -4e-2])
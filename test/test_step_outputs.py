@@ -0,0 +1,24 @@
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.step_outputs import StepOutputWriter, StepOutputReader
+
+
+def test_step_outputs_can_be_read_while_writing(tmp_path):
+    g = MTG()
+    vid = g.add_component(g.root, label='Segment', length=1e-3)
+    writer = StepOutputWriter(tmp_path, properties=["length"], totals=["length"], chunk_steps=3)
+    for step in range(10):
+        vid = g.add_child(vid, edge_type='<', label='Segment', length=1e-3)
+        writer.record(g)
+        if step == 5:
+            writer.flush()
+    writer.close()
+
+    reader = StepOutputReader(tmp_path)
+    assert reader.steps == list(range(10))
+    vids, lengths = reader.vertex_property("length", 4)
+    assert len(vids) == 6
+    assert np.allclose(lengths, 1e-3)
+    steps, totals = reader.total("length")
+    assert np.allclose(totals, 1e-3 * (steps + 2))
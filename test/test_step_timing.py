@@ -0,0 +1,22 @@
+import json
+
+from rhizodep.rhizodep import Model
+
+
+def test_step_timing(tmp_path):
+    rhizodep = Model(time_step=3600, random=False)
+    timer = rhizodep.enable_timing(capacity=1000)
+    for step in range(3):
+        rhizodep.run()
+    rhizodep.disable_timing()
+
+    summary = timer.summary()
+    assert summary["run"]["records"] == 3
+    for phase in ("soil", "growth", "anatomy", "carbon"):
+        assert summary[phase]["kind"] == "phase"
+    assert any(record["kind"] == "stepinit" for record in summary.values())
+    assert len(timer.durations("growth")) == 3
+
+    timer.to_chrome_trace(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json") as f:
+        assert json.load(f)["traceEvents"]
@@ -0,0 +1,25 @@
+import numpy as np
+
+from rhizodep.rhizodep import Model
+from rhizodep.root_topology import RootTopology
+from rhizodep.synthetic_mtg import synthetic_mtg
+
+
+def test_synthetic_mtg_is_reproducible_and_consistent():
+    g = synthetic_mtg(2000, seed=3)
+    assert len(g.vertices(scale=1)) == 2000
+    assert g.properties()["radius"] == synthetic_mtg(2000, seed=3).properties()["radius"]
+    assert max(g.property("root_order").values()) == 3
+
+    topology = RootTopology(g)
+    length = topology.gather(g.property("length"))
+    assert np.allclose(topology.gather(g.property("distance_from_tip")), topology.suffix_sum_along_axes(length))
+    radius = topology.gather(g.property("radius"))
+    assert np.allclose(topology.gather(g.property("struct_mass")),
+                       np.pi * radius ** 2 * length * topology.gather(g.property("root_tissue_density")))
+
+
+def test_model_runs_on_synthetic_mtg():
+    rhizodep = Model(time_step=3600, g=synthetic_mtg(500, seed=1), random=False)
+    rhizodep.run()
+    assert len(rhizodep.g.vertices(scale=1)) >= 500
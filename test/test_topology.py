@@ -0,0 +1,78 @@
+import pytest
+from openalea.mtg import MTG
+from openalea.mtg.traversal import post_order
+
+from rhizodep.root_topology import RootTopology, ApexRegistry, ElementPartition
+
+
+def test_topology_matches_mtg_traversal():
+    g = MTG()
+    base = g.add_component(g.root, label='Segment', length=1e-3)
+    vid = base
+    for i in range(20):
+        vid = g.add_child(vid, edge_type='<', label='Segment', length=1e-3)
+        if i % 5 == 0:
+            lateral = g.add_child(vid, edge_type='+', label='Segment', length=1e-3)
+            g.add_child(lateral, edge_type='<', label='Apex', length=1e-4)
+    g.add_child(vid, edge_type='<', label='Apex', length=1e-4)
+
+    topology = RootTopology(g)
+
+    assert topology.post_order == list(post_order(g, base))
+    for row, vid in enumerate(topology.post_order):
+        parent = g.parent(vid)
+        assert topology.parent[row] == (-1 if parent is None else topology.row_of[parent])
+        assert sorted(topology.vids[topology.children(row)]) == sorted(g.children(vid))
+        assert topology.axis_tip_vid(vid) == g.Axis(vid)[-1]
+
+
+def test_suffix_sum_along_axes_gives_distance_from_tip():
+    g = MTG()
+    base = g.add_component(g.root, label='Segment', length=1e-3)
+    vid = base
+    for i in range(10):
+        vid = g.add_child(vid, edge_type='<', label='Segment', length=1e-3 * (i + 1))
+        if i % 3 == 0:
+            g.add_child(vid, edge_type='+', label='Apex', length=1e-4)
+
+    topology = RootTopology(g)
+    distance_from_tip = topology.suffix_sum_along_axes(topology.gather(g.property('length')))
+
+    expected = {}
+    for vid in post_order(g, base):
+        successor = g.Successor(vid)
+        expected[vid] = g.node(vid).length + (expected[successor] if successor is not None else 0.)
+    assert distance_from_tip.tolist() == pytest.approx([expected[vid] for vid in topology.post_order])
+
+
+def test_apex_registry_partitions_apices_by_state():
+    g = MTG()
+    base = g.add_component(g.root, label='Segment', type="Base_of_the_root_system")
+    main_apex = g.add_child(base, edge_type='<', label='Apex', type="Normal_root_after_emergence")
+    primordium = g.add_child(base, edge_type='+', label='Apex', type="Normal_root_before_emergence")
+
+    apices = ApexRegistry(g)
+    assert apices.vids() == [main_apex, primordium]
+    assert apices.vids("primordium") == [primordium]
+
+    apices.update(primordium, "Just_dead")
+    apices.remove(main_apex)
+    assert apices.vids("emerged", "primordium") == []
+    assert apices.vids("dead") == [primordium]
+
+
+def test_element_partition_freezes_dead_elements():
+    g = MTG()
+    base = g.add_component(g.root, label='Segment', type="Base_of_the_root_system", length=1e-3)
+    dead = g.add_child(base, edge_type='+', label='Apex', type="Just_dead", length=1e-4)
+    apex = g.add_child(base, edge_type='<', label='Apex', type="Normal_root_after_emergence", length=1e-4)
+
+    elements = ElementPartition(g)
+    assert elements.hot() == [base, dead, apex]
+
+    g.node(dead).type = "Dead"
+    assert elements.refresh(g) == [dead]
+    assert elements.hot() == [base, apex]
+    assert elements.frozen_vids().tolist() == [dead]
+    assert elements.refresh(g) == []
+    assert elements.frozen_vids().tolist() == [dead]
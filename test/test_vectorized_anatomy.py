@@ -0,0 +1,34 @@
+import numpy as np
+from openalea.mtg import MTG
+
+from rhizodep.root_anatomy import RootAnatomy
+
+
+def test_surfaces_and_volumes_match_scalar_functions():
+    g = MTG()
+    g.add_component(g.root, label='Apex', length=1e-3, radius=1e-4)
+    anatomy = RootAnatomy(g, time_step_in_seconds=3600)
+
+    # Zero length, conductance sums well above 1, below 1 and equal to 0, with and without root hairs:
+    inputs = dict(radius=np.array([1e-4, 3e-4, 2e-4, 5e-5, 1e-4]),
+                  length=np.array([0., 1e-2, 3e-3, 1e-3, 2e-3]),
+                  exodermis_conductance_factor=np.array([1., 1., 0., 0., 0.01]),
+                  endodermis_conductance_factor=np.array([1., 0.5, 0.05, 0., 0.02]),
+                  xylem_differentiation_factor=np.array([0., 1., 0.5, 0., 1.]),
+                  root_hair_length=np.array([1e-3, 0., 5e-4, 0., 1e-3]),
+                  total_root_hairs_number=np.array([10., 0., 30., 0., 100.]))
+    results = anatomy.surfaces_and_volumes(**inputs)
+
+    scalar_functions = {"root_exchange_surface": anatomy._root_exchange_surface,
+                        "cortex_exchange_surface": anatomy._cortex_exchange_surface,
+                        "apoplasmic_exchange_surface": anatomy._apoplasmic_exchange_surface,
+                        "xylem_exchange_surface": anatomy._xylem_exchange_surface,
+                        "phloem_exchange_surface": anatomy._phloem_exchange_surface,
+                        "symplasmic_volume": anatomy._symplasmic_volume,
+                        "xylem_volume": anatomy._xylem_volume}
+    assert results.keys() == scalar_functions.keys()
+    for name, function in scalar_functions.items():
+        arguments = function.__code__.co_varnames[1:function.__code__.co_argcount]
+        expected = [function(**{argument: inputs[argument][i].item() for argument in arguments})
+                    for i in range(len(inputs["length"]))]
+        assert np.allclose(results[name], expected, rtol=1e-12, atol=0.), name